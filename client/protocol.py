@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+
+import json
+import socket
+import struct
+from enum import IntEnum, IntFlag
+from typing import Any, BinaryIO, NamedTuple
+from exception import ProtocolError
+
+
+VERSION = 2
+HEADER = struct.Struct("<BBHIQ")
+
+
+class FrameType(IntEnum):
+    COMMAND = 1
+    OUTPUT = 2
+    TEXT = 3
+    JSON = 4
+    DATA = 5
+    APPROVED = 6
+    DISAPPROVED = 7
+    WINDOW = 8
+    RESET = 9
+    PING = 10
+    PONG = 11
+    HELLO = 12
+    RETRY = 13
+
+
+class Flag(IntFlag):
+    NONE = 0
+    END = 1
+    STDERR = 2
+
+
+class Frame(NamedTuple):
+    type: FrameType
+    flags: Flag
+    request_id: int
+    payload: bytes
+
+
+def recv_exact_into(sock: socket.socket, view: memoryview) -> None:
+    received = 0
+    while received < len(view):
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise ConnectionResetError("The connection was closed in the middle of a frame.")
+        received += n
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray(size)
+    recv_exact_into(sock, memoryview(data))
+    return bytes(data)
+
+
+def pack_header(frame_type: FrameType, length: int, request_id: int = 0, flags: Flag = Flag.NONE) -> bytes:
+    return HEADER.pack(VERSION, frame_type, flags, request_id, length)
+
+
+def pack_frame(frame_type: FrameType, payload: bytes = b"", request_id: int = 0, flags: Flag = Flag.NONE) -> bytes:
+    return pack_header(frame_type, len(payload), request_id, flags) + payload
+
+
+def unpack_header(data: bytes, offset: int = 0) -> tuple[FrameType, Flag, int, int]:
+    version, frame_type, flags, request_id, length = HEADER.unpack_from(data, offset)
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version --> {version}, expected {VERSION}.")
+    try:
+        frame_type = FrameType(frame_type)
+    except ValueError:
+        raise ProtocolError(f"Unknown frame type --> {frame_type}.") from None
+    return frame_type, Flag(flags), request_id, length
+
+
+def read_header(sock: socket.socket) -> tuple[FrameType, Flag, int, int]:
+    return unpack_header(recv_exact(sock, HEADER.size))
+
+
+def recv_frame(sock: socket.socket) -> Frame:
+    frame_type, flags, request_id, length = read_header(sock)
+    payload = recv_exact(sock, length)
+    return Frame(frame_type, flags, request_id, payload)
+
+
+class Channel:
+    def __init__(self, sock: socket.socket, request_id: int = 0) -> None:
+        self._sock = sock
+        self._request_id = request_id
+        self._data_left = 0
+
+    @property
+    def sock(self) -> socket.socket:
+        return self._sock
+
+    @property
+    def request_id(self) -> int:
+        return self._request_id
+
+    def pack(self, frame_type: FrameType, payload: bytes = b"", flags: Flag = Flag.NONE) -> bytes:
+        return pack_frame(frame_type, payload, self._request_id, flags)
+
+    def sendall(self, packet: bytes) -> None:
+        self._sock.sendall(packet)
+
+    def send(self, frame_type: FrameType, payload: bytes = b"", flags: Flag = Flag.NONE) -> None:
+        if len(payload) < 65536:
+            self._sock.sendall(self.pack(frame_type, bytes(payload), flags))
+        else:
+            self._sock.sendall(pack_header(frame_type, len(payload), self._request_id, flags))
+            self._sock.sendall(payload)
+
+    def send_text(self, text: str, frame_type: FrameType = FrameType.TEXT) -> None:
+        self.send(frame_type, text.encode("utf-8"))
+
+    def send_json(self, data: Any) -> None:
+        self.send(FrameType.JSON, json.dumps(data).encode("utf-8"))
+
+    def sendfile(self, file: BinaryIO, offset: int, count: int) -> int:
+        self._sock.sendall(pack_header(FrameType.DATA, count, self._request_id))
+        sent = self._sock.sendfile(file, offset, count)
+        if sent < count:
+            raise EOFError("The file was truncated while being sent.")
+        return sent
+
+    def recv(self) -> Frame:
+        return recv_frame(self._sock)
+
+    def expect(self, *frame_types: FrameType) -> Frame:
+        frame = self.recv()
+        if frame.type not in frame_types:
+            expected = ", ".join(frame_type.name for frame_type in frame_types)
+            raise ProtocolError(f"Expected a {expected} frame, but got --> {frame.type.name}.")
+        return frame
+
+    def recv_text(self, *frame_types: FrameType) -> str:
+        frame = self.expect(*(frame_types or (FrameType.TEXT,)))
+        return frame.payload.decode("utf-8")
+
+    def recv_json(self) -> Any:
+        frame = self.expect(FrameType.JSON)
+        return json.loads(frame.payload)
+
+    def recv_data_into(self, view: memoryview) -> int:
+        while not self._data_left:
+            frame_type, _, _, length = read_header(self._sock)
+            if frame_type != FrameType.DATA:
+                raise ProtocolError(f"Expected a DATA frame, but got --> {frame_type.name}.")
+            self._data_left = length
+        size = min(len(view), self._data_left)
+        received = self._sock.recv_into(view[:size])
+        if not received:
+            raise ConnectionResetError("The connection was closed before all the data had been received.")
+        self._data_left -= received
+        return received
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import os
+import secrets
+import threading
+from subprocess import PIPE, Popen
+from typing import Callable
+
+try:
+    import pty
+    import termios
+except ImportError:
+    pty = None
+    termios = None
+
+
+SHELL = "/bin/sh"
+READ_SIZE = 64 * 1024
+
+
+def _quote(command: str) -> str:
+    return "'" + command.replace("'", "'\\''") + "'"
+
+
+class ShellExited(Exception):
+    ...
+
+
+class Shell:
+    def __init__(self, shell: str = SHELL) -> None:
+        if pty is None:
+            raise OSError("A pty shell is not supported on this platform.")
+        self._master, slave = pty.openpty()
+        attributes = termios.tcgetattr(slave)
+        attributes[1] &= ~termios.ONLCR
+        termios.tcsetattr(slave, termios.TCSANOW, attributes)
+        environment = dict(os.environ, TERM=os.environ.get("TERM", "dumb"))
+        try:
+            self._process = Popen([shell], stdin=PIPE, stdout=slave, stderr=slave, env=environment, start_new_session=True)
+        except BaseException:
+            os.close(self._master)
+            raise
+        finally:
+            os.close(slave)
+        self._marker = f"__rs_{secrets.token_hex(8)}".encode("utf-8")
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def _read(self) -> bytes:
+        try:
+            data = os.read(self._master, READ_SIZE)
+        except OSError:
+            data = b""
+        if not data:
+            raise ShellExited(f"The shell has exited with code {self._process.wait()}.")
+        return data
+
+    def _parse_status(self, status: bytes) -> int:
+        exit_code, _, cwd = status.decode("utf-8", "replace").partition(" ")
+        if os.path.isdir(cwd):
+            os.chdir(cwd)
+        return int(exit_code)
+
+    def run(self, command: str, forward: Callable[[bytes], None]) -> int:
+        start = self._marker + b" "
+        end = b" " + self._marker + b"\n"
+        line = f"command eval {_quote(command)} </dev/null; printf '%s %s %s %s\\n' {self._marker.decode()} \"$?\" \"$PWD\" {self._marker.decode()}\n"
+        with self._lock:
+            try:
+                self._process.stdin.write(line.encode("utf-8"))
+                self._process.stdin.flush()
+            except OSError:
+                raise ShellExited(f"The shell has exited with code {self._process.wait()}.") from None
+            pending = b""
+            while True:
+                pending += self._read()
+                index = pending.find(start)
+                if index < 0:
+                    keep = len(start) - 1
+                    if len(pending) > keep:
+                        forward(pending[:-keep])
+                        pending = pending[-keep:]
+                    continue
+                if index:
+                    forward(pending[:index])
+                    pending = pending[index:]
+                while (stop := pending.find(end, len(start))) < 0:
+                    pending += self._read()
+                return self._parse_status(pending[len(start): stop])
+
+    def close(self) -> None:
+        if self.alive:
+            self._process.kill()
+        self._process.wait()
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        os.close(self._master)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import socket
+import struct
+import threading
+import time
+import weakref
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = termios = None
+
+
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+MIN_CHUNCK_SIZE = 16 * 1024
+MAX_CHUNCK_SIZE = 4 * 1024 * 1024
+INITIAL_CHUNCK_SIZE = 256 * 1024
+MEASURE_WINDOW = 0.25
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 5
+SEND_QUEUE = getattr(termios, "TIOCOUTQ", None)
+QUEUE_SIZE = struct.Struct("i")
+
+
+def get_socket_buffers(sock: socket.socket) -> tuple[int, int]:
+    send_buffer = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+    receive_buffer = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    return send_buffer, receive_buffer
+
+
+def unacknowledged_bytes(sock: socket.socket) -> (int | None):
+    if SEND_QUEUE is None:
+        return None
+    try:
+        return QUEUE_SIZE.unpack(fcntl.ioctl(sock.fileno(), SEND_QUEUE, bytes(QUEUE_SIZE.size)))[0]
+    except (OSError, ValueError):
+        return None
+
+
+def enable_keepalive(sock: socket.socket, idle: int = KEEPALIVE_IDLE, interval: int = KEEPALIVE_INTERVAL,
+                     count: int = KEEPALIVE_COUNT) -> None:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "SIO_KEEPALIVE_VALS"):
+        sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, interval * 1000))
+        return
+    options = (
+        (getattr(socket, "TCP_KEEPIDLE", getattr(socket, "TCP_KEEPALIVE", None)), idle),
+        (getattr(socket, "TCP_KEEPINTVL", None), interval),
+        (getattr(socket, "TCP_KEEPCNT", None), count),
+        (getattr(socket, "TCP_USER_TIMEOUT", None), (idle + interval * count) * 1000),
+    )
+    for option, value in options:
+        if option is None:
+            continue
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, option, value)
+        except OSError:
+            pass
+
+
+def tune_socket(sock: socket.socket, buffer_size: int = SOCKET_BUFFER_SIZE) -> tuple[int, int]:
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, buffer_size)
+        except OSError:
+            pass
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        enable_keepalive(sock)
+    return get_socket_buffers(sock)
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+class TransferTuner:
+    _chunck_sizes: weakref.WeakKeyDictionary[socket.socket, int] = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock = sock
+        with self._lock:
+            self._chunck_size = self._chunck_sizes.get(sock, INITIAL_CHUNCK_SIZE)
+        self._direction = 1
+        self._last_throughput = 0.0
+        self.start()
+
+    @property
+    def chunck_size(self) -> int:
+        return self._chunck_size
+
+    @property
+    def transferred(self) -> int:
+        return self._transferred
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def start(self) -> None:
+        self._started = time.monotonic()
+        self._transferred = 0
+        self._window_started = self._started
+        self._window_bytes = 0
+
+    def _adjust(self, throughput: float) -> None:
+        if throughput < self._last_throughput * 0.95:
+            self._direction = -self._direction
+        self._last_throughput = throughput
+        if self._direction > 0:
+            chunck_size = min(self._chunck_size * 2, MAX_CHUNCK_SIZE)
+        else:
+            chunck_size = max(self._chunck_size // 2, MIN_CHUNCK_SIZE)
+        if chunck_size == self._chunck_size:
+            self._direction = -self._direction
+        self._chunck_size = chunck_size
+        with self._lock:
+            self._chunck_sizes[self._sock] = chunck_size
+
+    def record(self, transferred: int) -> None:
+        self._transferred += transferred
+        self._window_bytes += transferred
+        now = time.monotonic()
+        elapsed = now - self._window_started
+        if elapsed >= MEASURE_WINDOW:
+            self._adjust(self._window_bytes / elapsed)
+            self._window_started = now
+            self._window_bytes = 0
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        throughput = self._transferred / elapsed
+        try:
+            send_buffer, receive_buffer = get_socket_buffers(self._sock)
+            buffers = f"SO_SNDBUF {format_size(send_buffer)}, SO_RCVBUF {format_size(receive_buffer)}"
+        except OSError:
+            buffers = "socket buffers unavailable"
+        return (f"Transferred {format_size(self._transferred)} in {elapsed:.2f}s "
+                f"({format_size(throughput)}/s), chunck size {format_size(self._chunck_size)}, {buffers}.")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import hashlib
+import os
+import struct
+import threading
+from collections import Counter, OrderedDict
+from typing import Iterable
+
+
+CHUNCK_STORE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".chunck_store")
+CHUNCK_STORE_SIZE = 2 * 1024 * 1024 * 1024
+MAX_CHUNCK_SIZE = 256 * 1024
+MANIFEST_HEADER = struct.Struct("<I")
+MANIFEST_ENTRY = struct.Struct("<16sI")
+
+
+def chunck_hash(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class ChunckStore:
+    def __init__(self, directory: str = CHUNCK_STORE_DIRECTORY, max_size: int = CHUNCK_STORE_SIZE) -> None:
+        self._directory = os.path.abspath(directory)
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._chuncks: (OrderedDict[bytes, int] | None) = None
+        self._pins: Counter[bytes] = Counter()
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _path(self, digest: bytes) -> str:
+        name = digest.hex()
+        return os.path.join(self._directory, name[:2], name)
+
+    def _load(self) -> OrderedDict[bytes, int]:
+        if self._chuncks is not None:
+            return self._chuncks
+        found = []
+        if os.path.isdir(self._directory):
+            for folder in os.scandir(self._directory):
+                if not folder.is_dir():
+                    continue
+                for item in os.scandir(folder.path):
+                    try:
+                        digest = bytes.fromhex(item.name)
+                        info = item.stat()
+                    except (ValueError, OSError):
+                        continue
+                    found.append((info.st_mtime_ns, digest, info.st_size))
+        found.sort()
+        self._chuncks = OrderedDict((digest, size) for _, digest, size in found)
+        self._size = sum(self._chuncks.values())
+        return self._chuncks
+
+    def pin(self, digests: Iterable[bytes]) -> set[bytes]:
+        with self._lock:
+            chuncks = self._load()
+            digests = set(digests)
+            self._pins.update(digests)
+            return {digest for digest in digests if digest in chuncks}
+
+    def unpin(self, digests: Iterable[bytes]) -> None:
+        with self._lock:
+            self._pins.subtract(set(digests))
+            self._pins += Counter()
+            self._evict()
+
+    def get(self, digest: bytes) -> bytes:
+        path = self._path(digest)
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._lock:
+            if digest in self._load():
+                self._chuncks.move_to_end(digest)
+        os.utime(path)
+        return data
+
+    def put(self, digest: bytes, data: bytes) -> None:
+        path = self._path(digest)
+        with self._lock:
+            if digest in self._load():
+                self._chuncks.move_to_end(digest)
+                return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        with self._lock:
+            if digest not in self._chuncks:
+                self._chuncks[digest] = len(data)
+                self._size += len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        if self._chuncks is None:
+            return
+        for digest in list(self._chuncks):
+            if self._size <= self._max_size:
+                return
+            if self._pins[digest]:
+                continue
+            self._size -= self._chuncks.pop(digest)
+            try:
+                os.remove(self._path(digest))
+            except OSError:
+                pass
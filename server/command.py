@@ -3,10 +3,19 @@
 
 import os
 import socket
+import time
+from concurrent.futures import Future
+from typing import Any
 from listen_server import ListenServer
 from execute import Execute
-from connections import Connections
+from connections import Connections, Session
 from listen_server import ListenServer
+from compression import Compression
+from fanout import PARALLELISM, FanOut
+from integrity import Digest
+from metrics import Histogram, write_prometheus
+from profiler import PROFILE_OPERATIONS, Profiler
+from tuning import format_size
 from exceptions import NotConnectedToTheTarget, NotEnoughArgumentsProvided, IncompatibleExtension
 
 
@@ -14,9 +23,12 @@ class Command:
     _execute = Execute()
     
     def __init__(self, command: str, interaction) -> None:
+        self._background = interaction.target is not None and command.rstrip().endswith("&")
+        if self._background:
+            command = command.rstrip()[:-1]
         self._command = command
         self._split_command = command.split()
-        self._execute = Execute()
+        self._execute = Execute(interaction.server.output_limit, interaction.connections, interaction.server.chunck_store)
         self._interaction = interaction
         self._connections: Connections = interaction.connections
       
@@ -41,6 +53,35 @@ class Command:
             return target
         raise NotConnectedToTheTarget("Not connected to the target pc.")
 
+    def _get_compression(self, args: list) -> tuple[list, (str | None)]:
+        if "-c" not in args:
+            return args, None
+        index = args.index("-c")
+        if index + 1 >= len(args):
+            raise NotEnoughArgumentsProvided("Expected a compression codec after '-c', e.g. '-c zlib:6'.")
+        compression = Compression.parse(args[index + 1])
+        return args[:index] + args[index + 2:], compression.spec
+    
+    def _get_digest(self, args: list) -> tuple[list, (str | None)]:
+        if "--hash" not in args:
+            return args, None
+        index = args.index("--hash")
+        if index + 1 >= len(args):
+            raise NotEnoughArgumentsProvided("Expected a digest algorithm after '--hash', e.g. '--hash sha256'.")
+        digest = Digest(args[index + 1])
+        return args[:index] + args[index + 2:], digest.algorithm
+    
+    def _get_flag(self, args: list, flag: str) -> tuple[list, bool]:
+        if flag not in args:
+            return args, False
+        return [arg for arg in args if arg != flag], True
+    
+    def _get_dedup(self, args: list) -> tuple[list, bool]:
+        args, dedup = self._get_flag(args, "--dedup")
+        if dedup and self._interaction.server.chunck_store is None:
+            raise TypeError("The chunck store is disabled on this server, '--dedup' is not available.")
+        return args, dedup
+    
     def _get_path_and_destination(self, args: list) -> list:
         n = len(args)
         if n < 2:
@@ -51,34 +92,243 @@ class Command:
                     But {n} arguments were given --> {args}.")
         return args
         
+    def _report_background(self, future: Future) -> None:
+        try:
+            future.result()
+        except Exception as ex:
+            print(f"EXCEPTION in background operation '{self._command.strip()}' --> {ex}")
+        else:
+            print(f"Background operation '{self._command.strip()}' finished.")
+    
+    def _submit(self, target: socket.socket, operation, *args: Any, resumable: bool = False) -> Any:
+        future = self._interaction.server.submit(target, operation, *args, resumable=resumable)
+        if self._background:
+            future.add_done_callback(self._report_background)
+            print(f"Running '{self._command.strip()}' in the background.")
+            return None
+        return future.result()
+        
     def quit(self, server: ListenServer) -> None:
         print("Closing server .. .. ..")
-        server.server.close()
+        server.close()
         raise ConnectionAbortedError()
     
+    def _format_session(self, session: Session, now: float) -> str:
+        address = f"{session.ip}:{session.port}"
+        rtt = f"{session.rtt * 1000:.1f} ms" if session.rtt is not None else "-"
+        tags = " ".join(f"@{tag}" for tag in sorted(session.tags))
+        return (f"{session.id:>6}  {address:<21}  {(session.hostname or '-')[:20]:<20}  {(session.platform or '-')[:20]:<20}  "
+                f"{int(now - session.connected_at):>7}s  {rtt:>9}  {format_size(session.bytes_sent):>10}  "
+                f"{format_size(session.bytes_received):>10}  {tags}")
+    
     def connected_targets(self) -> None:
-        connections_list = self._connections.connections_list()
-        print(f"Active connections: {connections_list}")
-    
-    def _connect_by_index(self, index: int) -> None:
-        ip, target = self._connections.get_connection_by_index(index)
-        self._interaction.target = target
-        self._interaction.ip = ip
-        print(f"Connected to {ip}.")
-
-    def _connect_by_ip(self, ip: str) -> None:
-        target = self._connections.get_connection_by_ip(ip)
-        self._interaction.target = target
-        self._interaction.ip = ip 
-        print(f"Connected to {ip}.")
+        args = self._split_command[1:]
+        sessions = self._connections.select(args[0]) if args else self._connections.sessions()
+        now = time.time()
+        lines = [f"{'ID':>6}  {'ADDRESS':<21}  {'HOSTNAME':<20}  {'PLATFORM':<20}  {'UP':>8}  {'RTT':>9}  {'SENT':>10}  {'RECEIVED':>10}  TAGS"]
+        lines.extend(self._format_session(session, now) for session in sessions)
+        print("\n".join(lines))
+        print(f"{len(sessions)} of {len(self._connections)} session(s).")
+    
+    def _get_tag_args(self) -> tuple[str, str]:
+        args = self._get_args()
+        if len(args) != 2:
+            raise NotEnoughArgumentsProvided(f"Expected for two arguments, 'selectors' and 'tag'. But got --> {args}")
+        selectors, tag = args
+        return selectors, tag.removeprefix("@")
+    
+    def tag(self) -> None:
+        selectors, tag = self._get_tag_args()
+        targets = self._connections.select(selectors)
+        for session in targets:
+            self._connections.add_tag(session, tag)
+        print(f"Tagged {len(targets)} host(s) with @{tag}.")
+    
+    def untag(self) -> None:
+        selectors, tag = self._get_tag_args()
+        targets = self._connections.select(selectors)
+        for session in targets:
+            self._connections.remove_tag(session, tag)
+        print(f"Removed @{tag} from {len(targets)} host(s).")
+
+    def _get_record_limit(self, args: list) -> tuple[list, (int | None)]:
+        if "-l" not in args:
+            return args, None
+        index = args.index("-l")
+        if index + 1 >= len(args) or not args[index + 1].isdigit():
+            raise NotEnoughArgumentsProvided("Expected a number of payload bytes to keep per frame after '-l'.")
+        return args[:index] + args[index + 2:], int(args[index + 1])
+
+    def record(self) -> None:
+        args, limit = self._get_record_limit(self._get_args())
+        if len(args) != 2:
+            raise NotEnoughArgumentsProvided(f"Expected 'record <selectors> <directory|off> [-l BYTES]'. But got --> {args}")
+        selectors, directory = args
+        targets = self._connections.select(selectors)
+        server = self._interaction.server
+        for session in targets:
+            if directory == "off":
+                path = server.stop_recording(session)
+                if path is not None:
+                    print(f"Stopped recording {session.label} --> {path}")
+            else:
+                print(f"Recording {session.label} --> {server.start_recording(session, directory, limit)}")
+
+    def _get_export_path(self, args: list) -> tuple[list, (str | None)]:
+        if "-o" not in args:
+            return args, None
+        index = args.index("-o")
+        if index + 1 >= len(args):
+            raise NotEnoughArgumentsProvided("Expected a file path after '-o'.")
+        return args[:index] + args[index + 2:], args[index + 1]
+
+    def _format_quantiles(self, histogram: (Histogram | None), unit: str) -> str:
+        if histogram is None or not histogram.count:
+            return "-"
+        if unit == "ms":
+            values = " / ".join(f"{histogram.quantile(q) * 1000:g}" for q in (0.5, 0.9, 0.99)) + " ms"
+        else:
+            values = " / ".join(f"{format_size(histogram.quantile(q))}/s" for q in (0.5, 0.9, 0.99))
+        return f"p50/p90/p99 <= {values}, mean {self._format_mean(histogram, unit)}"
+
+    def _format_mean(self, histogram: Histogram, unit: str) -> str:
+        mean = histogram.sum / histogram.count
+        return f"{mean * 1000:.2f} ms" if unit == "ms" else f"{format_size(mean)}/s"
+
+    def _format_throughput(self, counters: dict[str, float]) -> str:
+        seconds = counters.get("transfer_seconds", 0)
+        return f"{format_size(counters.get('transfer_bytes', 0) / seconds)}/s" if seconds else "-"
+
+    def _format_totals(self, counters: dict[str, float], histograms: dict[str, Histogram]) -> str:
+        get = counters.get
+        return "\n".join([
+            f"Sockets:    sent {format_size(get('bytes_sent', 0))} in {int(get('send_calls', 0))} call(s), "
+            f"{get('send_blocked_seconds', 0):.3f}s blocked; received {format_size(get('bytes_received', 0))} in {int(get('recv_calls', 0))} call(s).",
+            f"Commands:   {int(get('commands', 0))} answered, {int(get('command_errors', 0))} failed; "
+            f"round trip {self._format_quantiles(histograms.get('command_rtt_seconds'), 'ms')}.",
+            f"Transfers:  {int(get('transfers', 0))} completed, {int(get('transfer_errors', 0))} failed; "
+            f"{format_size(get('transfer_bytes', 0))} in {get('transfer_seconds', 0):.2f}s ({self._format_throughput(counters)}); "
+            f"throughput {self._format_quantiles(histograms.get('transfer_throughput_bytes'), 'B')}.",
+            f"Chuncks:    {int(get('chuncks_sent', 0))} sent, waited {get('send_wait_seconds', 0):.3f}s; "
+            f"{int(get('chuncks_received', 0))} received, waited {get('recv_wait_seconds', 0):.3f}s.",
+            f"Heartbeats: round trip {self._format_quantiles(histograms.get('heartbeat_rtt_seconds'), 'ms')}.",
+        ])
+
+    def _format_session_stats(self, session: Session) -> str:
+        counters = session.counters()
+        histogram = session.metrics.histograms().get("command_rtt_seconds")
+        command_rtt = f"{histogram.sum / histogram.count * 1000:.1f} ms" if histogram is not None and histogram.count else "-"
+        return (f"{session.id:>6}  {session.ip:<15}  {format_size(counters['bytes_sent']):>10}  {format_size(counters['bytes_received']):>10}  "
+                f"{counters['send_calls']:>8}  {counters['recv_calls']:>8}  {counters['send_blocked_seconds']:>8.3f}s  "
+                f"{int(counters.get('commands', 0)):>6}  {command_rtt:>9}  {int(counters.get('transfers', 0)):>6}  {self._format_throughput(counters):>12}")
+
+    def _export_stats(self, path: str, sessions: list[Session], counters: dict[str, float], histograms: dict[str, Histogram]) -> None:
+        series = [({"session": "all"}, counters, histograms)]
+        for session in sessions:
+            labels = {"session": str(session.id), "ip": session.ip, "hostname": session.hostname or ""}
+            series.append((labels, session.counters(), session.metrics.histograms()))
+        write_prometheus(path, series)
+        print(f"Exported the metrics of {len(sessions)} session(s) to {path}")
+
+    def stats(self) -> None:
+        args, path = self._get_export_path(self._split_command[1:])
+        sessions = self._connections.select(args[0]) if args else self._connections.sessions()
+        counters, histograms = self._connections.totals()
+        print(self._format_totals(counters, histograms))
+        if args:
+            lines = [f"{'ID':>6}  {'IP':<15}  {'SENT':>10}  {'RECEIVED':>10}  {'SENDS':>8}  {'RECVS':>8}  {'BLOCKED':>9}  "
+                     f"{'CMDS':>6}  {'CMD RTT':>9}  {'XFERS':>6}  {'THROUGHPUT':>12}"]
+            lines.extend(self._format_session_stats(session) for session in sessions)
+            print("\n".join(lines))
+        if path is not None:
+            self._export_stats(path, sessions, counters, histograms)
+
+    def _print_profile(self, profiler: Profiler, path: (str | None), report: str) -> None:
+        print(f"\n{report}")
+        if path is not None:
+            profiler.dump(path)
+            print(f"The profile has been saved to {path}, open it with 'python -m pstats {path}'.")
+
+    def _profile_client(self, args: list) -> None:
+        target = self._validate_target()
+        command = " ".join(["profile", *args])
+        future = self._interaction.server.submit(target, self._execute.excute_on_target_pc, command)
+        future.add_done_callback(self._report_background)
+        if args[:1] != ["off"]:
+            print("The client will profile its next commands, the report is printed when they are done. 'profile client off' stops it early.")
+
+    def profile(self) -> None:
+        args = self._split_command[1:]
+        if args[:1] == ["client"]:
+            self._profile_client(args[1:])
+            return
+        args, path = self._get_export_path(args)
+        args, memory = self._get_flag(args, "--memory")
+        profiler = self._interaction.server.profiler
+        if args[:1] == ["off"]:
+            if profiler.stop() is None:
+                print("The profiler is not running.")
+            return
+        if args and not args[0].isdigit():
+            raise NotEnoughArgumentsProvided(f"Expected 'profile [N|off] [--memory] [-o FILE]' or 'profile client [N|off] [--memory]'. But got --> {args}")
+        operations = int(args[0]) if args else PROFILE_OPERATIONS
+        profiler.start(operations, memory, lambda report: self._print_profile(profiler, path, report))
+        print(f"Profiling the next {operations} operation(s) on the server{' with tracemalloc' if memory else ''} .. .. ..")
+
+    def _get_fan_out_args(self) -> tuple[str, int, str]:
+        parts = self._command.split(maxsplit=2)
+        if len(parts) < 3:
+            raise NotEnoughArgumentsProvided("Expected 'fan <selectors> [-j N] <command>', e.g. 'fan 0-9,@web -j 16 uptime'.")
+        _, selectors, command = parts
+        parallelism = PARALLELISM
+        if command.split(maxsplit=1)[0] == "-j":
+            options = command.split(maxsplit=2)
+            if len(options) < 3 or not options[1].isdigit():
+                raise NotEnoughArgumentsProvided("Expected a number of parallel hosts and a command after '-j'.")
+            parallelism, command = int(options[1]), options[2]
+        return selectors, parallelism, command
+    
+    def fan_out(self) -> None:
+        selectors, parallelism, command = self._get_fan_out_args()
+        targets = self._connections.select(selectors)
+        fan_out = FanOut(self._interaction.server, self._execute, parallelism)
+        print(f"Running '{command}' on {len(targets)} host(s), {parallelism} at a time .. .. ..")
+        fan_out.report(fan_out.run(targets, command))
+    
+    def _get_parallelism(self, args: list) -> tuple[list, int]:
+        if "-j" not in args:
+            return args, PARALLELISM
+        index = args.index("-j")
+        if index + 1 >= len(args) or not args[index + 1].isdigit():
+            raise NotEnoughArgumentsProvided("Expected a number of parallel hosts after '-j'.")
+        return args[:index] + args[index + 2:], int(args[index + 1])
+    
+    def fan_upload(self) -> None:
+        selectors, *args = self._get_args()
+        args, parallelism = self._get_parallelism(args)
+        args, compression = self._get_compression(args)
+        args, digest = self._get_digest(args)
+        args, delta = self._get_flag(args, "--delta")
+        origin_path, destination = self._get_path_and_destination(args)
+        self._validate_path(origin_path)
+        self._validate_extensions(origin_path, destination)
+        targets = self._connections.select(selectors)
+        fan_out = FanOut(self._interaction.server, self._execute, parallelism)
+        print(f"Uploading {origin_path} to {len(targets)} host(s), {parallelism} at a time .. .. ..")
+        fan_out.report_upload(*fan_out.upload(targets, origin_path, destination, compression, digest, delta))
+    
+    def _connect_to(self, session: Session) -> None:
+        self._interaction.target = session.sock
+        self._interaction.ip = session.ip
+        print(f"Connected to {session.label}.")
         
     def connect(self) -> None:
         args = self._get_args()
         arg = args[0]
         if arg.isdigit():
-            self._connect_by_index(int(arg))
+            self._connect_to(self._connections.get_session(int(arg)))
         else:   
-            self._connect_by_ip(arg) 
+            self._connect_to(self._connections.get_connection_by_ip(arg))
 
     def disconnect(self ) -> None:
         self._interaction.target = None
@@ -94,7 +344,7 @@ class Command:
         if target is None:
             self._execute.execute_local(cli, self._command)
         else:
-            self._execute.excute_on_target_pc(self._command, target)
+            self._submit(target, self._execute.excute_on_target_pc, self._command)
         if cli == "cd":
             self._interaction.pwd = os.getcwd()
             
@@ -107,30 +357,40 @@ class Command:
         
     def upload(self) -> None:
         target = self._validate_target()
-        args = self._get_args()
+        args, compression = self._get_compression(self._get_args())
+        args, digest = self._get_digest(args)
+        args, delta = self._get_flag(args, "--delta")
         origin_path, destination = self._get_path_and_destination(args)
         self._validate_path(origin_path)
         self._validate_extensions(origin_path, destination)
-        self._execute.upload(target, origin_path, destination)
+        self._submit(target, self._execute.upload, origin_path, destination, compression, digest, delta, resumable=True)
          
     def download(self):
         target = self._validate_target()
-        args = self._get_args()
+        args, compression = self._get_compression(self._get_args())
+        args, digest = self._get_digest(args)
+        args, delta = self._get_flag(args, "--delta")
+        args, dedup = self._get_dedup(args)
+        if delta and dedup:
+            raise TypeError("Options '--delta' and '--dedup' can not be combined.")
         origin_path, destination = self._get_path_and_destination(args)
         self._validate_path(os.path.dirname(destination))
         self._validate_extensions(origin_path, destination)
-        self._execute.download(target, origin_path, destination)
+        self._submit(target, self._execute.download, origin_path, destination, compression, digest, delta, dedup, resumable=True)
         
     def upload_directory(self) -> None:
         target = self._validate_target()
-        args = self._get_args()
+        args, compression = self._get_compression(self._get_args())
+        args, digest = self._get_digest(args)
         origin_path, destination = self._get_path_and_destination(args)
         self._validate_path(origin_path)
-        self._execute.upload_dir(target, origin_path, destination)
+        self._submit(target, self._execute.upload_dir, origin_path, destination, compression, digest)
         
     def download_directory(self):
         target = self._validate_target()
-        args = self._get_args()
+        args, compression = self._get_compression(self._get_args())
+        args, digest = self._get_digest(args)
+        args, dedup = self._get_dedup(args)
         origin_path, destination = self._get_path_and_destination(args)
         self._validate_path(destination)
-        self._execute.download_dir(target, origin_path, destination)
\ No newline at end of file
+        self._submit(target, self._execute.download_dir, origin_path, destination, compression, digest, dedup)
\ No newline at end of file
@@ -2,51 +2,262 @@
 
 
 from __future__ import annotations
+import fnmatch
+import itertools
+import re
 import socket
+import threading
+import time
+from typing import Iterable
 from exceptions import ClientIsNotConnected
+from metrics import SOCKET_COUNTERS, Histogram, Metrics
+from multiplex import Multiplexer
+
+
+RTT_GAIN = 1 / 8
+
+Identity = str
+
+
+class Session:
+    __slots__ = ("id", "sock", "multiplexer", "ip", "port", "hostname", "platform", "client_id", "connected_at", "rtt", "tags", "metrics")
+
+    def __init__(self, session_id: int, sock: socket.socket, addr: tuple[str, int], multiplexer: Multiplexer,
+                 metrics: (Metrics | None) = None) -> None:
+        self.id = session_id
+        self.sock = sock
+        self.multiplexer = multiplexer
+        self.ip = addr[0]
+        self.port = addr[1]
+        self.hostname: (str | None) = None
+        self.platform: (str | None) = None
+        self.client_id: (str | None) = None
+        self.connected_at = time.time()
+        self.rtt: (float | None) = None
+        self.tags: set[str] = set()
+        self.metrics = Metrics(metrics)
+
+    @property
+    def label(self) -> str:
+        return f"#{self.id} {self.ip}"
+
+    @property
+    def identity(self) -> (Identity | None):
+        return self.client_id or None
+
+    @property
+    def bytes_sent(self) -> int:
+        return self.multiplexer.bytes_sent
+
+    @property
+    def bytes_received(self) -> int:
+        return self.multiplexer.bytes_received
+
+    def socket_counters(self) -> dict[str, float]:
+        multiplexer = self.multiplexer
+        values = (multiplexer.bytes_sent, multiplexer.bytes_received, multiplexer.send_calls, multiplexer.recv_calls, multiplexer.send_blocked)
+        return dict(zip(SOCKET_COUNTERS, values))
+
+    def counters(self) -> dict[str, float]:
+        return self.metrics.counters() | self.socket_counters()
+
+    def record_rtt(self, sample: float) -> None:
+        self.rtt = sample if self.rtt is None else self.rtt + (sample - self.rtt) * RTT_GAIN
+        self.metrics.observe("heartbeat_rtt_seconds", sample)
 
 
 class Connections:
     _instance: dict[type, Connections] = {}
-    
+
     def __new__(cls) -> Connections:
         if not cls._instance.get(cls, False):
             c = super().__new__(cls)
-            cls._instance[cls] = c 
+            cls._instance[cls] = c
         return cls._instance[cls]
-    
+
     def __init__(self) -> None:
-        self._connections: dict[str, socket.socket] = {}
-        
+        self._lock = threading.RLock()
+        self._ids = itertools.count()
+        self._sessions: dict[int, Session] = {}
+        self._by_socket: dict[socket.socket, Session] = {}
+        self._by_ip: dict[str, dict[int, Session]] = {}
+        self._by_hostname: dict[str, dict[int, Session]] = {}
+        self._by_tag: dict[str, dict[int, Session]] = {}
+        self._by_identity: dict[Identity, dict[int, Session]] = {}
+        self._tags: dict[Identity, set[str]] = {}
+        self._metrics = Metrics()
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _index(self, index: dict[str, dict[int, Session]], key: str, session: Session) -> None:
+        index.setdefault(key, {})[session.id] = session
+
+    def _unindex(self, index: dict[str, dict[int, Session]], key: (str | None), session: Session) -> None:
+        sessions = index.get(key)
+        if sessions is None:
+            return
+        sessions.pop(session.id, None)
+        if not sessions:
+            del index[key]
+
     def is_connected(self, ip: str) -> bool:
-        if ip in self._connections:
-            return True 
-        return False
-        
-    def add_connection(self, conn: socket.socket, addr: tuple[str, int]) -> None:
-        ip = addr[0]
-        self._connections[ip] = conn
-    
-    def get_connection_by_ip(self, ip: str) -> socket.socket:
-        connection = self._connections.get(ip, None)
-        if connection is None:
+        with self._lock:
+            return ip in self._by_ip
+
+    def add_connection(self, conn: socket.socket, addr: tuple[str, int], multiplexer: Multiplexer) -> Session:
+        with self._lock:
+            session = Session(next(self._ids), conn, addr, multiplexer, self._metrics)
+            self._sessions[session.id] = session
+            self._by_socket[conn] = session
+            self._index(self._by_ip, session.ip, session)
+            return session
+
+    def describe(self, session: Session, hostname: str, platform: str, client_id: str = "") -> None:
+        with self._lock:
+            if self._sessions.get(session.id) is not session:
+                return
+            self._unindex(self._by_hostname, session.hostname, session)
+            self._unindex(self._by_identity, session.identity, session)
+            session.hostname = hostname
+            session.platform = platform
+            session.client_id = client_id
+            self._index(self._by_hostname, hostname, session)
+            if session.identity is None:
+                return
+            self._index(self._by_identity, session.identity, session)
+            tags = self._tags.setdefault(session.identity, set())
+            tags |= session.tags
+            for tag in tags:
+                self._add_tag(session, tag)
+
+    def get_session(self, session_id: int) -> Session:
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            raise ClientIsNotConnected(f"The client with provided session ID --> {session_id} is not connected.")
+        return session
+
+    def get_session_by_socket(self, conn: socket.socket) -> (Session | None):
+        with self._lock:
+            return self._by_socket.get(conn)
+
+    def get_sessions_by_ip(self, ip: str) -> list[Session]:
+        with self._lock:
+            return list(self._by_ip.get(ip, {}).values())
+
+    def get_connection_by_ip(self, ip: str) -> Session:
+        sessions = self.get_sessions_by_ip(ip)
+        if not sessions:
             raise ClientIsNotConnected(f"The client with provided ip --> {ip} is not connected.")
-        return connection
-    
-    def get_connection_by_index(self, index: int) -> tuple:
-        if 0 <= index < len(self._connections):
-            connection = list(self._connections.items())[index]
-            return connection
-        else:
-            raise IndexError(f"The index --> {index} is out of range.")
-
-    def remove_connection(self, ip: (str | None)) -> None:
-        if ip is not None:
-            try:
-                del self._connections[ip]
-            except KeyError:
-                pass
-    
-    def connections_list(self) -> tuple:
-        conneected_clients = tuple(self._connections.keys())
-        return conneected_clients
\ No newline at end of file
+        if len(sessions) > 1:
+            raise ClientIsNotConnected(f"{len(sessions)} clients are connected from {ip}, use a session ID --> {', '.join(str(session.id) for session in sessions)}.")
+        return sessions[0]
+
+    def _get_sessions_by_identity(self, identity: Identity) -> list[Session]:
+        return list(self._by_identity.get(identity, {}).values())
+
+    def get_latest_by_identity(self, identity: Identity) -> (Session | None):
+        with self._lock:
+            sessions = self._get_sessions_by_identity(identity)
+            return sessions[-1] if sessions else None
+
+    def remove_session(self, session: Session) -> bool:
+        with self._lock:
+            if self._sessions.get(session.id) is not session:
+                return False
+            del self._sessions[session.id]
+            del self._by_socket[session.sock]
+            self._unindex(self._by_ip, session.ip, session)
+            self._unindex(self._by_hostname, session.hostname, session)
+            self._unindex(self._by_identity, session.identity, session)
+            for tag in session.tags:
+                self._unindex(self._by_tag, tag, session)
+            for name, value in session.socket_counters().items():
+                self._metrics.add(name, value)
+            return True
+
+    def remove_connection_by_socket(self, conn: socket.socket) -> (Session | None):
+        with self._lock:
+            session = self._by_socket.get(conn)
+            if session is None or not self.remove_session(session):
+                return None
+            return session
+
+    def _add_tag(self, session: Session, tag: str) -> None:
+        session.tags.add(tag)
+        self._index(self._by_tag, tag, session)
+
+    def _same_host(self, session: Session) -> list[Session]:
+        identity = session.identity
+        if identity is None:
+            return [session] if self._sessions.get(session.id) is session else []
+        return self._get_sessions_by_identity(identity)
+
+    def add_tag(self, session: Session, tag: str) -> None:
+        with self._lock:
+            if session.identity is not None:
+                self._tags.setdefault(session.identity, set()).add(tag)
+            for same in self._same_host(session):
+                self._add_tag(same, tag)
+
+    def remove_tag(self, session: Session, tag: str) -> None:
+        with self._lock:
+            tags = self._tags.get(session.identity, set())
+            tags.discard(tag)
+            if not tags:
+                self._tags.pop(session.identity, None)
+            session.tags.discard(tag)
+            self._unindex(self._by_tag, tag, session)
+            for same in self._same_host(session):
+                same.tags.discard(tag)
+                self._unindex(self._by_tag, tag, same)
+
+    def _match(self, selector: str) -> Iterable[Session]:
+        if selector in ("all", "*"):
+            return self._sessions.values()
+        if selector.startswith("@"):
+            return self._by_tag.get(selector[1:], {}).values()
+        if re.fullmatch(r"\d+(-\d+)?", selector):
+            first, _, last = selector.partition("-")
+            first, last = int(first), int(last or first)
+            if last - first < len(self._sessions):
+                return [self._sessions[session_id] for session_id in range(first, last + 1) if session_id in self._sessions]
+            return [session for session_id, session in self._sessions.items() if first <= session_id <= last]
+        if selector in self._by_ip:
+            return self._by_ip[selector].values()
+        matched = []
+        for index in (self._by_ip, self._by_hostname):
+            for key, sessions in index.items():
+                if fnmatch.fnmatchcase(key, selector):
+                    matched.extend(sessions.values())
+        return matched
+
+    def select(self, selectors: str) -> list[Session]:
+        selected: dict[int, Session] = {}
+        with self._lock:
+            for selector in selectors.split(","):
+                selected.update((session.id, session) for session in self._match(selector))
+        if not selected:
+            raise ClientIsNotConnected(f"No connected client matches --> {selectors}.")
+        return [selected[session_id] for session_id in sorted(selected)]
+
+    def sessions(self) -> list[Session]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def metrics_for(self, multiplexer: Multiplexer) -> Metrics:
+        session = self.get_session_by_socket(multiplexer.sock)
+        return session.metrics if session is not None else self._metrics
+
+    def totals(self) -> tuple[dict[str, float], dict[str, Histogram]]:
+        with self._lock:
+            counters = self._metrics.counters()
+            for session in self._sessions.values():
+                for name, value in session.socket_counters().items():
+                    counters[name] = counters.get(name, 0) + value
+        return counters, self._metrics.histograms()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import hashlib
+import math
+import mmap
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator
+from exceptions import ProtocolError
+
+
+MIN_BLOCK_SIZE = 2 * 1024
+MAX_BLOCK_SIZE = 128 * 1024
+MAX_LITERAL = 1024 * 1024
+MISS_PROBE = 256 * 1024
+MAX_MISS_RATIO = 0.5
+SIGNATURE = struct.Struct("<I16s")
+INSTRUCTION = struct.Struct("<BQQ")
+END = 0
+COPY = 1
+LITERAL = 2
+ADLER_MOD = 65521
+
+Signatures = dict[int, dict[bytes, int]]
+
+
+def block_size_for(data_size: int) -> int:
+    block_size = 1 << max(math.isqrt(data_size).bit_length() - 1, 0)
+    return min(max(block_size, MIN_BLOCK_SIZE), MAX_BLOCK_SIZE)
+
+
+def strong_hash(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+@contextmanager
+def map_file(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        if not f.seek(0, 2):
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def compute_signatures(path: str, block_size: int) -> bytes:
+    signatures = bytearray()
+    with map_file(path) as data:
+        for offset in range(0, len(data) - block_size + 1, block_size):
+            block = data[offset: offset + block_size]
+            signatures += SIGNATURE.pack(zlib.adler32(block), strong_hash(block))
+    return bytes(signatures)
+
+
+def validate_block_size(block_size: int) -> int:
+    if not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+        raise ProtocolError(f"Unsupported delta block size --> {block_size}.")
+    return block_size
+
+
+def load_signatures(data: bytes) -> Signatures:
+    if len(data) % SIGNATURE.size:
+        raise ProtocolError(f"Malformed delta signatures of {len(data)} bytes.")
+    signatures: Signatures = {}
+    for index, (weak, strong) in enumerate(SIGNATURE.iter_unpack(data)):
+        signatures.setdefault(weak, {}).setdefault(strong, index)
+    return signatures
+
+
+def _literal(data: bytes) -> bytes:
+    return INSTRUCTION.pack(LITERAL, len(data), 0) + data
+
+
+def encode_delta(data: bytes, block_size: int, signatures: Signatures) -> Iterator[tuple[bytes, int, int]]:
+    size = len(data)
+    position = literal_start = 0
+    copy_start, copy_count = 0, 0
+    missed = 0
+    weak = None
+    a = b = 0
+    while position + block_size <= size:
+        if weak is None:
+            weak = zlib.adler32(data[position: position + block_size])
+            a, b = weak & 0xffff, weak >> 16
+        candidates = signatures.get(weak)
+        if candidates is not None:
+            index = candidates.get(strong_hash(data[position: position + block_size]))
+            if index is not None:
+                if literal_start < position:
+                    yield _literal(data[literal_start: position]), 0, position - literal_start
+                if copy_count and copy_start + copy_count == index:
+                    copy_count += 1
+                else:
+                    if copy_count:
+                        yield INSTRUCTION.pack(COPY, copy_start, copy_count), copy_count * block_size, 0
+                    copy_start, copy_count = index, 1
+                position += block_size
+                literal_start = position
+                weak = None
+                continue
+        if copy_count:
+            yield INSTRUCTION.pack(COPY, copy_start, copy_count), copy_count * block_size, 0
+            copy_count = 0
+        if missed >= MISS_PROBE and missed > position * MAX_MISS_RATIO:
+            position += block_size
+            missed += block_size
+            weak = None
+        else:
+            if position + block_size < size:
+                removed, added = data[position], data[position + block_size]
+                a = (a - removed + added) % ADLER_MOD
+                b = (b - block_size * removed + a - 1) % ADLER_MOD
+                weak = (b << 16) | a
+            position += 1
+            missed += 1
+        if position - literal_start >= MAX_LITERAL:
+            yield _literal(data[literal_start: literal_start + MAX_LITERAL]), 0, MAX_LITERAL
+            literal_start += MAX_LITERAL
+    if copy_count:
+        yield INSTRUCTION.pack(COPY, copy_start, copy_count), copy_count * block_size, 0
+    for offset in range(literal_start, size, MAX_LITERAL):
+        literal = data[offset: min(offset + MAX_LITERAL, size)]
+        yield _literal(literal), 0, len(literal)
+    yield INSTRUCTION.pack(END, 0, 0), 0, 0
+
+
+def apply_delta(receive: Callable[[int], bytes], old: BinaryIO, new: BinaryIO, block_size: int,
+                progress: (Callable[[int], None] | None) = None) -> tuple[int, int]:
+    copied = literal = 0
+    while True:
+        operation, first, second = INSTRUCTION.unpack(receive(INSTRUCTION.size))
+        if operation == END:
+            break
+        if operation == COPY:
+            old.seek(first * block_size)
+            for _ in range(second):
+                block = old.read(block_size)
+                if len(block) != block_size:
+                    raise ProtocolError(f"Delta refers to a block past the end of the existing file --> {first}.")
+                new.write(block)
+            copied += second * block_size
+            if progress is not None:
+                progress(second * block_size)
+        elif operation == LITERAL:
+            if first > MAX_LITERAL:
+                raise ProtocolError(f"Delta literal is too large --> {first} bytes.")
+            data = receive(first)
+            new.write(data)
+            literal += first
+            if progress is not None:
+                progress(first)
+        else:
+            raise ProtocolError(f"Unknown delta instruction --> {operation}.")
+    return copied, literal
+
+
+@contextmanager
+def replace_when_verified(path: str, enabled: bool = True) -> Iterator[str]:
+    rebuilt = f"{path}.delta"
+    if not enabled:
+        yield rebuilt
+        return
+    try:
+        yield rebuilt
+    except BaseException:
+        if os.path.exists(rebuilt):
+            os.remove(rebuilt)
+        raise
+    os.replace(rebuilt, path)
@@ -17,4 +17,16 @@ class PathDoesNotExist(Exception):
     ...
     
 class ClientIsNotConnected(Exception):
-    ...
\ No newline at end of file
+    ...
+    
+class ProtocolError(Exception):
+    ...
+    
+class StreamReset(Exception):
+    ...
+    
+class UnsupportedCompression(Exception):
+    ...
+    
+class UnsupportedDigest(Exception):
+    ...
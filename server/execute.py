@@ -1,30 +1,84 @@
 #!/usr/bin/env 
 
 
-import socket
 import os
-import struct
+import json
+import itertools
+import time
+from contextlib import contextmanager
 from subprocess import run
+from typing import Iterator
 from tqdm import tqdm
+from chunck_store import ChunckStore
+from connections import Connections
 from handle_files import UploadFile, DownloadFile, UploadDownloadDirectory
+from metrics import Metrics
+from multiplex import Multiplexer, Stream
+from output import OUTPUT_LIMIT, CommandOutput
+from protocol import Flag, FrameType
 
 
 class Execute:
-    def _create_packet(self, data: str) -> bytes:
-        data_bytes = data.encode("utf-8")
-        length = len(data_bytes)
-        size = struct.pack("<L", length)
-        packet = size + data_bytes
-        return packet
-            
-    def _send_packet(self, target: socket.socket, packet: bytes, ) -> None:
-        target.sendall(packet)
+    _request_ids = itertools.count(1)
+    
+    def __init__(self, output_limit: int = OUTPUT_LIMIT, connections: (Connections | None) = None,
+                 chunck_store: (ChunckStore | None) = None) -> None:
+        self._output_limit = output_limit
+        self._connections = connections
+        self._chunck_store = chunck_store
+    
+    def _metrics_for(self, target: Multiplexer) -> Metrics:
+        if self._connections is None:
+            return Metrics()
+        return self._connections.metrics_for(target)
+    
+    @contextmanager
+    def _open_channel(self, target: Multiplexer) -> Iterator[Stream]:
+        request_id = next(self._request_ids) % 2 ** 32
+        channel = target.open_stream(request_id)
+        try:
+            yield channel
+        except Exception as ex:
+            target.close_stream(channel, ex)
+            raise
+        else:
+            target.close_stream(channel)
+    
+    @contextmanager
+    def _transfer(self, target: Multiplexer) -> Iterator[tuple[Stream, Metrics]]:
+        metrics = self._metrics_for(target)
+        try:
+            with self._open_channel(target) as channel:
+                yield channel, metrics
+        except Exception:
+            metrics.add("transfer_errors")
+            raise
+    
+    def _send_command(self, channel: Stream, command: str) -> None:
+        channel.send_text(command, FrameType.COMMAND)
+
+    def _transfer_command(self, command: str, compression: (str | None), digest: (str | None), delta: bool = False, dedup: bool = False) -> str:
+        options = [command]
+        if compression is not None:
+            options += ["-c", compression]
+        if digest is not None:
+            options += ["--hash", digest]
+        if delta:
+            options.append("--delta")
+        if dedup:
+            options.append("--dedup")
+        return " ".join(options)
 
-    def _get_packet(self, target: socket.socket) -> str:
-        response_length = struct.unpack("<L", target.recv(4))[0]
-        raw_response = target.recv(response_length)
-        str_response = raw_response.decode("utf-8")
-        return str_response
+    def _get_output(self, channel: Stream, output: CommandOutput) -> CommandOutput:
+        while True:
+            frame = channel.expect(FrameType.DATA, FrameType.JSON, FrameType.OUTPUT)
+            if frame.type == FrameType.DATA:
+                output.write(frame.payload, bool(frame.flags & Flag.STDERR))
+            elif frame.type == FrameType.JSON:
+                output.exit_code = json.loads(frame.payload)
+            else:
+                output.finish(frame.payload.decode("utf-8", "replace"))
+                return output
     
     def _change_directoty(self, command: str) -> None:
         args = command.split()
@@ -45,32 +99,45 @@ class Execute:
         str_out = bytes_out.decode("utf-8")
         print(str_out)
     
-    def excute_on_target_pc(self, command: str, target: socket.socket) -> None:
-        packet = self._create_packet(command)
-        self._send_packet(target, packet)
-        str_response = self._get_packet(target)
-        print(str_response)
+    def excute_on_target_pc(self, target: Multiplexer, command: str, echo: bool = True) -> CommandOutput:
+        metrics = self._metrics_for(target)
+        started = time.perf_counter()
+        try:
+            with self._open_channel(target) as channel:
+                self._send_command(channel, command)
+                output = self._get_output(channel, CommandOutput(self._output_limit, echo))
+        except Exception:
+            metrics.add("command_errors")
+            raise
+        metrics.add("commands")
+        metrics.observe("command_rtt_seconds", time.perf_counter() - started)
+        return output
         
-    def upload(self, target: socket.socket, path: str, destination: str) -> None:
-        packet = self._create_packet("upload")
-        self._send_packet(target, packet)
-        file = UploadFile(target, path, destination)
-        file.upload_file()
+    def upload(self, target: Multiplexer, path: str, destination: str, compression: (str | None) = None, digest: (str | None) = None,
+               delta: bool = False, shared: (bytes | None) = None, quiet: bool = False) -> str:
+        with self._transfer(target) as (channel, metrics):
+            self._send_command(channel, self._transfer_command("upload", compression, digest, delta))
+            file = UploadFile(channel, path, destination, compression, delta, digest=digest, shared=shared, quiet=quiet, metrics=metrics)
+            return file.upload_file()
         
-    def download(self, target: socket.socket, remote_file_path: str, local_destination_file_path: str) -> None:
-        packet = self._create_packet("download")
-        self._send_packet(target, packet)
-        file = DownloadFile(target, remote_file_path, local_destination_file_path)
-        file.download_file()
+    def download(self, target: Multiplexer, remote_file_path: str, local_destination_file_path: str, compression: (str | None) = None,
+                 digest: (str | None) = None, delta: bool = False, dedup: bool = False) -> None:
+        with self._transfer(target) as (channel, metrics):
+            self._send_command(channel, self._transfer_command("download", compression, digest, delta, dedup))
+            file = DownloadFile(channel, remote_file_path, local_destination_file_path, compression, delta, dedup, digest, metrics=metrics,
+                                chunck_store=self._chunck_store)
+            file.download_file()
         
-    def upload_dir(self, target: socket.socket, origin_path: str, destination: str) -> None:
-        packet = self._create_packet("download_dir")
-        self._send_packet(target, packet)
-        directory = UploadDownloadDirectory(target, origin_path, destination)
-        directory.upload_directory()
+    def upload_dir(self, target: Multiplexer, origin_path: str, destination: str, compression: (str | None) = None, digest: (str | None) = None) -> None:
+        with self._transfer(target) as (channel, metrics):
+            self._send_command(channel, self._transfer_command("download_dir", compression, digest))
+            directory = UploadDownloadDirectory(channel, origin_path, destination, compression, digest=digest, metrics=metrics)
+            directory.upload_directory()
         
-    def download_dir(self, target: socket.socket, origin_path: str, destination: str) -> None:
-        packet = self._create_packet("upload_dir")
-        self._send_packet(target, packet)
-        directory = UploadDownloadDirectory(target, origin_path, destination)
-        directory.download_directory()
\ No newline at end of file
+    def download_dir(self, target: Multiplexer, origin_path: str, destination: str, compression: (str | None) = None, digest: (str | None) = None,
+                     dedup: bool = False) -> None:
+        with self._transfer(target) as (channel, metrics):
+            self._send_command(channel, self._transfer_command("upload_dir", compression, digest, dedup=dedup))
+            directory = UploadDownloadDirectory(channel, origin_path, destination, compression, dedup=dedup, digest=digest, metrics=metrics,
+                                                chunck_store=self._chunck_store)
+            directory.download_directory()
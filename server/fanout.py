@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, NamedTuple
+from connections import Session
+from delta import map_file
+from execute import Execute
+from listen_server import ListenServer
+from multiplex import Multiplexer
+from output import CommandOutput
+from tuning import format_size
+
+
+PARALLELISM = 32
+LISTED_HOSTS = 10
+
+
+class HostResult(NamedTuple):
+    host: str
+    output: Any
+    error: (str | None)
+    elapsed: float
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return "error"
+        if isinstance(self.output, CommandOutput) and self.output.exit_code:
+            return f"exit {self.output.exit_code}"
+        return "ok"
+
+    @property
+    def key(self) -> tuple:
+        if self.error is not None:
+            return ("error", self.error)
+        return (self.status, self.output.stdout, self.output.stderr, self.output.dropped)
+
+
+class FanOut:
+    def __init__(self, server: ListenServer, execute: Execute, parallelism: int = PARALLELISM) -> None:
+        if parallelism < 1:
+            raise ValueError(f"Parallelism must be at least 1, but got --> {parallelism}.")
+        self._server = server
+        self._execute = execute
+        self._slots = threading.BoundedSemaphore(parallelism)
+        self._lock = threading.Lock()
+        self._results: list[HostResult] = []
+
+    def _run_on(self, target: Multiplexer, host: str, operation: Callable[..., Any], args: tuple) -> None:
+        started = time.perf_counter()
+        output, error = None, None
+        try:
+            output = operation(target, *args)
+        except Exception as ex:
+            error = str(ex) or type(ex).__name__
+        with self._lock:
+            self._results.append(HostResult(host, output, error, time.perf_counter() - started))
+            print(f"\r[{len(self._results)}] {host} {self._results[-1].status}\x1b[K", end="", flush=True)
+
+    def _release(self, future: Future) -> None:
+        self._slots.release()
+
+    def _run(self, targets: list[Session], operation: Callable[..., Any], *args: Any) -> list[HostResult]:
+        futures = []
+        for session in targets:
+            self._slots.acquire()
+            try:
+                future = self._server.submit(session.sock, self._run_on, session.label, operation, args)
+            except Exception as ex:
+                self._slots.release()
+                with self._lock:
+                    self._results.append(HostResult(session.label, None, str(ex), 0.0))
+                continue
+            future.add_done_callback(self._release)
+            futures.append(future)
+        for future in futures:
+            future.exception()
+        print("\r\x1b[K", end="")
+        order = {session.label: index for index, session in enumerate(targets)}
+        return sorted(self._results, key=lambda result: order[result.host])
+
+    def run(self, targets: list[Session], command: str) -> list[HostResult]:
+        return self._run(targets, self._execute.excute_on_target_pc, command, False)
+
+    def upload(self, targets: list[Session], path: str, destination: str, compression: (str | None) = None,
+               digest: (str | None) = None, delta: bool = False) -> tuple[int, list[HostResult]]:
+        with map_file(path) as data:
+            results = self._run(targets, self._execute.upload, path, destination, compression, digest, delta, data, True)
+            return len(data), results
+
+    def _print_group(self, group: list[HostResult]) -> None:
+        hosts = ", ".join(result.host for result in group[:LISTED_HOSTS])
+        if len(group) > LISTED_HOSTS:
+            hosts += f" and {len(group) - LISTED_HOSTS} more"
+        first = group[0]
+        print(f"\x1b[32m=== {len(group)} host(s), {first.status}: {hosts} ===\x1b[0m")
+        if first.error is not None:
+            print(first.error)
+            return
+        text = (first.output.stdout + first.output.stderr).decode("utf-8", "replace")
+        print(text, end="" if text.endswith("\n") or not text else "\n")
+        if first.output.dropped:
+            print(f"... {first.output.dropped} more bytes of output not kept.")
+
+    def report(self, results: list[HostResult]) -> None:
+        groups: dict[tuple, list[HostResult]] = {}
+        for result in results:
+            groups.setdefault(result.key, []).append(result)
+        for group in sorted(groups.values(), key=len, reverse=True):
+            self._print_group(group)
+        width = max((len(result.host) for result in results), default=4)
+        print(f"{'HOST':<{width}}  {'STATUS':<10}  TIME")
+        for result in results:
+            print(f"{result.host:<{width}}  {result.status:<10}  {result.elapsed:.3f}s")
+        self._print_summary(results)
+
+    def _print_summary(self, results: list[HostResult]) -> None:
+        failed = sum(result.status != "ok" for result in results)
+        print(f"{len(results)} host(s), {len(results) - failed} ok, {failed} failed.")
+
+    def report_upload(self, data_size: int, results: list[HostResult]) -> None:
+        width = max((len(result.host) for result in results), default=4)
+        print(f"{'HOST':<{width}}  {'STATUS':<6}  {'TIME':>9}  {'RATE':>12}  DETAILS")
+        for result in results:
+            rate = f"{format_size(data_size / result.elapsed)}/s" if result.error is None and result.elapsed else "-"
+            details = result.error if result.error is not None else result.output.splitlines()[0]
+            print(f"{result.host:<{width}}  {result.status:<6}  {result.elapsed:>8.3f}s  {rate:>12}  {details}")
+        self._print_summary(results)
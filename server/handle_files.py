@@ -2,71 +2,120 @@
 
 
 import os 
-import socket
 import json
-import struct
-from typing import Any
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, BinaryIO
 from tqdm import tqdm, trange
-from exceptions import PathDoesNotExist
+from archive import ARCHIVE_END, DIRECTORY, ENTRY_HEADER, FILE, Entry, local_path, pack_entry, restore_metadata, scan, unpack_entry
+from chunck_store import MANIFEST_ENTRY, MANIFEST_HEADER, MAX_CHUNCK_SIZE, ChunckStore, chunck_hash
+from compression import Compression, DecompressingReader
+from delta import Signatures, apply_delta, block_size_for, compute_signatures, encode_delta, load_signatures, map_file, replace_when_verified, validate_block_size
+from exceptions import PathDoesNotExist, ProtocolError
+from integrity import DEFAULT_ALGORITHM, Digest, DigestWriter
+from metrics import Metrics
+from pipeline import SMALL_FILE_SIZE, ReadAhead, WriteBehind
+from protocol import Channel, FrameType
+from resume import PartialFile, prefix_digest, transfer_id
+from tuning import TransferTuner, format_size
 
 
 class File:
-    def __init__(self, target: socket.socket, path: str, destination: str) -> None:
-        self._target = target
+    def __init__(self, channel: Channel, path: str, destination: str, compression: (str | None) = None, delta: bool = False, dedup: bool = False,
+                 digest: (str | None) = None, shared: (bytes | None) = None, quiet: bool = False, metrics: (Metrics | None) = None,
+                 chunck_store: (ChunckStore | None) = None) -> None:
+        self._channel = channel
         self._path = path 
         self._destination = destination
-        self._chunck_size = 1024
+        self._tuner = TransferTuner(channel.sock)
+        self._buffer = memoryview(bytearray())
+        self._requested_compression = compression
+        self._compression: (Compression | None) = None
+        self._source: (Channel | DecompressingReader) = channel
+        self._use_delta = delta
+        self._delta_stats: (tuple[int, int] | None) = None
+        self._use_dedup = dedup
+        self._chunck_store = chunck_store
+        self._dedup_stats: (tuple[int, int] | None) = None
+        self._resumed_from = 0
+        self._requested_digest = digest
+        self._digest = Digest()
+        self._shared = shared
+        self._quiet = quiet
+        self._metrics = metrics if metrics is not None else Metrics()
         
-    def _create_packet(self, data: str) -> bytes:
-        data_bytes = data.encode("utf-8")
-        length = len(data_bytes)
-        size = struct.pack("<L", length)
-        packet = size + data_bytes
+    def _create_packet(self, data: str, frame_type: FrameType = FrameType.TEXT) -> bytes:
+        packet = self._channel.pack(frame_type, data.encode("utf-8"))
         return packet
             
     def _send_packet(self, packet: bytes) -> None:
-        self._target.sendall(packet)
+        started = time.perf_counter()
+        self._channel.sendall(packet)
+        self._metrics.add("send_wait_seconds", time.perf_counter() - started)
         
-    def _get_packet(self) -> str:
-        data_size = struct.unpack("<L", self._target.recv(4))[0]
-        data = self._get_data_by_chuncks(data_size)
-        string_data = data.decode("utf-8")
+    def _get_packet(self, *frame_types: FrameType) -> str:
+        string_data = self._channel.recv_text(*frame_types)
         return string_data
     
-    def _get_chunck(self, chunck_size: (int | None) = None) -> bytes:
-        if chunck_size is None:
-            chunck_size = self._chunck_size
-        chunck = self._target.recv(chunck_size)
-        return chunck 
-    
-    def _get_data_by_chuncks(self, data_size: int, progress_bar: bool = False) -> bytes:
-        data = b""
-        pbar = None
-        if progress_bar:
-            pbar = tqdm(total=data_size)
-        while len(data) < data_size:
-            if (rest_of_data := (data_size - len(data))) < self._chunck_size:
-                data += self._get_chunck(rest_of_data)
-                if pbar:
-                    pbar.update(rest_of_data)
-            else:
-                data += self._get_chunck()
-                if pbar:
-                    pbar.update(rest_of_data)
+    def _get_chunck(self, view: memoryview) -> int:
+        started = time.perf_counter()
+        received = self._source.recv_data_into(view)
+        self._metrics.add("recv_wait_seconds", time.perf_counter() - started)
+        self._metrics.add("chuncks_received")
+        return received
+    
+    def _send_block(self, data: bytes) -> None:
+        if self._compression is not None:
+            data = self._compression.encode(data)
+        started = time.perf_counter()
+        self._channel.send(FrameType.DATA, data)
+        self._metrics.add("send_wait_seconds", time.perf_counter() - started)
+        self._metrics.add("chuncks_sent")
+    
+    def _get_buffer(self) -> memoryview:
+        chunck_size = self._tuner.chunck_size
+        if len(self._buffer) < chunck_size:
+            self._buffer = memoryview(bytearray(chunck_size))
+        return self._buffer[:chunck_size]
+    
+    def _stream_data(self, data_size: int, file: BinaryIO, pbar: (tqdm | None) = None) -> None:
+        rest_of_data = data_size
+        while rest_of_data > 0:
+            buffer = self._get_buffer()
+            received = self._get_chunck(buffer[:min(rest_of_data, len(buffer))])
+            file.write(buffer[:received])
+            self._digest.update(buffer[:received])
+            rest_of_data -= received
+            self._tuner.record(received)
+            if pbar is not None:
+                pbar.update(received)
+        
+    def _receive_data(self, data_size: int, pbar: (tqdm | None) = None) -> bytes:
+        data = bytearray(data_size)
+        view = memoryview(data)
+        received = 0
+        while received < data_size:
+            chunck = self._get_chunck(view[received:])
+            received += chunck
+            self._tuner.record(chunck)
+            if pbar is not None:
+                pbar.update(chunck)
+        return data
+    
+    def _receive_hashed(self, data_size: int, pbar: (tqdm | None) = None) -> bytes:
+        data = self._receive_data(data_size, pbar)
+        self._digest.update(data)
         return data
         
     def _create_json_packet(self, file_info: Any) -> bytes:
-        file_info_serialized = json.dumps(file_info)
-        file_info_bytes = file_info_serialized.encode("utf-8")
-        size = struct.pack("<L", len(file_info_bytes))
-        packet = size + file_info_bytes
+        file_info_bytes = json.dumps(file_info).encode("utf-8")
+        packet = self._channel.pack(FrameType.JSON, file_info_bytes)
         return packet
     
     def _get_json_packet(self) -> list:
-        data_size = struct.unpack("<L", self._target.recv(4))[0]
-        data = self._get_data_by_chuncks(data_size)
-        string_data = data.decode("utf-8")
-        loaded_data = json.loads(string_data)
+        loaded_data = self._channel.recv_json()
         return loaded_data       
 
     def _get_file_name(self, path: str) -> str:
@@ -78,16 +127,73 @@ class File:
             return True
         return False
     
+    def _negotiate_compression(self) -> None:
+        if self._requested_compression is None:
+            return
+        accepted = self._get_json_packet()
+        if accepted is None:
+            print(f"The target does not support '{self._requested_compression}' compression, transferring uncompressed.")
+            return
+        self._compression = Compression.parse(accepted)
+        self._source = DecompressingReader(self._channel, self._compression)
+        
+    def _negotiate_digest(self) -> None:
+        if self._requested_digest is None:
+            return
+        accepted = self._get_json_packet()
+        if accepted is None:
+            print(f"The target does not support '{self._requested_digest}' digests, verifying with {DEFAULT_ALGORITHM}.")
+            return
+        self._digest = Digest(accepted)
+    
     def _get_path_confirmation(self) -> None:
-        confirmation = self._get_packet()
-        if confirmation == "<DISAPPROVED>":
-            error_message = self._get_packet()
+        confirmation = self._channel.expect(FrameType.APPROVED, FrameType.DISAPPROVED)
+        if confirmation.type == FrameType.DISAPPROVED:
+            error_message = self._get_packet(FrameType.OUTPUT)
             raise PathDoesNotExist(f"{error_message}")
     
+    def _record_transfer(self, elapsed: float) -> None:
+        self._metrics.add("transfers")
+        self._metrics.add("transfer_bytes", self._tuner.transferred)
+        self._metrics.add("transfer_seconds", elapsed)
+        if elapsed > 0:
+            self._metrics.observe("transfer_throughput_bytes", self._tuner.transferred / elapsed)
+    
     def _outcome(self) -> str:
-        outcome = self._get_packet()
-        print(outcome)
+        elapsed = self._tuner.elapsed
+        self._channel.send_json(self._digest.hexdigest())
+        frame = self._channel.expect(FrameType.JSON, FrameType.OUTPUT)
+        peer_digest = None
+        if frame.type == FrameType.JSON:
+            peer_digest = json.loads(frame.payload)
+            frame = self._channel.expect(FrameType.OUTPUT)
+        outcome = frame.payload.decode("utf-8")
+        if peer_digest is None:
+            raise ProtocolError(outcome)
+        if not self._quiet:
+            print(outcome)
+        try:
+            self._digest.verify(peer_digest)
+        finally:
+            if not self._quiet:
+                print(f"LOCAL PC: {self._report()}")
+        self._record_transfer(elapsed)
         return outcome
+    
+    def _report(self) -> str:
+        report = self._tuner.report()
+        if self._compression is not None:
+            report += f" {self._compression.report()}"
+        if self._delta_stats is not None:
+            copied, literal = self._delta_stats
+            report += f" Delta: reused {format_size(copied)}, sent {format_size(literal)} of new data."
+        if self._dedup_stats is not None:
+            reused, received = self._dedup_stats
+            report += f" Chunck store: reused {format_size(reused)}, received {format_size(received)}."
+        if self._resumed_from:
+            report += f" Resumed from {format_size(self._resumed_from)}."
+        report += f" {self._digest.report()}"
+        return report
 
 class UploadFile(File):
     def _get_folder_location(self, path: str) -> str:
@@ -102,118 +208,310 @@ class UploadFile(File):
         else:
             return path.split()
          
-    def _get_data_size(self, data: bytes) -> int:
-        data_size = len(data)
+    def _get_data_size(self, path: str) -> int:
+        data_size = os.path.getsize(path)
         return data_size 
     
-    def _get_file_data(self, path: str) -> bytes:
+    def _sendfile(self, file: BinaryIO, data_size: int, pbar: tqdm, offset: int = 0) -> int:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="digest") as hasher:
+            hashed = hasher.submit(self._digest.update_file, file, offset, data_size - offset)
+            sent = offset
+            while sent < data_size:
+                count = min(data_size - sent, self._tuner.chunck_size)
+                started = time.perf_counter()
+                sent_segment = self._channel.sendfile(file, sent, count)
+                self._metrics.add("send_wait_seconds", time.perf_counter() - started)
+                self._metrics.add("chuncks_sent")
+                sent += sent_segment
+                self._tuner.record(sent_segment)
+                pbar.update(sent_segment)
+            hashed.result()
+        return sent
+    
+    def _send_by_chuncks(self, file: BinaryIO, data_size: int, pbar: tqdm, offset: int = 0) -> int:
+        file.seek(offset)
+        sent = offset
+        while sent < data_size:
+            buffer = self._get_buffer()
+            read = file.readinto(buffer[:min(data_size - sent, len(buffer))])
+            if not read:
+                break
+            self._digest.update(buffer[:read])
+            self._send_block(buffer[:read])
+            sent += read
+            self._tuner.record(read)
+            pbar.update(read)
+        return sent
+    
+    def _send_shared(self, data_size: int, pbar: tqdm, offset: int = 0) -> int:
+        sent = offset
+        with memoryview(self._shared) as view:
+            while sent < data_size:
+                block = view[sent: min(data_size, sent + self._tuner.chunck_size)]
+                self._digest.update(block)
+                self._send_block(block)
+                sent += len(block)
+                self._tuner.record(len(block))
+                pbar.update(len(block))
+        return sent
+    
+    def _send_data(self, data: bytes, pbar: tqdm) -> None:
+        self._send_block(data)
+        self._tuner.record(len(data))
+        pbar.update(len(data))
+    
+    def _upload_data(self, path: str, data_size: int, pbar: tqdm, offset: int = 0) -> None:
+        if self._shared is not None:
+            self._send_shared(data_size, pbar, offset)
+            return
         with open(path, "rb") as f:
-            data = f.read()
-        return data 
-    
-    def _upload_data(self, data: bytes, data_size: int) -> None:
-        with tqdm(total=data_size) as pbar:
-            for i in range(0, data_size, self._chunck_size):
-                if data_size < self._chunck_size:
-                    self._send_packet(data[-data_size:])
-                    pbar.update(data_size)
-                else:
-                    self._send_packet(data[i: i + self._chunck_size])
-                    data_size -= self._chunck_size
-                    pbar.update(self._chunck_size)
+            if self._compression is None and hasattr(os, "sendfile"):
+                sent = self._sendfile(f, data_size, pbar, offset)
+            else:
+                sent = self._send_by_chuncks(f, data_size, pbar, offset)
+        if sent < data_size:
+            raise EOFError(f"The file '{path}' was truncated while being uploaded.")
+        
+    def _get_signatures(self) -> (tuple[int, Signatures] | None):
+        header = self._get_json_packet()
+        if header is None:
+            return None
+        block_size, signatures_size = header
+        return validate_block_size(block_size), load_signatures(self._receive_data(signatures_size))
+    
+    def _send_delta(self, path: str, block_size: int, signatures: Signatures, pbar: tqdm) -> None:
+        self._delta_stats = (0, 0)
+        with nullcontext(self._shared) if self._shared is not None else map_file(path) as data:
+            self._digest.update(data)
+            batch = bytearray()
+            for instruction, copied, literal in encode_delta(data, block_size, signatures):
+                batch += instruction
+                self._delta_stats = (self._delta_stats[0] + copied, self._delta_stats[1] + literal)
+                pbar.update(copied + literal)
+                if len(batch) >= self._tuner.chunck_size:
+                    self._send_block(batch)
+                    self._tuner.record(len(batch))
+                    batch = bytearray()
+            self._send_block(batch)
+            self._tuner.record(len(batch))
         
-    def upload_file(self) -> None:
-        data = self._get_file_data(self._path)
-        data_size = self._get_data_size(data)
+    def _accept_resume(self, path: str, data_size: int) -> int:
+        offset, digest = self._get_json_packet()
+        if offset and (offset > data_size or prefix_digest(path, offset) != digest):
+            offset = 0
+        self._channel.send_json(offset)
+        self._resumed_from = offset
+        return offset
+        
+    def upload_file(self) -> str:
+        self._negotiate_compression()
+        self._negotiate_digest()
+        data_size = len(self._shared) if self._shared is not None else self._get_data_size(self._path)
         file_name = self._get_file_name(self._destination)
         destination_location = self._get_folder_location(self._destination)
         destination_list = self._split_path(destination_location)
         
-        file_info = [data_size, file_name, destination_list]
+        file_info = [data_size, file_name, destination_list, transfer_id(self._path)]
         json_packet = self._create_json_packet(file_info)
         self._send_packet(json_packet)
         
         self._get_path_confirmation()
+        signatures = self._get_signatures() if self._use_delta else None
+        offset = self._accept_resume(self._path, data_size) if signatures is None else 0
         
-        print(f"Uploagin {file_name} .. .. ..")
-        self._upload_data(data, data_size)
-        self._outcome()
+        if not self._quiet:
+            print(f"Uploagin {file_name} .. .. ..")
+        with tqdm(total=data_size, initial=offset, disable=self._quiet) as pbar:
+            if signatures is None:
+                self._upload_data(self._path, data_size, pbar, offset)
+            else:
+                self._send_delta(self._path, *signatures, pbar)
+        return self._outcome()
         
         
 class DownloadFile(File):
-    def _download_data(self, data_size: int, save_as: str) -> None:
-        data = self._get_data_by_chuncks(data_size, progress_bar=True)    
+    def _download_data(self, data_size: int, save_as: str, pbar: tqdm) -> None:
         with open(save_as, "wb") as f:
-            f.write(data)
+            self._stream_data(data_size, f, pbar)
+        
+    def _offer_resume(self, save_as: str, transfer: str, data_size: int) -> PartialFile:
+        partial = PartialFile(save_as, transfer, data_size)
+        self._channel.send_json(partial.checkpoint())
+        return partial
+    
+    def _download_partial(self, partial: PartialFile, data_size: int, pbar: tqdm) -> None:
+        offset = self._get_json_packet()
+        self._resumed_from = offset
+        pbar.update(offset)
+        with partial.open(offset):
+            self._stream_data(data_size - offset, partial, pbar)
+        partial.finish()
+        
+    def _get_manifest(self) -> list[tuple[bytes, int]]:
+        count = MANIFEST_HEADER.unpack(self._receive_data(MANIFEST_HEADER.size))[0]
+        manifest = list(MANIFEST_ENTRY.iter_unpack(self._receive_data(count * MANIFEST_ENTRY.size)))
+        for _, size in manifest:
+            if not 0 < size <= MAX_CHUNCK_SIZE:
+                raise ProtocolError(f"Unsupported chunck size in the manifest --> {size}.")
+        return manifest
+    
+    def _receive_deduplicated(self, save_as: str, pbar: tqdm) -> None:
+        if self._chunck_store is None:
+            raise ProtocolError("Deduplicated transfers need a chunck store, but none is configured.")
+        manifest = self._get_manifest()
+        digests = [digest for digest, _ in manifest]
+        held = self._chunck_store.pin(digests)
+        try:
+            missing = bytearray()
+            for digest in digests:
+                missing.append(digest not in held)
+                held.add(digest)
+            if missing:
+                self._send_block(missing)
+            reused = received = 0
+            with open(save_as, "wb") as f:
+                for (digest, size), is_missing in zip(manifest, missing):
+                    if is_missing:
+                        data = self._receive_data(size, pbar)
+                        if chunck_hash(data) != digest:
+                            raise ProtocolError("A chunck does not match its hash in the manifest.")
+                        self._chunck_store.put(digest, data)
+                        received += size
+                    else:
+                        data = self._chunck_store.get(digest)
+                        pbar.update(size)
+                        reused += size
+                    f.write(data)
+                    self._digest.update(data)
+            reused_before, received_before = self._dedup_stats or (0, 0)
+            self._dedup_stats = (reused_before + reused, received_before + received)
+        finally:
+            self._chunck_store.unpin(digests)
+        
+    def _send_signatures(self, path: str) -> (int | None):
+        if not os.path.isfile(path):
+            self._channel.send_json(None)
+            return None
+        block_size = block_size_for(os.path.getsize(path))
+        signatures = compute_signatures(path, block_size)
+        self._channel.send_json([block_size, len(signatures)])
+        if signatures:
+            self._send_block(signatures)
+        return block_size
+    
+    def _receive_delta(self, save_as: str, rebuilt: str, block_size: int, pbar: tqdm) -> None:
+        with open(save_as, "rb") as old, open(rebuilt, "wb") as new:
+            self._delta_stats = apply_delta(self._receive_data, old, DigestWriter(new, self._digest), block_size, pbar.update)
+        shutil.copymode(save_as, rebuilt)
         
     def download_file(self) -> None:
+        self._negotiate_compression()
+        self._negotiate_digest()
         path = self._create_packet(self._path)
         self._send_packet(path)
         self._get_path_confirmation()
         
         file_info = self._get_json_packet()
-        data_size  = file_info[0]
+        data_size, transfer = file_info
         file_name = self._get_file_name(self._destination)
         
         save_as = self._destination
+        block_size = self._send_signatures(save_as) if self._use_delta else None
+        partial = self._offer_resume(save_as, transfer, data_size) if block_size is None and not self._use_dedup else None
         print(f"Downloading {file_name} .. .. ..")
-        self._download_data(data_size, save_as)
-        self._outcome()
+        with replace_when_verified(save_as, block_size is not None and partial is None) as rebuilt:
+            with tqdm(total=data_size) as pbar:
+                if self._use_dedup:
+                    self._receive_deduplicated(save_as, pbar)
+                elif partial is not None:
+                    self._download_partial(partial, data_size, pbar)
+                else:
+                    self._receive_delta(save_as, rebuilt, block_size, pbar)
+            self._outcome()
         print(f"The file has been saved on LOCAL PC as '{save_as}'")
         
     
 class UploadDownloadDirectory(UploadFile, DownloadFile):
-    def _get_folder(self, path: str) -> str:
-        folder_location = os.path.dirname(path)
-        return folder_location
-
-    def _get_files(self, path: str) -> list[tuple[int, str]]:
-        directories = os.walk(path)
-        files = []
-        for directory in directories:
-            for file in directory[2]:
-                file_path = os.path.join(directory[0], file)
-                data_size = os.path.getsize(file_path)
-                files.append((data_size, file_path))
-        return files
-    
-    def _upload_directory_data(self, directory: list[tuple[int, str]]) -> None:
-        for data_size, file in directory:
-            data = self._get_file_data(file)
-            print(f"Uploading {file} .. .. ..")
-            self._upload_data(data, data_size)
+    def _upload_directory_data(self, path: str, pbar: tqdm) -> int:
+        entries = 0
+        with ReadAhead() as read_ahead:
+            batch = bytearray()
+            for entry, file, data in read_ahead.read(scan(path)):
+                header = pack_entry(entry)
+                self._digest.update(header)
+                batch += header
+                entries += 1
+                if data is not None:
+                    self._digest.update(data)
+                    batch += data
+                elif entry.type == FILE:
+                    self._send_data(batch, pbar)
+                    batch = bytearray()
+                    self._upload_data(file, entry.size, pbar)
+                if len(batch) >= self._tuner.chunck_size:
+                    self._send_data(batch, pbar)
+                    batch = bytearray()
+            self._digest.update(ARCHIVE_END)
+            batch += ARCHIVE_END
+            self._send_data(batch, pbar)
+        return entries
     
     def upload_directory(self): 
+        self._negotiate_compression()
+        self._negotiate_digest()
         destination_list = self._split_path(self._destination)
         json_path_packet = self._create_json_packet(destination_list)
         self._send_packet(json_path_packet)
         self._get_path_confirmation()
         
-        directory = self._get_files(self._path)
-        json_directory = self._create_json_packet(directory)
-        self._send_packet(json_directory)
-        
-        self._upload_directory_data(directory)
+        print(f"Uploading {self._path} .. .. ..")
+        with tqdm(unit="B", unit_scale=True) as pbar:
+            entries = self._upload_directory_data(self._path, pbar)
+        print(f"Sent {entries} entries.")
         self._outcome()
+    
+    def _receive_entry(self, pbar: tqdm) -> (Entry | None):
+        header_size = ENTRY_HEADER.unpack(self._receive_hashed(ENTRY_HEADER.size, pbar))[0]
+        if not header_size:
+            return None
+        return unpack_entry(self._receive_hashed(header_size, pbar))
       
-    def _download_directory_data(self, directory: list[tuple[int, str]]):
-        for data_size, file in directory:
-            file_name = self._get_file_name(file)
-            inner_folder = self._get_folder(file)
-            local_folder = os.path.join(self._destination, inner_folder.strip("./\\"))
-            save_as = os.path.join(local_folder, file_name)
-            os.makedirs(local_folder, exist_ok=True)
-            print(f"Downloading {file} - size: {data_size} .. .. ..")
-            self._download_data(data_size, save_as)  
+    def _download_directory_data(self, pbar: tqdm) -> int:
+        directories = []
+        entries = 0
+        with WriteBehind() as write_behind:
+            while True:
+                entry = self._receive_entry(pbar)
+                if entry is None:
+                    break
+                entries += 1
+                save_as = local_path(self._destination, entry.path)
+                if entry.type == DIRECTORY:
+                    os.makedirs(save_as, exist_ok=True)
+                    directories.append((save_as, entry))
+                elif entry.size <= SMALL_FILE_SIZE:
+                    write_behind.write(save_as, self._receive_hashed(entry.size, pbar), entry)
+                elif self._use_dedup:
+                    self._receive_deduplicated(save_as, pbar)
+                    restore_metadata(save_as, entry)
+                else:
+                    self._download_data(entry.size, save_as, pbar)
+                    restore_metadata(save_as, entry)
+        for save_as, entry in reversed(directories):
+            restore_metadata(save_as, entry)
+        return entries
 
     def download_directory(self):
+        self._negotiate_compression()
+        self._negotiate_digest()
         origin_path_list = self._split_path(self._path)
         json_path_packet = self._create_json_packet(origin_path_list)
         self._send_packet(json_path_packet)
         self._get_path_confirmation()
         
-        directory = self._get_json_packet()
-        
-        self._download_directory_data(directory)
+        print(f"Downloading {self._path} .. .. ..")
+        with tqdm(unit="B", unit_scale=True) as pbar:
+            entries = self._download_directory_data(pbar)
+        print(f"Received {entries} entries.")
         self._outcome()
-        print(f"The directory saved in '{self._destination}'")
\ No newline at end of file
+        print(f"The directory saved in '{self._destination}'")
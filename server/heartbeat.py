@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import math
+import struct
+import time
+from typing import Callable, Hashable
+
+
+HEARTBEAT_INTERVAL = 15.0
+SESSION_TIMEOUT = 45.0
+WHEEL_RESOLUTION = 1.0
+WHEEL_SLOTS = 64
+PING = struct.Struct("<d")
+
+
+class TimingWheel:
+    def __init__(self, resolution: float = WHEEL_RESOLUTION, slots: int = WHEEL_SLOTS) -> None:
+        self._resolution = resolution
+        self._slots: list[dict[Hashable, int]] = [{} for _ in range(slots)]
+        self._ticks: dict[Hashable, int] = {}
+        self._current = int(time.monotonic() / resolution)
+
+    @property
+    def resolution(self) -> float:
+        return self._resolution
+
+    def __len__(self) -> int:
+        return len(self._ticks)
+
+    def schedule(self, key: Hashable, when: float) -> None:
+        self.cancel(key)
+        tick = max(math.ceil(when / self._resolution), self._current + 1)
+        self._ticks[key] = tick
+        self._slots[tick % len(self._slots)][key] = tick
+
+    def cancel(self, key: Hashable) -> None:
+        tick = self._ticks.pop(key, None)
+        if tick is not None:
+            del self._slots[tick % len(self._slots)][key]
+
+    def advance(self, now: float) -> list[Hashable]:
+        target = int(now / self._resolution)
+        expired = []
+        for tick in range(max(self._current + 1, target - len(self._slots) + 1), target + 1):
+            slot = self._slots[tick % len(self._slots)]
+            due = [key for key, when in slot.items() if when <= target]
+            for key in due:
+                del slot[key]
+                del self._ticks[key]
+            expired.extend(due)
+        self._current = max(self._current, target)
+        return expired
+
+
+class Heartbeat:
+    def __init__(self, interval: float = HEARTBEAT_INTERVAL, timeout: float = SESSION_TIMEOUT,
+                 resolution: float = WHEEL_RESOLUTION) -> None:
+        if not 0 < interval < timeout:
+            raise ValueError(f"The heartbeat interval must be positive and shorter than the timeout, but got --> {interval}, {timeout}.")
+        self._interval = interval
+        self._timeout = timeout
+        self._wheel = TimingWheel(resolution)
+        self._last_seen: dict[Hashable, float] = {}
+        self._progress: dict[Hashable, int] = {}
+
+    @property
+    def resolution(self) -> float:
+        return self._wheel.resolution
+
+    def add(self, session: Hashable) -> None:
+        now = time.monotonic()
+        self._last_seen[session] = now
+        self._progress[session] = 0
+        self._wheel.schedule(session, now + self._interval)
+
+    def remove(self, session: Hashable) -> None:
+        self._wheel.cancel(session)
+        self._last_seen.pop(session, None)
+        self._progress.pop(session, None)
+
+    def seen(self, session: Hashable) -> None:
+        if session in self._last_seen:
+            self._last_seen[session] = time.monotonic()
+
+    def ping(self) -> bytes:
+        return PING.pack(time.monotonic())
+
+    def pong(self, session: Hashable, payload: bytes) -> (float | None):
+        if session not in self._last_seen or len(payload) != PING.size:
+            return None
+        return time.monotonic() - PING.unpack(payload)[0]
+
+    def check(self, progress: (Callable[[Hashable], int] | None) = None) -> tuple[list[Hashable], list[Hashable]]:
+        now = time.monotonic()
+        idle, dead = [], []
+        for session in self._wheel.advance(now):
+            if progress is not None:
+                position = progress(session)
+                if position > self._progress[session]:
+                    self._progress[session] = position
+                    self._last_seen[session] = now
+            last_seen = self._last_seen[session]
+            silent = now - last_seen
+            if silent >= self._timeout:
+                dead.append(session)
+                self.remove(session)
+                continue
+            if silent >= self._interval:
+                idle.append(session)
+                next_check = now + self._interval
+            else:
+                next_check = last_seen + self._interval
+            self._wheel.schedule(session, min(next_check, last_seen + self._timeout))
+        return idle, dead
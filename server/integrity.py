@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import hashlib
+import hmac
+import mmap
+from typing import Any, BinaryIO, Callable
+from exceptions import ProtocolError, UnsupportedDigest
+from tuning import format_size
+
+
+DEFAULT_ALGORITHM = "blake2b"
+NO_DIGEST = "none"
+HASH_BLOCK = 1024 * 1024
+
+ALGORITHMS: dict[str, Callable[[], Any]] = {
+    "blake2b": lambda: hashlib.blake2b(digest_size=32),
+    "blake2s": hashlib.blake2s,
+    "sha256": hashlib.sha256,
+    "sha512": hashlib.sha512,
+}
+
+
+class Digest:
+    def __init__(self, algorithm: str = DEFAULT_ALGORITHM) -> None:
+        if algorithm != NO_DIGEST and algorithm not in ALGORITHMS:
+            raise UnsupportedDigest(f"Unsupported digest algorithm --> {algorithm}. Available: {', '.join(ALGORITHMS)}, {NO_DIGEST}.")
+        self._algorithm = algorithm
+        self._hash = ALGORITHMS[algorithm]() if algorithm != NO_DIGEST else None
+        self._size = 0
+        self._verified = False
+
+    @property
+    def algorithm(self) -> str:
+        return self._algorithm
+
+    @property
+    def enabled(self) -> bool:
+        return self._hash is not None
+
+    def update(self, data: bytes) -> None:
+        if self._hash is not None:
+            self._hash.update(data)
+            self._size += len(data)
+
+    def update_file(self, file: BinaryIO, offset: int, size: int) -> None:
+        if self._hash is None or size <= 0:
+            return
+        with mmap.mmap(file.fileno(), offset + size, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            for start in range(offset, offset + size, HASH_BLOCK):
+                with view[start: min(offset + size, start + HASH_BLOCK)] as block:
+                    self.update(block)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest() if self._hash is not None else ""
+
+    def verify(self, peer_digest: str) -> None:
+        if self._hash is None:
+            return
+        if not isinstance(peer_digest, str) or not hmac.compare_digest(peer_digest, self.hexdigest()):
+            raise ProtocolError(f"Integrity check failed, {self._algorithm} digests differ --> local {self.hexdigest()}, remote {peer_digest}.")
+        self._verified = True
+
+    def report(self) -> str:
+        if self._hash is None:
+            return "Integrity not checked."
+        status = "verified" if self._verified else "not verified"
+        return f"Integrity {self._algorithm} ({status}): {self.hexdigest()} over {format_size(self._size)}."
+
+
+class DigestWriter:
+    def __init__(self, file: BinaryIO, digest: Digest) -> None:
+        self._file = file
+        self._digest = digest
+
+    def write(self, data: bytes) -> int:
+        self._digest.update(data)
+        return self._file.write(data)
@@ -20,6 +20,10 @@ class Interaction:
     def connections(self) -> Connections:
         return self._connections
     
+    @property
+    def server(self) -> ListenServer:
+        return self._server
+    
     @property
     def pwd(self) -> str:
         return self._pwd
@@ -53,9 +57,9 @@ class Interaction:
         prompt = f"\x1b[32m┌╶╶╶(\x1b[34mConnected \x1b[32m: {self._get_host()}\x1b[32m)--[\x1b[34m{self.pwd}\x1b[32m]\n└╶╶$\x1b[0m "
         return prompt
         
-    def _remove_target(self) -> None:
-        print(f"\x1b[31mConnection reset by peer {self.ip}\x1b[0m")
-        self._connections.remove_connection(self.ip)
+    def _remove_target(self, error: (BaseException | None) = None) -> None:
+        if self.target is not None:
+            self._server.drop(self.target, error)
         self.target = None 
         self.ip = None 
         
@@ -77,6 +81,48 @@ class Interaction:
                 except Exception as ex:
                     print(f"EXCEPTION 'command.connected_targets()' in {__name__} module --> {ex}")
             
+            case "fan" | "fanout":
+                try:
+                    command.fan_out()
+                except Exception as ex:
+                    print(f"EXCEPTION 'command.fan_out()' in {__name__} module --> {ex}")
+            
+            case "fuf" | "fanupload":
+                try:
+                    command.fan_upload()
+                except Exception as ex:
+                    print(f"EXCEPTION 'command.fan_upload()' in {__name__} module --> {ex}")
+            
+            case "tag":
+                try:
+                    command.tag()
+                except Exception as ex:
+                    print(f"EXCEPTION 'command.tag()' in {__name__} module --> {ex}")
+            
+            case "untag":
+                try:
+                    command.untag()
+                except Exception as ex:
+                    print(f"EXCEPTION 'command.untag()' in {__name__} module --> {ex}")
+            
+            case "stats":
+                try:
+                    command.stats()
+                except Exception as ex:
+                    print(f"EXCEPTION 'command.stats()' in {__name__} module --> {ex}")
+            
+            case "profile":
+                try:
+                    command.profile()
+                except Exception as ex:
+                    print(f"EXCEPTION 'command.profile()' in {__name__} module --> {ex}")
+            
+            case "record":
+                try:
+                    command.record()
+                except Exception as ex:
+                    print(f"EXCEPTION 'command.record()' in {__name__} module --> {ex}")
+            
             case "ct" | "connect":
                 try:
                     command.connect()
@@ -141,7 +187,7 @@ class Interaction:
                     command.execute(cli, self.target)
                 except socket.error as e:
                     print("Socket error occurred:", e)
-                    self._remove_target()
+                    self._remove_target(e)
                 except Exception as ex:
                        print(f"EXCEPTION 'command.execute(cli, self.target)' in {__name__} module --> {ex}")
                   
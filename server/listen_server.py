@@ -1,41 +1,363 @@
 #!/usr/bin/env python3
 
 
-import socket 
-from connections import Connections
+import json
+import os
+import socket
+import queue
+import selectors
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+from chunck_store import CHUNCK_STORE_DIRECTORY, CHUNCK_STORE_SIZE, ChunckStore
+from connections import Connections, Identity, Session
+from exceptions import ClientIsNotConnected, ProtocolError
+from heartbeat import Heartbeat
+from multiplex import Multiplexer
+from output import OUTPUT_LIMIT
+from profiler import Profiler
+from protocol import Frame, FrameType
+from recorder import Recorder
+from tuning import tune_socket
 
 
-Host = str 
+Host = str
 Port = int
+Operation = Callable[..., Any]
+RECV_FLAGS = getattr(socket, "MSG_DONTWAIT", 0)
+BACKLOG = 1024
+RETRY_AFTER = 5.0
+RETRY_SPREAD = 30.0
+INTERRUPTED_TTL = 24 * 60 * 60
+INTERRUPTED_LIMIT = 1024
+INTERRUPTIONS = (ConnectionError, TimeoutError, ClientIsNotConnected)
 
 
 class ListenServer:
-    def __init__(self, connections: Connections, host: Host = "192.168.1.45", port: Port = 8080) -> None:
-        self._host = host 
-        self._port = port 
+    def __init__(self, connections: Connections, host: Host = "192.168.1.45", port: Port = 8080, workers: int = 64,
+                 heartbeat: (Heartbeat | None) = None, backlog: int = BACKLOG, retry_after: float = RETRY_AFTER,
+                 retry_spread: float = RETRY_SPREAD, record_directory: (str | None) = None, record_limit: (int | None) = None,
+                 chunck_store_directory: (str | None) = CHUNCK_STORE_DIRECTORY, chunck_store_size: int = CHUNCK_STORE_SIZE,
+                 output_limit: int = OUTPUT_LIMIT, interrupted_ttl: float = INTERRUPTED_TTL,
+                 interrupted_limit: int = INTERRUPTED_LIMIT) -> None:
+        self._host = host
+        self._port = port
+        self._backlog = backlog
+        self._retry_hint = json.dumps({"after": retry_after, "spread": retry_spread}).encode("utf-8")
         self._connections = connections
+        self._selector = selectors.DefaultSelector()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="session")
+        self._wakeup_receiver, self._wakeup_sender = socket.socketpair()
+        self._wakeup_receiver.setblocking(False)
+        self._wakeup_sender.setblocking(False)
+        self._calls: queue.SimpleQueue[Callable[[], None]] = queue.SimpleQueue()
+        self._interrupted: dict[Identity, tuple[float, list[tuple[Operation, tuple]]]] = {}
+        self._interrupted_ttl = interrupted_ttl
+        self._interrupted_limit = interrupted_limit
+        self._writing: set[socket.socket] = set()
+        self._heartbeat = heartbeat if heartbeat is not None else Heartbeat()
+        self._record_directory = record_directory
+        self._record_limit = record_limit
+        self._chunck_store_directory = chunck_store_directory
+        self._chunck_store_size = chunck_store_size
+        self._chunck_store: (ChunckStore | None) = None
+        self._output_limit = output_limit
+        self._profiler = Profiler()
+        self._running = False
+
+    def _call_soon(self, callback: Callable[[], None]) -> None:
+        self._calls.put(callback)
+        try:
+            self._wakeup_sender.send(b"\0")
+        except OSError:
+            pass
+
+    def _run_calls(self, wakeup: socket.socket) -> None:
+        try:
+            while wakeup.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                callback = self._calls.get_nowait()
+            except queue.Empty:
+                return
+            callback()
+
+    def _watch(self, conn: socket.socket) -> None:
+        self._selector.register(conn, selectors.EVENT_READ, self._read_session)
+
+    def _watch_writable(self, conn: socket.socket, writable: bool) -> None:
+        if writable == (conn in self._writing):
+            return
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if writable else selectors.EVENT_READ
+        try:
+            self._selector.modify(conn, events, self._read_session)
+        except (KeyError, ValueError):
+            return
+        if writable:
+            self._writing.add(conn)
+        else:
+            self._writing.discard(conn)
+
+    def _unwatch(self, conn: socket.socket) -> None:
+        self._writing.discard(conn)
+        try:
+            self._selector.unregister(conn)
+        except (KeyError, ValueError):
+            pass
+
+    def _drop_session(self, conn: socket.socket, error: (BaseException | None) = None) -> None:
+        self._unwatch(conn)
+        self._heartbeat.remove(conn)
+        session = self._connections.remove_connection_by_socket(conn)
+        if session is not None:
+            session.multiplexer.close(error)
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        conn.close()
+        if session is not None:
+            print(f"\x1b[31mConnection reset by peer {session.label}\x1b[0m")
+
+    def drop(self, conn: socket.socket, error: (BaseException | None) = None) -> None:
+        self._call_soon(lambda: self._drop_session(conn, error))
+
+    def _read_session(self, conn: socket.socket) -> None:
+        session = self._connections.get_session_by_socket(conn)
+        if session is None:
+            self._drop_session(conn)
+            return
+        try:
+            received = session.multiplexer.receive(RECV_FLAGS)
+        except BlockingIOError:
+            return
+        except (OSError, ProtocolError) as ex:
+            self._drop_session(conn, ex)
+            return
+        except Exception as ex:
+            print(f"EXCEPTION in the session {session.label} --> {ex}")
+            self._drop_session(conn, ex)
+            return
+        if not received:
+            self._drop_session(conn)
+            return
+        self._heartbeat.seen(conn)
+        if session.multiplexer.blocked:
+            self._watch_writable(conn, True)
+
+    def _write_session(self, conn: socket.socket) -> None:
+        session = self._connections.get_session_by_socket(conn)
+        if session is None:
+            self._drop_session(conn)
+            return
+        try:
+            flushed = session.multiplexer.flush_control()
+        except OSError as ex:
+            self._drop_session(conn, ex)
+            return
+        if flushed:
+            self._watch_writable(conn, False)
+
+    def _send_progress(self, conn: socket.socket) -> int:
+        session = self._connections.get_session_by_socket(conn)
+        return session.multiplexer.progress if session is not None else 0
+
+    def _check_sessions(self) -> None:
+        idle, dead = self._heartbeat.check(self._send_progress)
+        for conn in dead:
+            session = self._connections.get_session_by_socket(conn)
+            if session is not None:
+                print(f"\x1b[31mThe session {session.label} did not answer the heartbeat and has been closed.\x1b[0m")
+            self._drop_session(conn, ConnectionAbortedError("The session timed out."))
+        for conn in idle:
+            session = self._connections.get_session_by_socket(conn)
+            if session is None:
+                continue
+            try:
+                flushed = session.multiplexer.try_send_frame(FrameType.PING, self._heartbeat.ping())
+            except OSError as ex:
+                self._drop_session(conn, ex)
+                continue
+            if not flushed:
+                self._watch_writable(conn, True)
+
+    def _control(self, conn: socket.socket, frame: Frame) -> None:
+        session = self._connections.get_session_by_socket(conn)
+        if session is None:
+            return
+        if frame.type == FrameType.PONG:
+            sample = self._heartbeat.pong(conn, frame.payload)
+            if sample is not None:
+                session.record_rtt(sample)
+            return
+        if frame.type != FrameType.HELLO:
+            return
+        try:
+            hello = json.loads(frame.payload)
+        except ValueError:
+            return
+        if not isinstance(hello, dict):
+            return
+        self._connections.describe(session, str(hello.get("hostname", "")), str(hello.get("platform", "")), str(hello.get("id", "")))
+        if session.identity is not None:
+            self._expire_interrupted()
+            _, operations = self._interrupted.pop(session.identity, (0.0, []))
+            for operation, args in operations:
+                self._resume(session, operation, args)
 
     def _handle_connection(self, conn: socket.socket, addr: tuple[str, int]) -> None:
-        self._connections.add_connection(conn, addr)
-        print(f"\x1b[32mNew client connected --> \x1b[34m{addr[0]}\x1b[32m:\x1b[34m{addr[1]}.\n\x1b[0mPress 'Enter' .. .. .. ")
-        
+        tune_socket(conn)
+        conn.setblocking(True)
+        multiplexer = Multiplexer(conn, on_control=lambda frame: self._control(conn, frame))
+        session = self._connections.add_connection(conn, addr, multiplexer)
+        self._heartbeat.add(conn)
+        self._watch(conn)
+        if self._record_directory is not None:
+            self.start_recording(session, self._record_directory, self._record_limit)
+        print(f"\x1b[32mNew client connected --> \x1b[34m{addr[0]}\x1b[32m:\x1b[34m{addr[1]}\x1b[32m, session \x1b[34m{session.id}\x1b[32m.\n\x1b[0mPress 'Enter' .. .. .. ")
+
+    def start_recording(self, session: Session, directory: str, payload_limit: (int | None) = None) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{session.id}_{session.ip.replace(':', '-')}_{session.port}_{int(time.time())}.rec")
+        meta = {"session": session.id, "ip": session.ip, "port": session.port, "hostname": session.hostname, "platform": session.platform}
+        session.multiplexer.record(Recorder(path, meta, payload_limit))
+        return path
+
+    def stop_recording(self, session: Session) -> (str | None):
+        recorder = session.multiplexer.recorder
+        session.multiplexer.record(None)
+        return recorder.path if recorder is not None else None
+
+    def attach(self, conn: socket.socket, addr: tuple[str, int]) -> None:
+        self._call_soon(lambda: self._handle_connection(conn, addr))
+
+    def _accept(self, server: socket.socket) -> None:
+        while True:
+            try:
+                conn, addr = server.accept()
+            except BlockingIOError:
+                return
+            self._handle_connection(conn, addr)
+
     def create_server(self) -> None:
         self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if os.name != "nt":
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        tune_socket(self._server)
         self._server.bind((self._host, self._port))
-    
-    @property 
+
+    @property
     def server(self) -> socket.socket:
         return self._server
+
+    @property
+    def profiler(self) -> Profiler:
+        return self._profiler
+
+    @property
+    def output_limit(self) -> int:
+        return self._output_limit
+
+    @property
+    def chunck_store(self) -> (ChunckStore | None):
+        if self._chunck_store is None and self._chunck_store_directory is not None:
+            self._chunck_store = ChunckStore(self._chunck_store_directory, self._chunck_store_size)
+        return self._chunck_store
+
+    def submit(self, conn: socket.socket, operation: Operation, *args: Any, resumable: bool = False) -> Future:
+        session = self._connections.get_session_by_socket(conn)
+        if session is None:
+            raise ClientIsNotConnected("The client is no longer connected.")
+        future = self._executor.submit(self._profiler.run, operation, session.multiplexer, *args)
+        if resumable:
+            future.add_done_callback(lambda done: self._check_interrupted(done, session, operation, args))
+        return future
+    
+    def _is_interruption(self, error: (BaseException | None), conn: socket.socket) -> bool:
+        if isinstance(error, INTERRUPTIONS):
+            return True
+        return isinstance(error, OSError) and self._connections.get_session_by_socket(conn) is None
+    
+    def _check_interrupted(self, future: Future, session: Session, operation: Operation, args: tuple) -> None:
+        if future.cancelled() or not self._is_interruption(future.exception(), session.sock):
+            return
+        self._call_soon(lambda: self._interrupt(session, operation, args))
+    
+    def _interrupt(self, session: Session, operation: Operation, args: tuple) -> None:
+        identity = session.identity
+        if identity is None:
+            print(f"\x1b[33mThe transfer with {session.label} was interrupted and will not resume, the client did not send its ID.\x1b[0m")
+            return
+        current = self._connections.get_latest_by_identity(identity)
+        if current is not None and current is not session:
+            self._resume(current, operation, args)
+            return
+        _, operations = self._interrupted.pop(identity, (0.0, []))
+        operations.append((operation, args))
+        self._interrupted[identity] = (time.monotonic(), operations)
+        self._expire_interrupted()
+        print(f"\x1b[33mThe transfer with {session.label} was interrupted, it will resume when {session.hostname} reconnects.\x1b[0m")
+
+    def _expire_interrupted(self) -> None:
+        expired = time.monotonic() - self._interrupted_ttl
+        for identity, (interrupted_at, operations) in list(self._interrupted.items()):
+            if interrupted_at > expired and len(self._interrupted) <= self._interrupted_limit:
+                return
+            del self._interrupted[identity]
+            reason = "it did not reconnect in time" if interrupted_at <= expired else "too many clients are waiting to resume"
+            print(f"\x1b[33m{len(operations)} interrupted transfer(s) of the client {identity} will not resume, {reason}.\x1b[0m")
     
+    def _report_resumed(self, session: Session, future: Future) -> None:
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None and not self._is_interruption(error, session.sock):
+            print(f"EXCEPTION in the resumed transfer with {session.label} --> {error}")
+    
+    def _resume(self, session: Session, operation: Operation, args: tuple) -> None:
+        print(f"\x1b[32mResuming an interrupted transfer with {session.label}.\x1b[0m")
+        future = self.submit(session.sock, operation, *args, resumable=True)
+        future.add_done_callback(lambda done: self._report_resumed(session, done))
+
+    def _stop(self) -> None:
+        self._running = False
+
+    def _send_retry_hints(self) -> None:
+        for session in self._connections.sessions():
+            try:
+                session.multiplexer.try_send_frame(FrameType.RETRY, self._retry_hint)
+                session.sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            session.sock.close()
+
+    def close(self) -> None:
+        self._call_soon(self._stop)
+
     def listen(self) -> None:
         self.create_server()
-        self._server.listen()
+        self._server.listen(self._backlog)
+        self._server.setblocking(False)
+        self._selector.register(self._server, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wakeup_receiver, selectors.EVENT_READ, self._run_calls)
+        self._running = True
         print(f"The server is listening on {self._host}:{self._port}.\nPress 'Enter' .. .. .. ")
         try:
-            while True:
-                conn, addr = self._server.accept()
-                self._handle_connection(conn, addr)
-        except ConnectionAbortedError as ex:
+            while self._running:
+                for key, events in self._selector.select(self._heartbeat.resolution):
+                    if events & selectors.EVENT_WRITE:
+                        self._write_session(key.fileobj)
+                    if events & selectors.EVENT_READ and key.fileobj.fileno() != -1:
+                        key.data(key.fileobj)
+                self._check_sessions()
             print(f"The server has been disconnected !")
         except Exception as ex:
-            print(f"EXCEPTION in listen_server --> {ex}")       
\ No newline at end of file
+            print(f"EXCEPTION in listen_server --> {ex}")
+        finally:
+            self._send_retry_hints()
+            self._selector.close()
+            self._server.close()
+            self._executor.shutdown(wait=False, cancel_futures=True)
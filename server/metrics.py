@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import bisect
+import os
+import threading
+from typing import Iterable
+
+
+RTT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+THROUGHPUT_BUCKETS = tuple(float(2 ** exponent) for exponent in range(16, 34, 2))
+HISTOGRAMS = {
+    "command_rtt_seconds": RTT_BUCKETS,
+    "heartbeat_rtt_seconds": RTT_BUCKETS,
+    "transfer_throughput_bytes": THROUGHPUT_BUCKETS,
+}
+SOCKET_COUNTERS = ("bytes_sent", "bytes_received", "send_calls", "recv_calls", "send_blocked_seconds")
+COUNTERS = SOCKET_COUNTERS + ("commands", "command_errors", "transfers", "transfer_errors", "transfer_bytes", "transfer_seconds",
+                              "chuncks_sent", "chuncks_received", "send_wait_seconds", "recv_wait_seconds")
+HELP = {
+    "bytes_sent": "Bytes written to the session sockets.",
+    "bytes_received": "Bytes read from the session sockets.",
+    "send_calls": "Socket send, sendall and sendfile calls.",
+    "recv_calls": "Socket recv calls.",
+    "send_blocked_seconds": "Time spent inside socket send calls.",
+    "commands": "Commands answered by the clients.",
+    "command_errors": "Commands that failed.",
+    "transfers": "File and directory transfers that completed.",
+    "transfer_errors": "File and directory transfers that failed.",
+    "transfer_bytes": "Payload bytes moved by completed transfers.",
+    "transfer_seconds": "Duration of completed transfers.",
+    "chuncks_sent": "Data chuncks sent by transfers.",
+    "chuncks_received": "Data chuncks received by transfers.",
+    "send_wait_seconds": "Time transfers waited to send, including flow control.",
+    "recv_wait_seconds": "Time transfers waited for data from the client.",
+    "command_rtt_seconds": "Time from sending a command to its last output frame.",
+    "heartbeat_rtt_seconds": "Round-trip time of the heartbeat pings.",
+    "transfer_throughput_bytes": "Throughput of completed transfers in bytes per second.",
+}
+PROMETHEUS_PREFIX = "reverse_shell_"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def copy(self) -> Histogram:
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        return histogram
+
+    def quantile(self, q: float) -> (float | None):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    def __init__(self, parent: (Metrics | None) = None) -> None:
+        self._parent = parent
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._histograms: dict[str, Histogram] = {}
+
+    def add(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        if self._parent is not None:
+            self._parent.add(name, value)
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(HISTOGRAMS[name])
+            histogram.observe(value)
+        if self._parent is not None:
+            self._parent.observe(name, value)
+
+    def counters(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def histograms(self) -> dict[str, Histogram]:
+        with self._lock:
+            return {name: histogram.copy() for name, histogram in self._histograms.items()}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def to_prometheus(series: Iterable[tuple[dict[str, str], dict[str, float], dict[str, Histogram]]]) -> str:
+    series = list(series)
+    lines = []
+    for name in COUNTERS:
+        metric = f"{PROMETHEUS_PREFIX}{name}_total"
+        lines += [f"# HELP {metric} {HELP[name]}", f"# TYPE {metric} counter"]
+        lines += [f"{metric}{_format_labels(labels)} {_format_value(counters.get(name, 0))}" for labels, counters, _ in series]
+    for name in HISTOGRAMS:
+        metric = f"{PROMETHEUS_PREFIX}{name}"
+        lines += [f"# HELP {metric} {HELP[name]}", f"# TYPE {metric} histogram"]
+        for labels, _, histograms in series:
+            histogram = histograms.get(name, Histogram(HISTOGRAMS[name]))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_format_labels(dict(labels, le=_format_value(bound)))} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str, series: Iterable[tuple[dict[str, str], dict[str, float], dict[str, Histogram]]]) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as file:
+        file.write(to_prometheus(series))
+    os.replace(temporary, path)
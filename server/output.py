@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import codecs
+import sys
+
+
+OUTPUT_LIMIT = 1024 * 1024
+
+
+class CommandOutput:
+    def __init__(self, limit: int = OUTPUT_LIMIT, echo: bool = True) -> None:
+        self._limit = limit
+        self._echo = echo
+        self._stdout = bytearray()
+        self._stderr = bytearray()
+        self._decoders = {
+            False: codecs.getincrementaldecoder("utf-8")("replace"),
+            True: codecs.getincrementaldecoder("utf-8")("replace"),
+        }
+        self._dropped = 0
+        self.exit_code: (int | None) = None
+
+    @property
+    def stdout(self) -> bytes:
+        return bytes(self._stdout)
+
+    @property
+    def stderr(self) -> bytes:
+        return bytes(self._stderr)
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    def _print(self, text: str, stderr: bool) -> None:
+        if not text:
+            return
+        stream = sys.stderr if stderr else sys.stdout
+        stream.write(text)
+        stream.flush()
+
+    def write(self, data: bytes, stderr: bool = False) -> None:
+        if self._echo:
+            self._print(self._decoders[stderr].decode(data), stderr)
+        room = max(self._limit - len(self._stdout) - len(self._stderr), 0)
+        kept = data[:room]
+        (self._stderr if stderr else self._stdout).extend(kept)
+        self._dropped += len(data) - len(kept)
+
+    def finish(self, message: str = "") -> None:
+        if self._echo:
+            for stderr, decoder in self._decoders.items():
+                self._print(decoder.decode(b"", True), stderr)
+            if message:
+                print(message)
+            if self.exit_code:
+                print(f"Exit code {self.exit_code}.")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator
+from archive import FILE, Entry, restore_metadata
+
+
+WORKERS = 8
+SMALL_FILE_SIZE = 1024 * 1024
+MAX_PENDING = 64
+
+
+def read_file(path: str, data_size: int) -> bytes:
+    with open(path, "rb") as f:
+        data = f.read(data_size)
+    if len(data) < data_size:
+        raise EOFError(f"The file '{path}' was truncated while being read.")
+    return data
+
+
+def write_file(path: str, data: bytes, entry: (Entry | None) = None) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if entry is not None:
+        restore_metadata(path, entry)
+
+
+class ReadAhead:
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="read-ahead")
+        self._max_pending = max_pending
+
+    def __enter__(self) -> ReadAhead:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _schedule(self, entry: Entry, path: str) -> (Future | None):
+        if entry.type != FILE or entry.size > SMALL_FILE_SIZE:
+            return None
+        return self._executor.submit(read_file, path, entry.size)
+
+    def read(self, entries: Iterable[tuple[Entry, str]]) -> Iterator[tuple[Entry, str, bytes | None]]:
+        pending: deque[tuple[Entry, str, Future | None]] = deque()
+        for entry, path in entries:
+            pending.append((entry, path, self._schedule(entry, path)))
+            if len(pending) >= self._max_pending:
+                entry, path, future = pending.popleft()
+                yield entry, path, future.result() if future is not None else None
+        while pending:
+            entry, path, future = pending.popleft()
+            yield entry, path, future.result() if future is not None else None
+
+
+class WriteBehind:
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="write-behind")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._errors: list[BaseException] = []
+
+    def __enter__(self) -> WriteBehind:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._executor.shutdown(wait=True)
+        if self._errors and exc_info[0] is None:
+            raise self._errors[0]
+
+    def _done(self, future: Future) -> None:
+        self._slots.release()
+        error = future.exception()
+        if error is not None:
+            self._errors.append(error)
+
+    def write(self, path: str, data: bytes, entry: (Entry | None) = None) -> None:
+        if self._errors:
+            raise self._errors[0]
+        self._slots.acquire()
+        future = self._executor.submit(write_file, path, data, entry)
+        future.add_done_callback(self._done)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable
+
+
+PROFILE_OPERATIONS = 10
+PROFILE_TIMEOUT = 600.0
+PROFILE_LINES = 30
+MEMORY_LINES = 15
+SORT_KEY = "cumulative"
+MEMORY_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, pstats.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._running = threading.Lock()
+        self._finished = threading.Event()
+        self._finished.set()
+        self._remaining = 0
+        self._profiled = 0
+        self._started = 0.0
+        self._stats: (pstats.Stats | None) = None
+        self._memory = False
+        self._owns_tracemalloc = False
+        self._baseline: (tracemalloc.Snapshot | None) = None
+        self._on_finish: (Callable[[str], None] | None) = None
+        self._report: (str | None) = None
+        self._last_stats: (pstats.Stats | None) = None
+
+    @property
+    def active(self) -> bool:
+        return not self._finished.is_set()
+
+    @property
+    def report(self) -> (str | None):
+        return self._report
+
+    def start(self, operations: int = PROFILE_OPERATIONS, memory: bool = False, on_finish: (Callable[[str], None] | None) = None) -> None:
+        if operations < 1:
+            raise ValueError(f"Expected a positive number of operations to profile. But got --> {operations}")
+        self.stop()
+        with self._lock:
+            self._remaining = operations
+            self._profiled = 0
+            self._started = time.perf_counter()
+            self._stats = None
+            self._memory = memory
+            self._on_finish = on_finish
+            if memory:
+                self._owns_tracemalloc = not tracemalloc.is_tracing()
+                if self._owns_tracemalloc:
+                    tracemalloc.start()
+                self._baseline = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+            self._finished.clear()
+
+    def stop(self) -> (str | None):
+        with self._lock:
+            if self._finished.is_set():
+                return None
+            self._remaining = 0
+        return self._finish()
+
+    def wait(self, timeout: (float | None) = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def run(self, operation: Callable[..., Any], *args: Any) -> Any:
+        if not self._remaining or not self._running.acquire(blocking=False):
+            return operation(*args)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                return operation(*args)
+            finally:
+                profile.disable()
+        finally:
+            self._running.release()
+            self._collect(profile)
+
+    def _collect(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            if self._remaining <= 0:
+                return
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self._profiled += 1
+            self._remaining -= 1
+            if self._remaining:
+                return
+        self._finish()
+
+    def _memory_report(self) -> str:
+        snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        lines = [f"Traced memory: {current / 1024:.1f} KiB now, {peak / 1024:.1f} KiB at the peak. Largest changes since the start:"]
+        lines.extend(f"  {difference}" for difference in snapshot.compare_to(self._baseline, "lineno")[:MEMORY_LINES])
+        return "\n".join(lines)
+
+    def _format(self) -> str:
+        elapsed = time.perf_counter() - self._started
+        memory = self._memory_report() if self._memory else None
+        lines = [f"Profiled {self._profiled} operation(s) over {elapsed:.2f}s."]
+        if self._stats is not None:
+            stream = io.StringIO()
+            self._stats.stream = stream
+            self._stats.strip_dirs().sort_stats(SORT_KEY).print_stats(PROFILE_LINES)
+            lines.append(stream.getvalue().strip("\n"))
+        if memory is not None:
+            lines.append(memory)
+        return "\n".join(lines) + "\n"
+
+    def _finish(self) -> (str | None):
+        with self._lock:
+            if self._finished.is_set():
+                return self._report
+            report = self._format()
+            self._report = report
+            self._last_stats = self._stats
+            self._stats = None
+            self._baseline = None
+            on_finish, self._on_finish = self._on_finish, None
+            self._finished.set()
+        if on_finish is not None:
+            on_finish(report)
+        return report
+
+    def dump(self, path: str) -> None:
+        if self._last_stats is None:
+            raise ValueError("No operation has been profiled yet.")
+        self._last_stats.dump_stats(path)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import json
+import struct
+import threading
+import time
+from typing import Any, BinaryIO, Iterator, NamedTuple
+from exceptions import ProtocolError
+
+
+MAGIC = b"RSREC"
+VERSION = 1
+META_SIZE = struct.Struct("<I")
+RECORD = struct.Struct("<QBBHIQI")
+INCOMING = 0
+OUTGOING = 1
+BUFFER_SIZE = 1024 * 1024
+
+
+class Record(NamedTuple):
+    time: float
+    direction: int
+    type: int
+    flags: int
+    request_id: int
+    length: int
+    payload: bytes
+
+
+class Recorder:
+    def __init__(self, path: str, meta: (dict[str, Any] | None) = None, payload_limit: (int | None) = None) -> None:
+        self._path = path
+        self._payload_limit = payload_limit
+        self._lock = threading.Lock()
+        self._file = open(path, "wb", buffering=BUFFER_SIZE)
+        self._started = time.monotonic_ns()
+        header = json.dumps(dict(meta or {}, started=time.time(), payload_limit=payload_limit)).encode("utf-8")
+        self._file.write(MAGIC + bytes([VERSION]) + META_SIZE.pack(len(header)) + header)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def payload_limit(self) -> (int | None):
+        return self._payload_limit
+
+    def record(self, direction: int, frame_type: int, flags: int, request_id: int, payload: bytes, length: (int | None) = None) -> None:
+        if length is None:
+            length = len(payload)
+        if self._payload_limit is not None:
+            payload = payload[:self._payload_limit]
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(RECORD.pack(time.monotonic_ns() - self._started, direction, frame_type, flags, request_id, length, len(payload)))
+            self._file.write(payload)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _read_exact(file: BinaryIO, size: int) -> bytes:
+    data = file.read(size)
+    if len(data) != size:
+        raise ProtocolError("The recording ends in the middle of a record.")
+    return data
+
+
+def _read_records(file: BinaryIO) -> Iterator[Record]:
+    with file:
+        while header := file.read(RECORD.size):
+            if len(header) != RECORD.size:
+                return
+            elapsed, direction, frame_type, flags, request_id, length, stored = RECORD.unpack(header)
+            try:
+                payload = _read_exact(file, stored)
+            except ProtocolError:
+                return
+            yield Record(elapsed / 1e9, direction, frame_type, flags, request_id, length, payload)
+
+
+def open_recording(path: str) -> tuple[dict[str, Any], Iterator[Record]]:
+    file = open(path, "rb")
+    try:
+        if _read_exact(file, len(MAGIC) + 1) != MAGIC + bytes([VERSION]):
+            raise ProtocolError(f"Not a session recording of version {VERSION} --> {path}")
+        meta = json.loads(_read_exact(file, META_SIZE.unpack(_read_exact(file, META_SIZE.size))[0]))
+    except BaseException:
+        file.close()
+        raise
+    return meta, _read_records(file)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+from typing import BinaryIO
+
+
+CHECKPOINT_INTERVAL = 64 * 1024 * 1024
+PART_SUFFIX = ".part"
+CHECKPOINT_SUFFIX = ".part.json"
+READ_SIZE = 1024 * 1024
+
+
+def transfer_id(path: str) -> str:
+    info = os.stat(path)
+    key = f"{os.path.abspath(path)}\0{info.st_size}\0{info.st_mtime_ns}".encode("utf-8")
+    return hashlib.blake2b(key, digest_size=16).hexdigest()
+
+
+def chain_digest(digest: bytes, segment_digest: bytes) -> bytes:
+    return hashlib.blake2b(digest + segment_digest, digest_size=32).digest()
+
+
+def prefix_digest(path: str, offset: int) -> str:
+    digest = b""
+    with open(path, "rb") as f:
+        for _ in range(offset // CHECKPOINT_INTERVAL):
+            segment = hashlib.blake2b(digest_size=32)
+            rest_of_segment = CHECKPOINT_INTERVAL
+            while rest_of_segment > 0:
+                data = f.read(min(rest_of_segment, READ_SIZE))
+                if not data:
+                    return ""
+                segment.update(data)
+                rest_of_segment -= len(data)
+            digest = chain_digest(digest, segment.digest())
+    return digest.hex()
+
+
+class PartialFile:
+    def __init__(self, save_as: str, transfer_id: str, data_size: int) -> None:
+        self._save_as = save_as
+        self._part = save_as + PART_SUFFIX
+        self._checkpoint = save_as + CHECKPOINT_SUFFIX
+        self._transfer_id = transfer_id
+        self._data_size = data_size
+        self._resumable = data_size > CHECKPOINT_INTERVAL
+        self._file: (BinaryIO | None) = None
+        self._offset = 0
+        self._digest = b""
+        self._segment = hashlib.blake2b(digest_size=32)
+
+    def _load_checkpoint(self) -> tuple[int, bytes]:
+        try:
+            with open(self._checkpoint, "r") as f:
+                checkpoint = json.load(f)
+            offset = checkpoint["offset"]
+            digest = bytes.fromhex(checkpoint["digest"])
+            if checkpoint["transfer_id"] != self._transfer_id or checkpoint["data_size"] != self._data_size:
+                return 0, b""
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, b""
+        if offset % CHECKPOINT_INTERVAL or not 0 <= offset <= self._data_size:
+            return 0, b""
+        if not os.path.isfile(self._part) or os.path.getsize(self._part) < offset:
+            return 0, b""
+        return offset, digest
+
+    def checkpoint(self) -> tuple[int, str]:
+        if not self._resumable:
+            return 0, ""
+        offset, digest = self._load_checkpoint()
+        return offset, digest.hex()
+
+    def _save_checkpoint(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        checkpoint = {
+            "transfer_id": self._transfer_id,
+            "data_size": self._data_size,
+            "offset": self._offset,
+            "digest": self._digest.hex(),
+        }
+        with open(self._checkpoint + ".tmp", "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(self._checkpoint + ".tmp", self._checkpoint)
+
+    def open(self, offset: int) -> PartialFile:
+        if offset:
+            self._offset, self._digest = self._load_checkpoint()
+            if self._offset != offset:
+                raise ValueError(f"No checkpoint at offset {offset} for '{self._save_as}'.")
+            self._file = open(self._part, "r+b")
+            self._file.truncate(offset)
+            self._file.seek(offset)
+        else:
+            self._file = open(self._part, "wb")
+        return self
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        if not self._resumable:
+            self._offset += len(data)
+            return
+        view = memoryview(data)
+        while view:
+            rest_of_segment = CHECKPOINT_INTERVAL - self._offset % CHECKPOINT_INTERVAL
+            piece = view[:rest_of_segment]
+            self._segment.update(piece)
+            self._offset += len(piece)
+            view = view[len(piece):]
+            if len(piece) == rest_of_segment:
+                self._digest = chain_digest(self._digest, self._segment.digest())
+                self._segment = hashlib.blake2b(digest_size=32)
+                self._save_checkpoint()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self) -> None:
+        self.close()
+        os.replace(self._part, self._save_as)
+        if os.path.exists(self._checkpoint):
+            os.remove(self._checkpoint)
+
+    def __enter__(self) -> PartialFile:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import argparse
+import contextlib
+import json
+import os
+import platform
+import queue
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(ROOT, "server")
+CLIENT_DIR = os.path.join(ROOT, "client")
+sys.path.insert(0, SERVER_DIR)
+
+from connections import Connections
+from execute import Execute
+from listen_server import ListenServer
+
+
+SIZES = "1M,16M,128M"
+ROUNDS = 200
+REPEAT = 3
+TREE_FILES = 2000
+TREE_FILE_SIZE = 4096
+FILES_PER_DIRECTORY = 100
+THRESHOLD = 0.10
+CONNECT_TIMEOUT = 10.0
+PROXY_CHUNCK_SIZE = 64 * 1024
+UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+CLIENT_BOOTSTRAP = """
+import os, socket, sys, time
+sys.path.insert(0, sys.argv[1])
+os.chdir(sys.argv[2])
+from interaction import Interaction
+from tuning import tune_socket
+if sys.argv[3] == "fd":
+    sock = socket.socket(fileno=int(sys.argv[4]))
+else:
+    deadline = time.monotonic() + float(sys.argv[5])
+    while True:
+        try:
+            sock = socket.create_connection(("127.0.0.1", int(sys.argv[4])))
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+tune_socket(sock)
+Interaction(sock).interact()
+"""
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper().removesuffix("B").removesuffix("I")
+    unit = text[-1] if text[-1] in UNITS else ""
+    return int(float(text[:len(text) - len(unit)]) * UNITS[unit])
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(samples: list[float], unit: str, better: str) -> dict[str, Any]:
+    ordered = sorted(samples)
+    return {
+        "value": statistics.median(ordered),
+        "unit": unit,
+        "better": better,
+        "mean": statistics.fmean(ordered),
+        "min": ordered[0],
+        "max": ordered[-1],
+        "p90": ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))],
+        "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        "samples": len(ordered),
+    }
+
+
+class ShapedLink:
+    def __init__(self, upstream_port: int, rate: (float | None) = None, delay: float = 0.0) -> None:
+        self._upstream_port = upstream_port
+        self._rate = rate
+        self._delay = delay
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self._listener.getsockname()[1]
+
+    def start(self) -> None:
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self) -> None:
+        downstream, _ = self._listener.accept()
+        self._listener.close()
+        upstream = socket.create_connection(("127.0.0.1", self._upstream_port))
+        for source, sink in ((downstream, upstream), (upstream, downstream)):
+            pending: queue.SimpleQueue[tuple[float, bytes] | None] = queue.SimpleQueue()
+            threading.Thread(target=self._read, args=(source, pending), daemon=True).start()
+            threading.Thread(target=self._write, args=(sink, pending), daemon=True).start()
+
+    def _read(self, source: socket.socket, pending: queue.SimpleQueue) -> None:
+        try:
+            while data := source.recv(PROXY_CHUNCK_SIZE):
+                pending.put((time.monotonic() + self._delay, data))
+        except OSError:
+            pass
+        pending.put(None)
+
+    def _write(self, sink: socket.socket, pending: queue.SimpleQueue) -> None:
+        allowed = time.monotonic()
+        try:
+            while (item := pending.get()) is not None:
+                deliver, data = item
+                if self._rate:
+                    allowed = max(allowed, deliver) + len(data) / self._rate
+                    deliver = allowed
+                delay = deliver - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                sink.sendall(data)
+            sink.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+class Bench:
+    def __init__(self, link: str, rate: (float | None), delay: float, compression: (str | None), digest: (str | None)) -> None:
+        self._link = link
+        self._rate = rate
+        self._delay = delay
+        self._compression = compression
+        self._digest = digest
+        self._workdir = tempfile.mkdtemp(prefix="bench_")
+        self._local = os.path.join(self._workdir, "server")
+        self._remote = os.path.join(self._workdir, "client")
+        os.makedirs(self._local)
+        os.makedirs(self._remote)
+        self._connections = Connections()
+        self._port = free_port()
+        self._server = ListenServer(self._connections, "127.0.0.1", self._port)
+        self._execute = Execute(connections=self._connections)
+        self._client: (subprocess.Popen | None) = None
+        self._target: (socket.socket | None) = None
+
+    def _spawn_client(self, *args: str, pass_fds: tuple = ()) -> None:
+        self._client = subprocess.Popen([sys.executable, "-c", CLIENT_BOOTSTRAP, CLIENT_DIR, self._remote, *args],
+                                        pass_fds=pass_fds, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def start(self) -> None:
+        with self._quiet():
+            threading.Thread(target=self._server.listen, daemon=True).start()
+            deadline = time.monotonic() + CONNECT_TIMEOUT
+            if self._link == "socketpair":
+                local, remote = socket.socketpair()
+                self._spawn_client("fd", str(remote.fileno()), pass_fds=(remote.fileno(),))
+                remote.close()
+                self._server.attach(local, ("socketpair", 0))
+            else:
+                port = self._port
+                if self._link == "shaped":
+                    link = ShapedLink(port, self._rate, self._delay)
+                    link.start()
+                    port = link.port
+                self._spawn_client("tcp", str(port), str(CONNECT_TIMEOUT))
+            while not len(self._connections):
+                if time.monotonic() > deadline or self._client.poll() is not None:
+                    raise ConnectionError("The benchmark client did not connect.")
+                time.sleep(0.01)
+        self._target = self._connections.sessions()[0].sock
+
+    def close(self) -> None:
+        with self._quiet():
+            self._server.close()
+        if self._client is not None:
+            self._client.kill()
+            self._client.wait()
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+    @contextlib.contextmanager
+    def _quiet(self):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+    def _run(self, operation: Callable[..., Any], *args: Any) -> Any:
+        with self._quiet():
+            return self._server.submit(self._target, operation, *args).result()
+
+    def _timed(self, operation: Callable[..., Any], *args: Any) -> float:
+        started = time.perf_counter()
+        self._run(operation, *args)
+        return time.perf_counter() - started
+
+    def command_rtt(self, command: str, rounds: int) -> dict[str, Any]:
+        self._run(self._execute.excute_on_target_pc, command, False)
+        samples = [self._timed(self._execute.excute_on_target_pc, command, False) * 1000 for _ in range(rounds)]
+        return summarize(samples, "ms", "lower")
+
+    def _make_file(self, size: int) -> str:
+        path = os.path.join(self._local, f"source_{size}.bin")
+        with open(path, "wb") as file:
+            for offset in range(0, size, 1024 * 1024):
+                file.write(os.urandom(min(1024 * 1024, size - offset)))
+        return path
+
+    def file_throughput(self, size: int, repeat: int) -> dict[str, dict[str, Any]]:
+        path = self._make_file(size)
+        remote = f"./bench_{size}.bin"
+        uploads, downloads = [], []
+        for attempt in range(repeat):
+            uploads.append(size / self._timed(self._execute.upload, path, remote, self._compression, self._digest, False, None, True))
+            local = os.path.join(self._local, f"download_{size}_{attempt}.bin")
+            downloads.append(size / self._timed(self._execute.download, remote, local, self._compression, self._digest))
+            os.remove(local)
+        os.remove(path)
+        return {
+            "upload": summarize([rate / 1024 ** 2 for rate in uploads], "MiB/s", "higher"),
+            "download": summarize([rate / 1024 ** 2 for rate in downloads], "MiB/s", "higher"),
+        }
+
+    def _make_tree(self, files: int, file_size: int) -> str:
+        root = os.path.join(self._local, "tree")
+        for index in range(files):
+            directory = os.path.join(root, f"d{index // FILES_PER_DIRECTORY:04}")
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"f{index:06}.bin"), "wb") as file:
+                file.write(os.urandom(file_size))
+        return root
+
+    def tree_throughput(self, files: int, file_size: int, repeat: int) -> dict[str, dict[str, Any]]:
+        root = self._make_tree(files, file_size)
+        uploads, downloads = [], []
+        for attempt in range(repeat):
+            self._run(self._execute.excute_on_target_pc, f"mkdir udir_{attempt}", False)
+            uploads.append(files / self._timed(self._execute.upload_dir, root, f"./udir_{attempt}", self._compression, self._digest))
+            local = os.path.join(self._local, f"ddir_{attempt}")
+            downloads.append(files / self._timed(self._execute.download_dir, f"udir_{attempt}/tree", local, self._compression, self._digest))
+            shutil.rmtree(local)
+        shutil.rmtree(root)
+        return {
+            "udir": summarize(uploads, "files/s", "higher"),
+            "ddir": summarize(downloads, "files/s", "higher"),
+        }
+
+
+def git_revision() -> (str | None):
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict[str, dict[str, Any]], baseline: dict[str, Any], threshold: float) -> int:
+    regressions = 0
+    print(f"\n{'BENCHMARK':<28}  {'BASELINE':>12}  {'CURRENT':>12}  {'CHANGE':>8}")
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None or not old["value"]:
+            continue
+        change = (result["value"] - old["value"]) / old["value"]
+        worse = change < -threshold if result["better"] == "higher" else change > threshold
+        regressions += worse
+        flag = "  REGRESSION" if worse else ""
+        print(f"{name:<28}  {old['value']:>12.3f}  {result['value']:>12.3f}  {change:>+7.1%}{flag}")
+    return regressions
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    bench = Bench(args.link, args.rate * 1024 ** 2 if args.rate else None, args.delay / 1000, args.compression, args.hash)
+    results: dict[str, dict[str, Any]] = {}
+    try:
+        bench.start()
+        results["command_rtt"] = bench.command_rtt("cd .", args.rounds)
+        results["exec_rtt"] = bench.command_rtt("echo bench", max(1, args.rounds // 4))
+        for size in map(parse_size, args.sizes.split(",")):
+            for name, result in bench.file_throughput(size, args.repeat).items():
+                results[f"{name}_{size}"] = result
+        for name, result in bench.tree_throughput(args.tree_files, args.tree_file_size, args.repeat).items():
+            results[f"{name}_{args.tree_files}x{args.tree_file_size}"] = result
+    finally:
+        bench.close()
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "link": args.link,
+            "rate": args.rate,
+            "delay": args.delay,
+            "compression": args.compression,
+            "hash": args.hash,
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Loopback benchmark of the command and transfer paths.")
+    parser.add_argument("--link", choices=("loopback", "socketpair", "shaped"), default="loopback")
+    parser.add_argument("--rate", type=float, help="bandwidth of the shaped link in MiB/s")
+    parser.add_argument("--delay", type=float, default=0.0, help="one-way delay of the shaped link in ms")
+    parser.add_argument("--sizes", default=SIZES, help=f"file sizes for uf/df (default {SIZES})")
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="command round trips to time")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs of every transfer")
+    parser.add_argument("--tree-files", type=int, default=TREE_FILES)
+    parser.add_argument("--tree-file-size", type=parse_size, default=TREE_FILE_SIZE)
+    parser.add_argument("-c", "--compression", help="compression codec, as with 'uf -c'")
+    parser.add_argument("--hash", help="digest algorithm, as with 'uf --hash'")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="relative change reported as a regression")
+    args = parser.parse_args()
+    report = run(args)
+    for name, result in report["results"].items():
+        print(f"{name:<28}  {result['value']:>12.3f} {result['unit']:<8}  (p90 {result['p90']:.3f}, {result['samples']} samples)")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            if compare(report["results"], json.load(file), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import argparse
+import contextlib
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from bench import ROOT, free_port, git_revision, summarize
+from connections import Connections, Session
+from execute import Execute
+from heartbeat import Heartbeat
+from listen_server import ListenServer
+from multiplex import Multiplexer
+
+
+CLIENTS = 1000
+PROCESSES = 4
+ROUNDS = 5
+COMMAND = "uptime"
+FILE_SIZE = 1024 * 1024
+TRANSFERS = 1
+HEARTBEAT = "2,6"
+DEAD = 50
+WORKERS = 64
+POLL_INTERVAL = 0.005
+CONNECT_TIMEOUT = 120.0
+SIMULATED_CLIENTS = os.path.join(ROOT, "tools", "simulated_clients.py")
+
+
+def resident_memory() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def raise_file_limit() -> None:
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def log(message: str) -> None:
+    print(message, file=sys.__stdout__, flush=True)
+
+
+class LoadGenerator:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self._args = args
+        interval, timeout = map(float, args.heartbeat.split(","))
+        self._timeout = timeout
+        self._connections = Connections()
+        self._port = free_port()
+        self._server = ListenServer(self._connections, "127.0.0.1", self._port, workers=args.workers,
+                                    heartbeat=Heartbeat(interval, timeout, min(1.0, interval / 4)), backlog=args.backlog)
+        self._execute = Execute(connections=self._connections)
+        self._processes: list[subprocess.Popen] = []
+        self._downloads = itertools.count()
+
+    def _spawn_fleet(self) -> None:
+        args = self._args
+        for index in range(args.processes):
+            clients = args.clients // args.processes + (index < args.clients % args.processes)
+            command = [sys.executable, SIMULATED_CLIENTS, "--port", str(self._port), "--clients", str(clients), "--index", str(index),
+                       "--latency", str(args.latency), "--jitter", str(args.jitter), "--output-size", str(args.output_size),
+                       "--file-size", str(args.file_size),
+                       "--churn", str(args.churn / args.processes), "--connect-rate", str(args.connect_rate / args.processes)]
+            self._processes.append(subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True))
+
+    def _control(self, index: int, line: str) -> None:
+        self._processes[index].stdin.write(line + "\n")
+        self._processes[index].stdin.flush()
+
+    def connect(self) -> dict[str, Any]:
+        gc.collect()
+        before = resident_memory()
+        threading.Thread(target=self._server.listen, daemon=True).start()
+        started = time.perf_counter()
+        self._spawn_fleet()
+        deadline = started + CONNECT_TIMEOUT
+        first = None
+        while (connected := len(self._connections)) < self._args.clients:
+            if first is None and connected:
+                first = time.perf_counter()
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Only {connected} of {self._args.clients} simulated clients connected.")
+            time.sleep(POLL_INTERVAL)
+        finished = time.perf_counter()
+        while sum(session.hostname is not None for session in self._connections.sessions()) < self._args.clients:
+            time.sleep(POLL_INTERVAL)
+        gc.collect()
+        memory = resident_memory() - before
+        return {
+            "connect_time": {"value": finished - started, "unit": "s", "better": "lower"},
+            "accept_rate": {"value": self._args.clients / max(finished - (first or started), 1e-9), "unit": "sessions/s", "better": "higher"},
+            "memory_per_session": {"value": memory / self._args.clients, "unit": "B", "better": "lower"},
+        }
+
+    def _timed_command(self, target: Multiplexer, submitted: float) -> tuple[float, float]:
+        started = time.perf_counter()
+        self._execute.excute_on_target_pc(target, self._args.command, False)
+        return started - submitted, time.perf_counter() - submitted
+
+    def _timed_upload(self, target: Multiplexer, path: str, data: bytes, submitted: float) -> tuple[float, float]:
+        started = time.perf_counter()
+        self._execute.upload(target, path, "simulated/upload.bin", shared=data, quiet=True)
+        return started - submitted, time.perf_counter() - submitted
+
+    def _timed_download(self, target: Multiplexer, directory: str, submitted: float) -> tuple[float, float]:
+        started = time.perf_counter()
+        save_as = os.path.join(directory, f"download-{next(self._downloads)}.bin")
+        try:
+            self._execute.download(target, "simulated/download.bin", save_as)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(save_as)
+        return started - submitted, time.perf_counter() - submitted
+
+    def _run_rounds(self, rounds: int, operation: Callable[..., tuple[float, float]], *args: Any) -> tuple[list[float], list[float], int]:
+        queued, latencies, errors = [], [], 0
+        for _ in range(rounds):
+            futures: list[Future] = []
+            for session in self._connections.sessions():
+                try:
+                    futures.append(self._server.submit(session.sock, operation, *args, time.perf_counter()))
+                except Exception:
+                    errors += 1
+            for future in futures:
+                try:
+                    waited, elapsed = future.result()
+                except Exception:
+                    errors += 1
+                    continue
+                queued.append(waited * 1000)
+                latencies.append(elapsed * 1000)
+        return queued, latencies, errors
+
+    def dispatch(self) -> dict[str, Any]:
+        if self._args.churn:
+            for index in range(len(self._processes)):
+                self._control(index, "churn")
+        queued, latencies, errors = self._run_rounds(self._args.rounds, self._timed_command)
+        if not latencies:
+            raise RuntimeError("No command completed.")
+        return {
+            "dispatch_latency": summarize(latencies, "ms", "lower"),
+            "queue_latency": summarize(queued, "ms", "lower"),
+            "dispatch_errors": {"value": errors, "unit": "commands", "better": "lower"},
+        }
+
+    def transfer(self) -> dict[str, Any]:
+        results: dict[str, Any] = {}
+        errors = 0
+        with tempfile.TemporaryDirectory(prefix="loadgen-") as directory:
+            data = random.randbytes(self._args.file_size)
+            path = os.path.join(directory, "upload.bin")
+            with open(path, "wb") as file:
+                file.write(data)
+            for name, operation, args in (("upload", self._timed_upload, (path, data)), ("download", self._timed_download, (directory,))):
+                started = time.perf_counter()
+                _, latencies, failed = self._run_rounds(self._args.transfers, operation, *args)
+                elapsed = time.perf_counter() - started
+                errors += failed
+                if latencies:
+                    results[f"{name}_latency"] = summarize(latencies, "ms", "lower")
+                    results[f"{name}_throughput"] = {"value": len(latencies) * self._args.file_size / elapsed, "unit": "B/s", "better": "higher"}
+        results["transfer_errors"] = {"value": errors, "unit": "transfers", "better": "lower"}
+        return results
+
+    def _freeze(self, sessions: list[Session]) -> None:
+        names: dict[int, list[str]] = {}
+        for session in sessions:
+            index = int(session.hostname.split("-")[1])
+            names.setdefault(index, []).append(session.hostname)
+        for index, hostnames in names.items():
+            self._control(index, "freeze " + " ".join(hostnames))
+
+    def detect_dead(self) -> dict[str, Any]:
+        candidates = [session for session in self._connections.sessions() if (session.hostname or "").startswith("sim-")]
+        victims = random.sample(candidates, min(self._args.dead, len(candidates)))
+        if not victims:
+            return {}
+        self._freeze(victims)
+        started = time.perf_counter()
+        pending, detected = set(victims), []
+        deadline = started + self._timeout * 2 + 10
+        while pending and time.perf_counter() < deadline:
+            for session in list(pending):
+                if self._connections.get_session_by_socket(session.sock) is not session:
+                    detected.append(time.perf_counter() - started)
+                    pending.discard(session)
+            time.sleep(POLL_INTERVAL)
+        results = {"undetected_dead": {"value": len(pending), "unit": "sessions", "better": "lower"}}
+        if detected:
+            results["dead_detection"] = summarize(detected, "s", "lower")
+        return results
+
+    def close(self) -> list[dict[str, Any]]:
+        fleet = []
+        for process in self._processes:
+            try:
+                output, _ = process.communicate(timeout=10)
+                fleet.extend(json.loads(line) for line in output.splitlines() if line.startswith("{"))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self._server.close()
+        return fleet
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    generator = LoadGenerator(args)
+    results: dict[str, Any] = {}
+    fleet: list[dict[str, Any]] = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        try:
+            log(f"Connecting {args.clients} simulated clients from {args.processes} process(es) .. .. ..")
+            results.update(generator.connect())
+            log(f"Dispatching '{args.command}' to every session, {args.rounds} round(s) .. .. ..")
+            results.update(generator.dispatch())
+            if args.transfers:
+                log(f"Uploading and downloading {args.file_size} bytes with every session, {args.transfers} round(s) .. .. ..")
+                results.update(generator.transfer())
+            log(f"Freezing {args.dead} session(s) and waiting for the heartbeat to evict them .. .. ..")
+            results.update(generator.detect_dead())
+        finally:
+            fleet = generator.close()
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "clients": args.clients,
+            "processes": args.processes,
+            "workers": args.workers,
+            "command": args.command,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "output_size": args.output_size,
+            "file_size": args.file_size,
+            "transfers": args.transfers,
+            "churn": args.churn,
+            "heartbeat": args.heartbeat,
+            "fleet": fleet,
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load a local server with a fleet of simulated clients.")
+    parser.add_argument("-n", "--clients", type=int, default=CLIENTS)
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="processes the simulated clients are spread over")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker threads of the server")
+    parser.add_argument("--backlog", type=int, default=1024, help="listen backlog of the server")
+    parser.add_argument("--command", default=COMMAND, help="command sent to every session")
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="times the command is sent to every session")
+    parser.add_argument("--latency", type=float, default=0.0, help="time a simulated client takes to run a command, in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random variation of the command latency, in ms")
+    parser.add_argument("--output-size", type=int, default=64, help="bytes of output of every command")
+    parser.add_argument("--file-size", type=int, default=FILE_SIZE, help="bytes of every file uploaded to and downloaded from a session")
+    parser.add_argument("--transfers", type=int, default=TRANSFERS, help="times a file is uploaded to and downloaded from every session, 0 to skip")
+    parser.add_argument("--churn", type=float, default=0.0, help="disconnects and reconnects per second during the rounds")
+    parser.add_argument("--connect-rate", type=float, default=0.0, help="new connections per second, 0 for as fast as possible")
+    parser.add_argument("--heartbeat", default=HEARTBEAT, help=f"heartbeat interval and session timeout in seconds (default {HEARTBEAT})")
+    parser.add_argument("--dead", type=int, default=DEAD, help="sessions that stop answering, to time dead-session detection")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+    if args.clients < 1 or args.processes < 1:
+        parser.error("--clients and --processes must be at least 1.")
+    raise_file_limit()
+    report = run(args)
+    for name, result in report["results"].items():
+        extra = f"  (p50 {result['value']:.3f}, p90 {result['p90']:.3f}, p99 {result['p99']:.3f})" if "p90" in result else ""
+        print(f"{name:<20}  {result['value']:>14.3f} {result['unit']:<10}{extra}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
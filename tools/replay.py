@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from bench import free_port
+from archive import DIRECTORY, ENTRY_HEADER, Entry, local_path, restore_metadata, unpack_entry
+from connections import Connections, Session
+from exceptions import ProtocolError
+from execute import Execute
+from listen_server import ListenServer
+from protocol import Flag, FrameType, pack_frame, recv_frame
+from recorder import INCOMING, OUTGOING, Record, open_recording
+from tuning import format_size, tune_socket
+
+
+TIMEOUT = 10.0
+POLL_INTERVAL = 0.01
+MISMATCHES_SHOWN = 20
+PREVIEW_SIZE = 60
+CONTROL = (FrameType.PING, FrameType.PONG, FrameType.HELLO, FrameType.RETRY)
+READABLE = (FrameType.COMMAND, FrameType.TEXT, FrameType.JSON, FrameType.HELLO, FrameType.RETRY)
+
+
+def frame_name(frame_type: int) -> str:
+    try:
+        return FrameType(frame_type).name
+    except ValueError:
+        return str(frame_type)
+
+
+def padded(record: Record) -> bytes:
+    return record.payload + bytes(record.length - len(record.payload))
+
+
+def rebuild_directory(data: bytes, root: str) -> str:
+    top: (str | None) = None
+    directories: list[tuple[str, Entry]] = []
+    offset = 0
+    try:
+        while offset + ENTRY_HEADER.size <= len(data):
+            header_size = ENTRY_HEADER.unpack_from(data, offset)[0]
+            offset += ENTRY_HEADER.size
+            if not header_size:
+                break
+            entry = unpack_entry(data[offset: offset + header_size])
+            offset += header_size
+            path = local_path(root, entry.path)
+            top = top or path
+            if entry.type == DIRECTORY:
+                os.makedirs(path, exist_ok=True)
+                directories.append((path, entry))
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(data[offset: offset + entry.size].ljust(entry.size, b"\0"))
+            restore_metadata(path, entry)
+            offset += entry.size
+    except ProtocolError:
+        pass
+    for path, entry in reversed(directories):
+        restore_metadata(path, entry)
+    top = top or os.path.join(root, "directory")
+    os.makedirs(top, exist_ok=True)
+    return top
+
+
+def dump(path: str) -> None:
+    meta, records = open_recording(path)
+    print(json.dumps(meta))
+    for record in records:
+        arrow = "<-" if record.direction == INCOMING else "->"
+        preview = ""
+        if record.type in READABLE:
+            preview = repr(record.payload[:PREVIEW_SIZE].decode("utf-8", "replace"))
+        truncated = "" if len(record.payload) == record.length else f" (kept {len(record.payload)})"
+        print(f"{record.time:>12.6f}  {arrow}  {frame_name(record.type):<11}  {int(record.flags):>2}  {record.request_id:>5}  "
+              f"{record.length:>10}{truncated}  {preview}")
+
+
+class Operator:
+    def __init__(self, records: list[Record], directory: str, timeout: float) -> None:
+        self._records = records
+        self._directory = directory
+        self._timeout = timeout
+        self._connections = Connections()
+        self._port = free_port()
+        self._server = ListenServer(self._connections, "127.0.0.1", self._port, chunck_store_directory=os.path.join(directory, "chunck_store"))
+        self._execute = Execute(self._server.output_limit, self._connections, self._server.chunck_store)
+        self._session: (Session | None) = None
+        self._futures: list[tuple[str, Future]] = []
+        self._names = itertools.count()
+        self.errors: list[str] = []
+
+    def connect(self) -> socket.socket:
+        threading.Thread(target=self._server.listen, daemon=True).start()
+        deadline = time.perf_counter() + self._timeout
+        while True:
+            try:
+                sock = socket.create_connection(("127.0.0.1", self._port))
+                break
+            except ConnectionRefusedError:
+                if time.perf_counter() > deadline:
+                    raise
+                time.sleep(POLL_INTERVAL)
+        while not (sessions := self._connections.sessions()):
+            if time.perf_counter() > deadline:
+                raise TimeoutError("The live server did not register the connection.")
+            time.sleep(POLL_INTERVAL)
+        self._session = sessions[0]
+        tune_socket(sock)
+        return sock
+
+    def _sent(self, command: Record, frame_type: FrameType) -> list[Record]:
+        return [record for record in self._records if record.direction == OUTGOING and record.type == frame_type
+                and record.request_id == command.request_id and record.time >= command.time]
+
+    def _first(self, command: Record, frame_type: FrameType) -> bytes:
+        frames = self._sent(command, frame_type)
+        if not frames:
+            raise ProtocolError(f"The recording has no {frame_type.name} frame for the request {command.request_id}.")
+        return padded(frames[0])
+
+    def _recorded_data(self, command: Record) -> bytes:
+        return b"".join(padded(record) for record in self._sent(command, FrameType.DATA))
+
+    def _path(self, name: str) -> str:
+        name = re.split(r"[\\/]", name)[-1] or "file"
+        return os.path.join(self._directory, f"{next(self._names)}-{name}")
+
+    def _upload(self, command: Record, compression: (str | None), digest: (str | None), delta: bool) -> tuple:
+        data_size, file_name, destination_list, _ = json.loads(self._first(command, FrameType.JSON))
+        data = self._recorded_data(command) if compression is None and not delta else b""
+        path = self._path(file_name)
+        with open(path, "wb") as file:
+            file.write(data[:data_size].ljust(data_size, b"\0"))
+        return self._execute.upload, path, "/".join([*destination_list, file_name]), compression, digest, delta, None, True
+
+    def _download(self, command: Record, compression: (str | None), digest: (str | None), delta: bool, dedup: bool) -> tuple:
+        remote_path = self._first(command, FrameType.TEXT).decode("utf-8", "replace")
+        return self._execute.download, remote_path, self._path(remote_path), compression, digest, delta, dedup
+
+    def _upload_dir(self, command: Record, compression: (str | None), digest: (str | None)) -> tuple:
+        destination = "/".join(json.loads(self._first(command, FrameType.JSON)))
+        data = self._recorded_data(command) if compression is None else b""
+        return self._execute.upload_dir, rebuild_directory(data, self._path("directory")), destination, compression, digest
+
+    def _download_dir(self, command: Record, compression: (str | None), digest: (str | None), dedup: bool) -> tuple:
+        origin_path = "/".join(json.loads(self._first(command, FrameType.JSON)))
+        destination = self._path("directory")
+        os.makedirs(destination)
+        return self._execute.download_dir, origin_path, destination, compression, digest, dedup
+
+    def _get_option(self, options: list[str], option: str) -> (str | None):
+        if option not in options[:-1]:
+            return None
+        return options[options.index(option) + 1]
+
+    def _operation(self, command: Record, text: str) -> tuple:
+        cli, *options = text.split() or [""]
+        compression, digest = self._get_option(options, "-c"), self._get_option(options, "--hash")
+        delta, dedup = "--delta" in options, "--dedup" in options
+        match cli:
+            case "upload":
+                return self._upload(command, compression, digest, delta)
+            case "download":
+                return self._download(command, compression, digest, delta, dedup)
+            case "download_dir":
+                return self._upload_dir(command, compression, digest)
+            case "upload_dir":
+                return self._download_dir(command, compression, digest, dedup)
+            case _:
+                return self._execute.excute_on_target_pc, text, False
+
+    def submit(self, command: Record) -> None:
+        text = padded(command).decode("utf-8", "replace")
+        try:
+            operation, *args = self._operation(command, text)
+            future = self._server.submit(self._session.sock, operation, *args)
+        except Exception as ex:
+            self.errors.append(f"'{text}' could not be replayed --> {ex}")
+            return
+        self._futures.append((text, future))
+
+    def close(self) -> None:
+        for text, future in self._futures:
+            try:
+                future.result(self._timeout)
+            except Exception as ex:
+                self.errors.append(f"'{text}' failed on the live server --> {ex}")
+        self._server.close()
+
+
+class Replay:
+    def __init__(self, sock: socket.socket, records: list[Record], sent_direction: int, speed: float, timeout: float,
+                 operator: (Callable[[Record], None] | None) = None) -> None:
+        self._sock = sock
+        self._speed = speed
+        self._timeout = timeout
+        self._sent_direction = sent_direction
+        self._operator = operator
+        records = [record for record in records if record.type not in CONTROL]
+        self._outgoing: list[tuple[int, Record]] = []
+        self._expected: list[Record] = []
+        for record in records:
+            if record.direction == sent_direction:
+                self._outgoing.append((len(self._expected), record))
+                continue
+            if operator is not None and record.type == FrameType.COMMAND:
+                self._outgoing.append((len(self._expected), record))
+            self._expected.append(record)
+        self._received: list[tuple[FrameType, int, int, float]] = []
+        self._arrived = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._request_ids: dict[int, int] = {}
+        self._closed = False
+        self.stalls = 0
+        self.mismatches: list[str] = []
+        self.operations = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def _send(self, packet: bytes) -> None:
+        with self._send_lock:
+            self._sock.sendall(packet)
+
+    def _receive(self) -> None:
+        try:
+            while True:
+                frame = recv_frame(self._sock)
+                if frame.type == FrameType.PING:
+                    self._send(pack_frame(FrameType.PONG, frame.payload))
+                    continue
+                if frame.type in CONTROL:
+                    continue
+                with self._arrived:
+                    index = len(self._received)
+                    if index < len(self._expected):
+                        self._request_ids.setdefault(self._expected[index].request_id, frame.request_id)
+                    self._received.append((frame.type, frame.request_id, len(frame.payload), time.perf_counter()))
+                    self.bytes_received += len(frame.payload)
+                    self._arrived.notify_all()
+        except (OSError, EOFError):
+            pass
+        finally:
+            with self._arrived:
+                self._closed = True
+                self._arrived.notify_all()
+
+    def _wait_for(self, count: int) -> bool:
+        deadline = time.perf_counter() + self._timeout
+        with self._arrived:
+            while len(self._received) < count and not self._closed:
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    return False
+                self._arrived.wait(left)
+            return len(self._received) >= count
+
+    def _compare(self) -> None:
+        for index, (expected, (frame_type, request_id, length, _)) in enumerate(zip(self._expected, self._received)):
+            live = (frame_name(frame_type), request_id, length)
+            recorded = (frame_name(expected.type), self._request_ids.get(expected.request_id, expected.request_id), expected.length)
+            if live != recorded:
+                self.mismatches.append(f"frame {index}: expected {recorded}, received {live}")
+        if len(self._received) != len(self._expected):
+            self.mismatches.append(f"expected {len(self._expected)} frame(s) from the peer, received {len(self._received)}")
+
+    def run(self) -> dict[str, Any]:
+        receiver = threading.Thread(target=self._receive, daemon=True)
+        receiver.start()
+        started = time.perf_counter()
+        anchor, anchor_time = started, 0.0
+        for awaited, record in self._outgoing:
+            if awaited and len(self._received) < awaited:
+                if not self._wait_for(awaited):
+                    self.stalls += 1
+                if len(self._received) >= awaited:
+                    anchor, anchor_time = self._received[awaited - 1][3], self._expected[awaited - 1].time
+            if self._speed:
+                delay = anchor + (record.time - anchor_time) / self._speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if record.direction != self._sent_direction:
+                self._operator(record)
+                self.operations += 1
+                continue
+            payload = padded(record)
+            request_id = self._request_ids.get(record.request_id, record.request_id)
+            try:
+                self._send(pack_frame(FrameType(record.type), payload, request_id, Flag(record.flags)))
+            except OSError as ex:
+                self.mismatches.append(f"the peer closed the connection --> {ex}")
+                break
+            self.frames_sent += 1
+            self.bytes_sent += len(payload)
+        if not self._wait_for(len(self._expected)):
+            self.stalls += 1
+        elapsed = time.perf_counter() - started
+        try:
+            self._sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        self._sock.close()
+        receiver.join(1.0)
+        self._compare()
+        return {
+            "operations": self.operations,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "frames_received": len(self._received),
+            "bytes_received": self.bytes_received,
+            "elapsed": elapsed,
+            "stalls": self.stalls,
+            "mismatches": len(self.mismatches),
+        }
+
+
+def parse_address(text: str) -> tuple[str, int]:
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def open_socket(address: str) -> socket.socket:
+    with socket.create_server(parse_address(address)) as server:
+        print(f"Waiting for a client on {address} .. .. ..", flush=True)
+        sock, _ = server.accept()
+    tune_socket(sock)
+    return sock
+
+
+def replay_server(records: list[Record], speed: float, timeout: float) -> tuple[Replay, Operator, dict[str, Any]]:
+    with tempfile.TemporaryDirectory(prefix="replay-") as directory, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        operator = Operator(records, directory, timeout)
+        replay = Replay(operator.connect(), records, INCOMING, speed, timeout, operator.submit)
+        try:
+            results = replay.run()
+        finally:
+            operator.close()
+    return replay, operator, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a session recorded by the server against a live client, or against the server of this tree.")
+    parser.add_argument("recording", help="a .rec file written by the 'record' command")
+    parser.add_argument("--dump", action="store_true", help="list the recorded frames and exit")
+    parser.add_argument("--against", choices=("client", "server"), help="the side that is live during the replay")
+    parser.add_argument("--listen", default="127.0.0.1:8080", help="address to wait for the client on, with '--against client'")
+    parser.add_argument("--speed", type=float, default=1.0, help="speed factor of the replay, 0 for as fast as possible")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="seconds to wait for the live side before moving on")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+    if args.dump:
+        dump(args.recording)
+        return
+    if args.against is None:
+        parser.error("Either '--dump' or '--against client|server' is required.")
+    if args.speed < 0:
+        parser.error("--speed must not be negative.")
+    meta, records = open_recording(args.recording)
+    records = list(records)
+    errors: list[str] = []
+    if args.against == "client":
+        replay = Replay(open_socket(args.listen), records, OUTGOING, args.speed, args.timeout)
+        results = replay.run()
+    else:
+        replay, operator, results = replay_server(records, args.speed, args.timeout)
+        errors = operator.errors
+        results["operation_errors"] = len(errors)
+    results["original"] = records[-1].time - records[0].time if records else 0.0
+    for mismatch in replay.mismatches[:MISMATCHES_SHOWN]:
+        print(f"\x1b[31mMismatch, {mismatch}\x1b[0m")
+    if len(replay.mismatches) > MISMATCHES_SHOWN:
+        print(f"\x1b[31m.. and {len(replay.mismatches) - MISMATCHES_SHOWN} more.\x1b[0m")
+    for error in errors[:MISMATCHES_SHOWN]:
+        print(f"\x1b[33m{error}\x1b[0m")
+    print(f"Sent {results['frames_sent']} frame(s), {format_size(results['bytes_sent'])}; "
+          f"received {results['frames_received']} frame(s), {format_size(results['bytes_received'])}.")
+    print(f"Replayed in {results['elapsed']:.3f}s, recorded in {results['original']:.3f}s; "
+          f"{results['stalls']} stall(s), {results['mismatches']} mismatch(es).")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"meta": meta, "results": results}, file, indent=2)
+    sys.exit(1 if replay.mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
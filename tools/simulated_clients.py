@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from functools import cached_property
+from typing import Any, Awaitable, Callable, Coroutine
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "client"))
+
+from archive import ARCHIVE_END, DIRECTORY, ENTRY_HEADER, FILE, Entry, pack_entry, unpack_entry
+from chuncking import build_manifest
+from delta import Signatures, encode_delta, load_signatures, validate_block_size
+from exception import ProtocolError, StreamReset, UnsupportedDigest
+from execute import OUTPUT_CHUNCK_SIZE
+from integrity import Digest
+from multiplex import MAX_DATA_FRAME, WINDOW_SIZE, WINDOW_UPDATE
+from pipeline import SMALL_FILE_SIZE
+from protocol import HEADER, Flag, FrameType, pack_frame, unpack_header
+
+
+PLATFORM = "simulated"
+FILE_SIZE = 1024 * 1024
+DIRECTORY_FILES = 4
+
+
+class SimulatedStream:
+    def __init__(self, writer: asyncio.StreamWriter, request_id: int) -> None:
+        self._writer = writer
+        self.request_id = request_id
+        self._frames: asyncio.Queue[tuple[FrameType, bytes]] = asyncio.Queue()
+        self._consumed = 0
+        self._pending = memoryview(b"")
+
+    def deliver(self, frame_type: FrameType, payload: bytes) -> None:
+        self._frames.put_nowait((frame_type, payload))
+
+    def send(self, frame_type: FrameType, payload: bytes = b"") -> None:
+        self._writer.write(pack_frame(frame_type, payload, self.request_id))
+
+    def send_json(self, data: Any) -> None:
+        self.send(FrameType.JSON, json.dumps(data).encode("utf-8"))
+
+    def _consume(self, size: int) -> None:
+        self._consumed += size
+        if self._consumed >= WINDOW_SIZE // 2:
+            self.send(FrameType.WINDOW, WINDOW_UPDATE.pack(self._consumed))
+            self._consumed = 0
+
+    async def expect(self, *frame_types: FrameType) -> bytes:
+        frame_type, payload = await self._frames.get()
+        if frame_type == FrameType.RESET:
+            raise StreamReset(payload.decode("utf-8", "replace"))
+        if frame_type not in frame_types:
+            expected = ", ".join(frame_type.name for frame_type in frame_types)
+            raise ProtocolError(f"Expected a {expected} frame, but got --> {frame_type.name}.")
+        if frame_type == FrameType.DATA:
+            self._consume(len(payload))
+        return payload
+
+    async def recv_json(self) -> Any:
+        return json.loads(await self.expect(FrameType.JSON))
+
+    async def read(self, limit: int) -> memoryview:
+        while not self._pending:
+            self._pending = memoryview(await self.expect(FrameType.DATA))
+        data, self._pending = self._pending[:limit], self._pending[limit:]
+        return data
+
+    async def recv_data(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            data += await self.read(size - len(data))
+        return bytes(data)
+
+    async def recv_hashed(self, size: int, digest: Digest) -> None:
+        while size > 0:
+            data = await self.read(size)
+            digest.update(data)
+            size -= len(data)
+
+
+class SimulatedClient:
+    def __init__(self, fleet: Fleet, name: str) -> None:
+        self._fleet = fleet
+        self.name = name
+        self.frozen = False
+        self._writer: (asyncio.StreamWriter | None) = None
+        self._credit: dict[int, int] = {}
+        self._credit_changed = asyncio.Condition()
+        self._streams: dict[int, SimulatedStream] = {}
+        self._transfers: dict[str, Callable[[SimulatedStream, list[str]], Awaitable[str]]] = {
+            "upload": self._receive_file,
+            "download": self._send_file,
+            "upload_dir": self._send_directory,
+            "download_dir": self._receive_directory,
+        }
+
+    async def run(self) -> None:
+        try:
+            reader, self._writer = await asyncio.open_connection(self._fleet.host, self._fleet.port)
+        except OSError:
+            self._fleet.failed += 1
+            return
+        hello = {"id": self.name, "hostname": self.name, "platform": PLATFORM}
+        self._writer.write(pack_frame(FrameType.HELLO, json.dumps(hello).encode("utf-8")))
+        try:
+            while not self.frozen:
+                frame_type, flags, request_id, length = unpack_header(await reader.readexactly(HEADER.size))
+                payload = await reader.readexactly(length)
+                if self.frozen:
+                    break
+                await self._dispatch(frame_type, request_id, payload)
+            await asyncio.Event().wait()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writer.close()
+
+    async def _dispatch(self, frame_type: FrameType, request_id: int, payload: bytes) -> None:
+        if frame_type == FrameType.PING:
+            self._writer.write(pack_frame(FrameType.PONG, payload))
+        elif frame_type == FrameType.WINDOW:
+            async with self._credit_changed:
+                if request_id in self._credit:
+                    self._credit[request_id] += WINDOW_UPDATE.unpack(payload)[0]
+                    self._credit_changed.notify_all()
+        elif request_id in self._streams:
+            self._streams[request_id].deliver(frame_type, payload)
+        elif frame_type == FrameType.COMMAND:
+            self._credit[request_id] = WINDOW_SIZE
+            cli, *options = payload.decode("utf-8", "replace").split() or [""]
+            if cli in self._transfers:
+                self._streams[request_id] = SimulatedStream(self._writer, request_id)
+                self._fleet.track(self._transfer(request_id, self._transfers[cli], options))
+            else:
+                self._fleet.track(self._answer(request_id))
+
+    async def _acquire_credit(self, request_id: int, size: int) -> None:
+        async with self._credit_changed:
+            await self._credit_changed.wait_for(lambda: self._credit[request_id] >= size)
+            self._credit[request_id] -= size
+
+    async def _answer(self, request_id: int) -> None:
+        try:
+            await asyncio.sleep(self._fleet.latency())
+            output = self._fleet.output
+            for offset in range(0, len(output), OUTPUT_CHUNCK_SIZE):
+                chunck = output[offset: offset + OUTPUT_CHUNCK_SIZE]
+                await self._acquire_credit(request_id, len(chunck))
+                self._writer.write(pack_frame(FrameType.DATA, chunck, request_id, Flag.NONE))
+                await self._writer.drain()
+            self._writer.write(pack_frame(FrameType.JSON, b"0", request_id))
+            self._writer.write(pack_frame(FrameType.OUTPUT, b"", request_id))
+            await self._writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._credit.pop(request_id, None)
+
+    async def _send_data(self, request_id: int, data: bytes) -> None:
+        view = memoryview(data)
+        for offset in range(0, len(view), MAX_DATA_FRAME):
+            piece = view[offset: offset + MAX_DATA_FRAME]
+            await self._acquire_credit(request_id, len(piece))
+            self._writer.write(pack_frame(FrameType.DATA, piece, request_id))
+            await self._writer.drain()
+
+    def _get_option(self, options: list[str], option: str) -> (str | None):
+        if option not in options[:-1]:
+            return None
+        return options[options.index(option) + 1]
+
+    def _negotiate(self, stream: SimulatedStream, options: list[str]) -> Digest:
+        if self._get_option(options, "-c") is not None:
+            stream.send_json(None)
+        algorithm = self._get_option(options, "--hash")
+        if algorithm is None:
+            return Digest()
+        try:
+            digest = Digest(algorithm)
+        except UnsupportedDigest:
+            stream.send_json(None)
+            return Digest()
+        stream.send_json(digest.algorithm)
+        return digest
+
+    async def _verify_digest(self, stream: SimulatedStream, digest: Digest) -> None:
+        peer_digest = await stream.recv_json()
+        stream.send_json(digest.hexdigest())
+        digest.verify(peer_digest)
+
+    async def _receive_file(self, stream: SimulatedStream, options: list[str]) -> str:
+        digest = self._negotiate(stream, options)
+        data_size, file_name, _, _ = await stream.recv_json()
+        stream.send(FrameType.APPROVED)
+        if "--delta" in options:
+            stream.send_json(None)
+        stream.send_json([0, ""])
+        offset = await stream.recv_json()
+        await stream.recv_hashed(data_size - offset, digest)
+        await self._verify_digest(stream, digest)
+        return f"The file '{file_name}' has been received by {self.name}."
+
+    async def _get_signatures(self, stream: SimulatedStream) -> (tuple[int, Signatures] | None):
+        header = await stream.recv_json()
+        if header is None:
+            return None
+        block_size, signatures_size = header
+        return validate_block_size(block_size), load_signatures(await stream.recv_data(signatures_size))
+
+    async def _send_delta(self, stream: SimulatedStream, data: bytes, block_size: int, signatures: Signatures) -> None:
+        batch = bytearray()
+        for instruction, _, _ in encode_delta(data, block_size, signatures):
+            batch += instruction
+            if len(batch) >= MAX_DATA_FRAME:
+                await self._send_data(stream.request_id, batch)
+                batch = bytearray()
+        await self._send_data(stream.request_id, batch)
+
+    async def _send_deduplicated(self, stream: SimulatedStream, data: bytes) -> None:
+        chuncks, manifest = self._fleet.manifest
+        await self._send_data(stream.request_id, manifest)
+        missing = await stream.recv_data(len(chuncks)) if chuncks else b""
+        batch = bytearray()
+        for (offset, size), is_missing in zip(chuncks, missing):
+            if is_missing:
+                batch += data[offset: offset + size]
+            if len(batch) >= MAX_DATA_FRAME:
+                await self._send_data(stream.request_id, batch)
+                batch = bytearray()
+        if batch:
+            await self._send_data(stream.request_id, batch)
+
+    async def _send_file(self, stream: SimulatedStream, options: list[str]) -> str:
+        digest = self._negotiate(stream, options)
+        path = (await stream.expect(FrameType.TEXT)).decode("utf-8")
+        stream.send(FrameType.APPROVED)
+        data = self._fleet.file
+        stream.send_json([len(data), self._fleet.transfer_id])
+        digest.update(data)
+        signatures = await self._get_signatures(stream) if "--delta" in options else None
+        if "--dedup" in options:
+            await self._send_deduplicated(stream, data)
+        elif signatures is None:
+            await stream.recv_json()
+            stream.send_json(0)
+            await self._send_data(stream.request_id, data)
+        else:
+            await self._send_delta(stream, data, *signatures)
+        await self._verify_digest(stream, digest)
+        return f"File '{os.path.basename(path)}' uploading process completed successfully."
+
+    async def _receive_directory(self, stream: SimulatedStream, options: list[str]) -> str:
+        digest = self._negotiate(stream, options)
+        destination = await stream.recv_json()
+        stream.send(FrameType.APPROVED)
+        entries = 0
+        while True:
+            header = await stream.recv_data(ENTRY_HEADER.size)
+            digest.update(header)
+            header_size = ENTRY_HEADER.unpack(header)[0]
+            if not header_size:
+                break
+            header = await stream.recv_data(header_size)
+            digest.update(header)
+            entry = unpack_entry(header)
+            if entry.type == FILE:
+                await stream.recv_hashed(entry.size, digest)
+            entries += 1
+        await self._verify_digest(stream, digest)
+        return f"The directory has been received by {self.name} in {'/'.join(destination)} ({entries} entries)."
+
+    async def _send_directory(self, stream: SimulatedStream, options: list[str]) -> str:
+        digest = self._negotiate(stream, options)
+        origin = "/".join(await stream.recv_json())
+        stream.send(FrameType.APPROVED)
+        data = self._fleet.file
+        name = os.path.basename(origin) or self.name
+        mtime_ns = time.time_ns()
+        entries = [Entry(name, DIRECTORY, 0, 0o755, mtime_ns)]
+        entries += [Entry(f"{name}/file-{index}", FILE, len(data), 0o644, mtime_ns) for index in range(DIRECTORY_FILES)]
+        for entry in entries:
+            header = pack_entry(entry)
+            digest.update(header)
+            await self._send_data(stream.request_id, header)
+            if entry.type != FILE:
+                continue
+            digest.update(data)
+            if "--dedup" in options and entry.size > SMALL_FILE_SIZE:
+                await self._send_deduplicated(stream, data)
+            else:
+                await self._send_data(stream.request_id, data)
+        digest.update(ARCHIVE_END)
+        await self._send_data(stream.request_id, ARCHIVE_END)
+        await self._verify_digest(stream, digest)
+        return f"The directory '{origin}' has been sent by {self.name} ({len(entries)} entries)."
+
+    async def _transfer(self, request_id: int, transfer: Callable[[SimulatedStream, list[str]], Awaitable[str]], options: list[str]) -> None:
+        try:
+            try:
+                output = await transfer(self._streams[request_id], options)
+            except ConnectionError:
+                raise
+            except Exception as ex:
+                output = f"Unable to transfer due to -> {ex}"
+            self._writer.write(pack_frame(FrameType.OUTPUT, output.encode("utf-8"), request_id))
+            await self._writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._streams.pop(request_id, None)
+            self._credit.pop(request_id, None)
+
+    def disconnect(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+class Fleet:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.host = args.host
+        self.port = args.port
+        self.output = b"x" * args.output_size
+        self.file = random.randbytes(args.file_size)
+        self.transfer_id = f"{PLATFORM}-{args.index}-{args.file_size}"
+        self._index = args.index
+        self._latency = args.latency / 1000
+        self._jitter = args.jitter / 1000
+        self._churn = args.churn
+        self._connect_rate = args.connect_rate
+        self._clients: dict[str, SimulatedClient] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._created = 0
+        self.failed = 0
+
+    @property
+    def created(self) -> int:
+        return self._created
+
+    @cached_property
+    def manifest(self) -> tuple[list[tuple[int, int]], bytes]:
+        return build_manifest(self.file)
+
+    def latency(self) -> float:
+        return max(0.0, self._latency + random.uniform(-self._jitter, self._jitter))
+
+    def track(self, coroutine: Coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _spawn(self) -> None:
+        client = SimulatedClient(self, f"sim-{self._index}-{self._created}")
+        self._created += 1
+        self._clients[client.name] = client
+        self.track(client.run()).add_done_callback(lambda done: self._clients.pop(client.name, None))
+
+    async def start(self, count: int) -> None:
+        for _ in range(count):
+            self._spawn()
+            if self._connect_rate:
+                await asyncio.sleep(1 / self._connect_rate)
+            else:
+                await asyncio.sleep(0)
+
+    async def churn(self) -> None:
+        while self._churn:
+            await asyncio.sleep(random.expovariate(self._churn))
+            candidates = [client for client in self._clients.values() if not client.frozen]
+            if candidates:
+                random.choice(candidates).disconnect()
+                self._spawn()
+
+    def control(self, line: str) -> None:
+        command, *names = line.split()
+        if command == "freeze":
+            for name in names:
+                if name in self._clients:
+                    self._clients[name].frozen = True
+        elif command == "churn":
+            self.track(self.churn())
+
+
+def read_control(loop: asyncio.AbstractEventLoop, fleet: Fleet, done: asyncio.Event) -> None:
+    for line in sys.stdin:
+        if line.strip():
+            loop.call_soon_threadsafe(fleet.control, line)
+    loop.call_soon_threadsafe(done.set)
+
+
+async def main(args: argparse.Namespace) -> None:
+    fleet = Fleet(args)
+    done = asyncio.Event()
+    threading.Thread(target=read_control, args=(asyncio.get_running_loop(), fleet, done), daemon=True).start()
+    await fleet.start(args.clients)
+    await done.wait()
+    print(json.dumps({"index": args.index, "created": fleet.created, "failed": fleet.failed}), flush=True)
+
+
+def raise_file_limit() -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A process of simulated clients, driven by tools/loadgen.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--clients", type=int, required=True)
+    parser.add_argument("--index", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--output-size", type=int, default=0)
+    parser.add_argument("--file-size", type=int, default=FILE_SIZE)
+    parser.add_argument("--churn", type=float, default=0.0)
+    parser.add_argument("--connect-rate", type=float, default=0.0)
+    raise_file_limit()
+    asyncio.run(main(parser.parse_args()))